@@ -1,8 +1,96 @@
 # users/admin.py
 
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db.models.expressions import RawSQL
+from django.utils.functional import cached_property
+
+from . import search_index
 from .models import User
 
+ADMIN_COUNT_LIMIT = getattr(settings, 'ADMIN_COUNT_LIMIT', 1000)  # Filtered changelists count at most this many rows
+CURSOR_VAR = 'cursor'  # Query parameter of the keyset page: show users with an id below it
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts the whole table.
+
+    The unfiltered changelist uses the database's row estimate; a filtered or searched
+    one counts at most `ADMIN_COUNT_LIMIT` matching rows. `approximate` tells whether
+    the count is an estimate or was cut at the limit.
+    """
+    approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = search_index.estimate_row_count(queryset.model)
+            if estimate is not None:
+                self.approximate = True
+                return estimate
+        count = queryset.order_by()[:ADMIN_COUNT_LIMIT].count()
+        self.approximate = count >= ADMIN_COUNT_LIMIT
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList paging by id ("show the users after this one") instead of by offset.
+
+    OFFSET makes the database read and discard every row before the page, so deep
+    pages of a large table get slower and slower; `id < cursor ORDER BY id DESC` reads
+    one index range whatever the depth. Keyset paging applies while the list is in its
+    default newest-first order; sorting by a column falls back to numbered pages.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR, '')
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        if self.cursor.isdigit():
+            queryset = queryset.filter(pk__lt=int(self.cursor))
+        results = list(queryset[:self.list_per_page + 1])
+        if len(results) > self.list_per_page:
+            results = results[:self.list_per_page]
+            self.next_cursor = results[-1].pk
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = results
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = paginator
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     """
@@ -11,3 +99,36 @@ class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'phone', 'last_name', 'email')  # Fields to display in the list view
     search_fields = ('phone', 'first_name', 'last_name', 'email')  # Fields to search by
     list_filter = ()  # No filters added; can be customized later
+    ordering = ('-id',)  # Newest first, the order keyset pages walk
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second, unfiltered COUNT(*) shown next to search results
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search users through indexes instead of `icontains` on every column.
+
+        A run of digits matches phones by prefix, as a range on the unique phone index.
+        Other terms match names and email by word prefix in the FTS5 index when it has
+        been built (`build_user_search_index`), and fall back to `icontains` otherwise.
+
+        Args:
+            request (HttpRequest): The changelist request.
+            queryset (QuerySet): The users to search.
+            search_term (str): The search box contents.
+
+        Returns:
+            tuple: The matching queryset, and whether it may contain duplicates.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        prefix = search_index.phone_prefix(term)
+        if prefix is not None:
+            return queryset.filter(**search_index.phone_prefix_range(prefix)), False
+        expression = search_index.match_expression(term)
+        if expression is not None and search_index.is_available():
+            return queryset.filter(pk__in=RawSQL(search_index.search_ids_sql(), [expression])), False
+        return super().get_search_results(request, queryset, search_term)
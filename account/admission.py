@@ -0,0 +1,312 @@
+# users/admission.py
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of admitted.
+
+    Attributes:
+        reason (str): "queue_full", "overloaded" (the expected wait exceeds the queue
+            timeout) or "timeout".
+        retry_after (int): Seconds the client should wait before retrying.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class EndpointLimit:
+    """
+    Concurrency limit, wait queue and rolling latency of one group of endpoints.
+    """
+
+    def __init__(self, name, concurrency, queue, reserved=False, methods=None):
+        """
+        Args:
+            name (str): The group name, used as the metrics label.
+            concurrency (int): Requests of the group handled at once.
+            queue (int): Requests of the group allowed to wait for a slot.
+            reserved (bool): Whether the group may use the capacity reserved for cheap reads.
+            methods (tuple): HTTP methods the group applies to, None for all.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.reserved = reserved
+        self.methods = tuple(methods) if methods else None
+        self.active = 0
+        self.waiters = deque()
+        self.latency = None  # Rolling seconds per request, None until the first one
+
+    def expected_wait(self, position):
+        """
+        Estimate how long the waiter at a queue position waits for a slot.
+
+        Args:
+            position (int): 1 for the head of the queue.
+
+        Returns:
+            float: Seconds, 0 while no latency has been observed.
+        """
+        return position * (self.latency or 0.0) / self.concurrency
+
+
+class _Waiter:
+    __slots__ = ('admitted', 'event', 'loop', 'future')
+
+    def __init__(self):
+        self.admitted = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdmissionController:
+    """
+    Admits requests per endpoint group, up to each group's concurrency limit and a
+    shared process capacity, so that a slow dependency cannot tie up every worker.
+
+    A request over its group's limit waits in the group's bounded queue, first come
+    first served, for at most `queue_timeout` seconds. It is rejected at once when the
+    queue is full or the wait expected from the group's rolling latency exceeds the
+    timeout, so clients get a fast 503 rather than a slow one. The last `reserved`
+    slots of the capacity are only used by reserved groups, such as the profile read,
+    which keep working while the expensive endpoints are saturated.
+
+    Works for sync and async requests alike; queued async requests do not hold a thread.
+    """
+
+    def __init__(self, limits, capacity=32, reserved=8, queue_timeout=2.0, alpha=0.2):
+        """
+        Args:
+            limits (list): The `EndpointLimit` of each group.
+            capacity (int): Requests of all groups handled at once.
+            reserved (int): Slots of the capacity only reserved groups may use.
+            queue_timeout (float): Seconds a request may wait for a slot.
+            alpha (float): Weight of the newest request in the rolling latency.
+        """
+        self.limits = {limit.name: limit for limit in limits}
+        self.capacity = capacity
+        self.reserved = reserved
+        self.queue_timeout = queue_timeout
+        self.alpha = alpha
+        self.active = 0
+        self._order = sorted(self.limits.values(), key=lambda limit: not limit.reserved)  # Reserved groups first
+        self._lock = threading.Lock()
+
+    def acquire(self, name):
+        """
+        Wait for a slot in a group.
+
+        Args:
+            name (str): The group name.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            AdmissionRejected: If the request is shed.
+        """
+        started = time.perf_counter()
+        limit = self.limits[name]
+        waiter = _Waiter()
+        waiter.event = threading.Event()
+        if self._enqueue(limit, waiter):
+            return 0.0
+        if not waiter.event.wait(self.queue_timeout):
+            self._abandon(limit, waiter)
+        return self._waited(limit, started)
+
+    async def aacquire(self, name):
+        """
+        Async version of `acquire`.
+        """
+        started = time.perf_counter()
+        limit = self.limits[name]
+        waiter = _Waiter()
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        if self._enqueue(limit, waiter):
+            return 0.0
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(limit, waiter)
+        except asyncio.CancelledError:  # The client went away while queued
+            with self._lock:
+                if not waiter.admitted:
+                    limit.waiters.remove(waiter)
+                    raise
+            self.release(name)
+            raise
+        return self._waited(limit, started)
+
+    def release(self, name, seconds=None):
+        """
+        Free a slot and hand it to the next waiting request.
+
+        Args:
+            name (str): The group name.
+            seconds (float): Time the request took, added to the group's rolling latency.
+        """
+        limit = self.limits[name]
+        with self._lock:
+            limit.active -= 1
+            self.active -= 1
+            if seconds is not None:
+                limit.latency = seconds if limit.latency is None else (
+                    self.alpha * seconds + (1 - self.alpha) * limit.latency
+                )
+            self._dispatch()
+
+    def stats(self):
+        """
+        Return each group's active and waiting requests and rolling latency.
+
+        Returns:
+            dict: Per-group statistics and the total of active requests.
+        """
+        with self._lock:
+            return {
+                'active': self.active,
+                'capacity': self.capacity,
+                'groups': {
+                    limit.name: {
+                        'active': limit.active,
+                        'waiting': len(limit.waiters),
+                        'latency_ms': round(limit.latency * 1000, 3) if limit.latency is not None else None,
+                    }
+                    for limit in self.limits.values()
+                },
+            }
+
+    def _can_admit(self, limit):
+        ceiling = self.capacity if limit.reserved else self.capacity - self.reserved
+        return limit.active < limit.concurrency and self.active < ceiling
+
+    def _admit(self, limit):
+        limit.active += 1
+        self.active += 1
+
+    def _enqueue(self, limit, waiter):
+        # Admit at once, queue the waiter, or shed the request
+        with self._lock:
+            if not limit.waiters and self._can_admit(limit):
+                self._admit(limit)
+                return True
+            position = len(limit.waiters) + 1
+            if len(limit.waiters) >= limit.queue:
+                reason = 'queue_full'
+            elif limit.expected_wait(position) > self.queue_timeout:
+                reason = 'overloaded'
+            else:
+                limit.waiters.append(waiter)
+                return False
+            retry_after = self._retry_after(limit, position)
+        metrics.admission_rejected.inc((limit.name, reason))
+        raise AdmissionRejected(reason, retry_after)
+
+    def _abandon(self, limit, waiter):
+        # Timed out, unless a slot was handed over in the meantime
+        with self._lock:
+            if waiter.admitted:
+                return
+            limit.waiters.remove(waiter)
+            retry_after = self._retry_after(limit, len(limit.waiters) + 1)
+        metrics.admission_rejected.inc((limit.name, 'timeout'))
+        raise AdmissionRejected('timeout', retry_after)
+
+    def _dispatch(self):
+        # Under the lock: hand free slots to waiters, reserved groups first
+        for limit in self._order:
+            while limit.waiters and self._can_admit(limit):
+                waiter = limit.waiters.popleft()
+                self._admit(limit)
+                waiter.admitted = True
+                waiter.wake()
+
+    def _waited(self, limit, started):
+        waited = time.perf_counter() - started
+        metrics.admission_wait.observe((limit.name,), waited)
+        return waited
+
+    def _retry_after(self, limit, position):
+        return max(1, math.ceil(limit.expected_wait(position)))
+
+    def _collect(self, attribute):
+        with self._lock:
+            if attribute == 'waiting':
+                return {(limit.name,): len(limit.waiters) for limit in self.limits.values()}
+            return {(limit.name,): limit.active for limit in self.limits.values()}
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    Return the process-wide admission controller, configured from the `ADMISSION_*`
+    settings, with the URL route of each group's endpoints.
+
+    Returns:
+        tuple: The `AdmissionController` and a dict mapping routes to group names, or
+        (None, {}) when admission control is disabled.
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = _build_controller()
+    return _controller
+
+
+def _build_controller():
+    if not getattr(settings, 'ADMISSION_CONTROL_ENABLED', True):
+        return None, {}
+    limits = []
+    routes = {}
+    for name, entry in getattr(settings, 'ADMISSION_LIMITS', {}).items():
+        limits.append(EndpointLimit(
+            name,
+            concurrency=entry['CONCURRENCY'],
+            queue=entry.get('QUEUE', 0),
+            reserved=entry.get('RESERVED', False),
+            methods=entry.get('METHODS'),
+        ))
+        for route in entry['ROUTES']:
+            routes[route] = name
+    if not limits:
+        return None, {}
+    controller = AdmissionController(
+        limits,
+        capacity=getattr(settings, 'ADMISSION_CAPACITY', 32),
+        reserved=getattr(settings, 'ADMISSION_READ_RESERVE', 8),
+        queue_timeout=getattr(settings, 'ADMISSION_QUEUE_TIMEOUT', 2.0),
+    )
+    metrics.admission_active.collect = lambda: controller._collect('active')
+    metrics.admission_waiting.collect = lambda: controller._collect('waiting')
+    return controller, routes
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        from . import signals  # noqa: F401  Connect the user signal handlers
+        from .token_maintenance import start_pruner
+
+        start_pruner()  # Once per process, not from the token-minting path
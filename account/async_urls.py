@@ -0,0 +1,18 @@
+# users/async_urls.py
+
+from django.urls import path
+from .async_views import (
+    check_phone_or_send_otp,
+    verify,
+    refresh_jwt_token,
+    register_user,
+    login
+)
+
+urlpatterns = [
+    path('login/', login),  # Async user login endpoint
+    path('verify/', verify),  # Async OTP verification endpoint
+    path('refresh/', refresh_jwt_token),  # Async JWT refresh endpoint
+    path('register/', register_user),  # Async user registration endpoint
+    path('check-phone/', check_phone_or_send_otp),  # Async check phone number or send OTP
+]
@@ -0,0 +1,259 @@
+# users/async_views.py
+
+import json
+import uuid
+
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .hashing import HashingSaturatedError
+from .login_service import alogin_with_password, server_timing
+from .models import User
+from .otp_store import OtpBlockedError
+from .otp_utils import apending_send, asend_otp_sms, averify_otp
+from .phone_index import phone_index
+from .ratelimit import get_rate_limiter
+from .sms_queue import QueueFullError
+from .utils import aget_tokens_for_user, normalize_phone
+
+
+def _read_json(request):
+    """
+    Parse the JSON body of the request.
+
+    Args:
+        request (HttpRequest): The incoming request.
+
+    Returns:
+        dict: The parsed body, or an empty dict if it is missing or invalid.
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _aauthenticate_jwt(request):
+    """
+    Authenticate the request from its `Authorization: Bearer` access token.
+
+    Args:
+        request (HttpRequest): The incoming request.
+
+    Returns:
+        User: The authenticated user, or None if the token is missing or invalid or
+        the user is inactive.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    return await User.objects.filter(id=user_id, is_active=True).afirst()  # Deleted users are inactive until purged
+
+
+@csrf_exempt
+@require_POST
+async def check_phone_or_send_otp(request):
+    """
+    Async version of `views.check_phone_or_send_otp`.
+
+    Args:
+        request (HttpRequest): The request object containing the phone number.
+
+    Returns:
+        JsonResponse: API response indicating whether the phone exists or OTP was sent.
+    """
+    phone = _read_json(request).get("phone")
+    ip = request.META.get('REMOTE_ADDR')
+
+    if not phone:
+        return JsonResponse({"error": "Phone number is required."}, status=400)
+    phone = normalize_phone(phone)
+    if phone is None:
+        return JsonResponse({"error": "Invalid phone number."}, status=400)
+
+    if await phone_index.aexists(phone):
+        return JsonResponse({"exists": True})
+
+    sent = await apending_send(phone)
+    if sent is None:
+        limit = await get_rate_limiter().ahit('check-phone', phone=phone, ip=ip)
+        if not limit.allowed:
+            response = JsonResponse({"error": "Too many OTP requests. Please try again later."}, status=429)
+            response['Retry-After'] = str(limit.retry_after)
+            return response
+
+        try:
+            sent = await asend_otp_sms(phone)
+        except OtpBlockedError as e:
+            response = JsonResponse({"error": "Too many wrong OTP attempts. You are blocked."}, status=403)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        except QueueFullError:
+            return JsonResponse({"error": "SMS service is busy. Please try again later."}, status=503)
+
+    return JsonResponse({
+        "exists": False,
+        "message": "OTP already sent." if sent["reused"] else "OTP sent successfully.",
+        "resend_in": sent["resend_in"],
+    })
+
+
+@csrf_exempt
+@require_POST
+async def verify(request):
+    """
+    Async version of `views.verify`.
+
+    Args:
+        request (HttpRequest): The request object containing the phone number and OTP.
+
+    Returns:
+        JsonResponse: API response indicating whether OTP verification was successful.
+    """
+    data = _read_json(request)
+    phone = data.get("phone")
+    code = data.get("code")
+
+    if not phone or not code:
+        return JsonResponse({"error": "Phone number and code are required."}, status=400)
+    phone = normalize_phone(phone)
+    if phone is None:
+        return JsonResponse({"error": "Invalid phone number."}, status=400)
+
+    result, status_code = await averify_otp(phone, code)
+    if not result["success"]:
+        if "retry_after" in result:
+            response = JsonResponse({"error": "Too many attempts. You are blocked."}, status=status_code)
+            response['Retry-After'] = str(result["retry_after"])
+            return response
+        return JsonResponse({"error": "Incorrect OTP."}, status=status_code)
+
+    reg_token = uuid.uuid4().hex
+    await cache.aset(f"reg_token:{reg_token}", phone, timeout=10 * 60)
+
+    return JsonResponse({
+        "message": "Phone verified.",
+        "registration_token": reg_token
+    }, status=200)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """
+    Async version of `views.login`.
+
+    Args:
+        request (HttpRequest): The request object containing the phone number and password.
+
+    Returns:
+        JsonResponse: API response indicating login success or failure.
+    """
+    data = _read_json(request)
+    phone = data.get("phone")
+    password = data.get("password")
+    ip = request.META.get('REMOTE_ADDR')
+
+    if not phone or not password:
+        return JsonResponse({"error": "Phone number and password are required."}, status=400)
+    phone = normalize_phone(phone)
+    if phone is None:
+        return JsonResponse({"error": "Invalid phone number."}, status=400)
+
+    result = await alogin_with_password(phone, password, ip)
+    response = JsonResponse(result.body, status=result.status)
+    response['Server-Timing'] = server_timing(result.timings)
+    if result.retry_after:
+        response['Retry-After'] = str(result.retry_after)
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def register_user(request):
+    """
+    Async version of `views.register_user`.
+
+    Args:
+        request (HttpRequest): The request object containing registration token and user data.
+
+    Returns:
+        JsonResponse: API response indicating registration success or failure.
+    """
+    data = _read_json(request)
+    reg_token = data.get("registration_token")
+    password = data.get("password")
+
+    phone = normalize_phone(await cache.aget(f"reg_token:{reg_token}"))
+    if not phone:
+        return JsonResponse({"error": "Invalid or expired registration token."}, status=403)
+
+    if await User.objects.filter(phone=phone).aexists():
+        return JsonResponse({"error": "User already exists."}, status=400)
+
+    if not password:
+        return JsonResponse({"error": "Password is required."}, status=400)
+
+    try:
+        user = await User.objects.acreate_user(
+            phone=phone,
+            password=password,
+            first_name=data.get("first_name", ""),
+            last_name=data.get("last_name", ""),
+            email=data.get("email", ""),
+        )
+    except (HashingSaturatedError, TimeoutError):
+        response = JsonResponse({"error": "Server is busy. Please try again later."}, status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    await cache.adelete(f"reg_token:{reg_token}")
+
+    tokens = await aget_tokens_for_user(user)
+    return JsonResponse({
+        "message": "User registered successfully!",
+        "tokens": tokens
+    }, status=201)
+
+
+@csrf_exempt
+@require_POST
+async def refresh_jwt_token(request):
+    """
+    Async version of `views.refresh_jwt_token`.
+
+    Args:
+        request (HttpRequest): The request object containing the refresh token.
+
+    Returns:
+        JsonResponse: API response with the new access token.
+    """
+    if await _aauthenticate_jwt(request) is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+    refresh_token = _read_json(request).get("refresh")
+    if not refresh_token:
+        return JsonResponse({"error": "Refresh token is required."}, status=400)
+
+    try:
+        refresh = RefreshToken(refresh_token)
+        access_token = str(refresh.access_token)
+        return JsonResponse({"access": access_token})
+    except TokenError as e:
+        return JsonResponse({"error": str(e)}, status=400)
@@ -0,0 +1,88 @@
+# users/authentication.py
+
+from datetime import datetime, timezone
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import timed
+from .utils import PROFILE_CLAIM, VERSION_CLAIM, cache_user_version, get_cached_user_version, snapshot_auth_enabled
+
+SNAPSHOT_AUTH = snapshot_auth_enabled()  # Whether current snapshots skip the database
+
+
+class SnapshotUser:
+    """
+    Lightweight authenticated user built from the profile snapshot in an access token.
+
+    It carries only the fields read endpoints need and is never saved.
+    """
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, user_id, version, profile):
+        """
+        Args:
+            user_id (int): The user's primary key.
+            version (int): The user version the snapshot was taken at.
+            profile (dict): The snapshot claim from the token.
+        """
+        self.id = self.pk = user_id
+        self.version = version
+        self.phone = profile.get('ph', '')
+        self.first_name = profile.get('fn', '')
+        self.last_name = profile.get('ln', '')
+        self.email = profile.get('em', '')
+        updated_at = profile.get('up')
+        self.updated_at = datetime.fromtimestamp(updated_at, tz=timezone.utc) if updated_at else None
+
+    def __str__(self):
+        return self.phone
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the token's profile snapshot
+    instead of loading the `User` row.
+
+    The snapshot is trusted only while its version matches the user's cached version,
+    which `bump_user_version` increments on every profile change or deletion. On a
+    mismatch or cache miss the user is loaded from the database as usual. The version
+    must come from a cache shared by all workers, so with a process-local cache (see
+    `snapshot_auth_enabled`) every request loads the user.
+    """
+
+    def get_validated_token(self, raw_token):
+        """
+        Validate the raw token, timed under the "jwt" stage.
+        """
+        with timed('jwt'):
+            return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        """
+        Return a `SnapshotUser` for a current snapshot, otherwise the `User` from the database.
+
+        Args:
+            validated_token (Token): The validated access token.
+
+        Returns:
+            SnapshotUser or User: The authenticated user.
+        """
+        profile = validated_token.get(PROFILE_CLAIM)
+        version = validated_token.get(VERSION_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if profile is None or version is None or user_id is None or not SNAPSHOT_AUTH:
+            return super().get_user(validated_token)
+
+        current = get_cached_user_version(user_id)
+        if current == version:
+            return SnapshotUser(user_id, version, profile)
+
+        user = super().get_user(validated_token)  # Raises AuthenticationFailed for deleted users
+        if current is None:
+            cache_user_version(user.pk, user.version)
+        return user
@@ -0,0 +1,531 @@
+# users/cache_backends.py
+
+import json
+import logging
+import math
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .metrics import timed
+from .redis_client import get_redis
+from .shm_store import KEEP, default_path, get_shared_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Cache backend that records the time of every operation under the "cache" stage
+    and delegates to a wrapped backend.
+
+    Configure the wrapped backend through OPTIONS:
+
+        CACHES = {
+            "default": {
+                "BACKEND": "account.cache_backends.InstrumentedCache",
+                "LOCATION": "unique-dev-cache",
+                "OPTIONS": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            }
+        }
+
+    LOCATION, TIMEOUT, KEY_PREFIX, VERSION and the remaining OPTIONS are passed on to the
+    wrapped backend, which applies them.
+    """
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('BACKEND', DEFAULT_BACKEND)
+        params['OPTIONS'] = options
+        super().__init__(params)
+        self._cache = import_string(backend)(location, params)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.add(key, value, timeout, version)
+
+    def get(self, key, default=None, version=None):
+        with timed('cache'):
+            return self._cache.get(key, default, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.set(key, value, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        with timed('cache'):
+            return self._cache.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        with timed('cache'):
+            return self._cache.get_many(keys, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return self._cache.set_many(data, timeout, version)
+
+    def delete_many(self, keys, version=None):
+        with timed('cache'):
+            return self._cache.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        with timed('cache'):
+            return self._cache.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        with timed('cache'):
+            return self._cache.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        with timed('cache'):
+            return self._cache.decr(key, delta, version)
+
+    def clear(self):
+        return self._cache.clear()
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
+
+    # Async operations use the wrapped backend's own async implementation
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return await self._cache.aadd(key, value, timeout, version)
+
+    async def aget(self, key, default=None, version=None):
+        with timed('cache'):
+            return await self._cache.aget(key, default, version)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return await self._cache.aset(key, value, timeout, version)
+
+    async def adelete(self, key, version=None):
+        with timed('cache'):
+            return await self._cache.adelete(key, version)
+
+    async def aget_many(self, keys, version=None):
+        with timed('cache'):
+            return await self._cache.aget_many(keys, version)
+
+    async def aset_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with timed('cache'):
+            return await self._cache.aset_many(data, timeout, version)
+
+    async def adelete_many(self, keys, version=None):
+        with timed('cache'):
+            return await self._cache.adelete_many(keys, version)
+
+
+_MISSING = object()  # L1 marker for keys known to be absent from L2
+
+
+class _LocalTier:
+    """
+    Bounded in-process LRU of pickled values with a per-entry expiry.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (key, version) -> (pickled value or _MISSING, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the pickled value, `_MISSING` for a cached miss, or None when not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _RedisInvalidator:
+    """
+    Broadcasts written keys over Redis pub/sub and evicts keys written by other
+    processes from the local tier.
+    """
+
+    def __init__(self, local, url, channel):
+        self.local = local
+        self.client = get_redis(url)
+        self.channel = channel
+        self.node = uuid.uuid4().hex  # Our own messages are skipped
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                threading.Thread(target=self._listen, name='cache-invalidator', daemon=True).start()
+                self._started = True
+
+    def publish(self, keys):
+        """
+        Tell the other processes to drop the given (key, version) pairs, or everything if `keys` is None.
+        """
+        message = {'node': self.node, 'keys': None if keys is None else [list(key) for key in keys]}
+        try:
+            self.client.publish(self.channel, json.dumps(message))
+        except Exception:
+            logger.warning("Could not publish cache invalidation", exc_info=True)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.local.clear()  # Messages may have been missed while disconnected
+                for message in pubsub.listen():
+                    self._handle(message)
+            except Exception:
+                logger.warning("Cache invalidation listener disconnected, reconnecting", exc_info=True)
+                time.sleep(1.0)
+
+    def _handle(self, message):
+        if message.get('type') != 'message':
+            return
+        data = json.loads(message['data'])
+        if data['node'] == self.node:
+            return
+        if data['keys'] is None:
+            self.local.clear()
+            return
+        for key, version in data['keys']:
+            self.local.delete((key, version))
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a small bounded LRU in each process (L1) in front of a shared
+    cache alias (L2), for hot keys that are read far more often than written.
+
+    Reads are answered from L1 when possible, including misses (negative caching),
+    so repeated checks of keys that are almost never set stop reaching L2. Writes go
+    to L2 and update the local L1. Other processes see a write after at most `L1_TTL`
+    seconds, or as soon as the invalidation message arrives when `INVALIDATION` is
+    'redis'. `add`, `incr` and `decr` always run on L2, so they stay atomic.
+
+        CACHES = {
+            "shared": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL},
+            "default": {
+                "BACKEND": "account.cache_backends.TieredCache",
+                "OPTIONS": {
+                    "L2": "shared",
+                    "L1_MAX_ENTRIES": 10000,
+                    "L1_TTL": 2.0,  # Upper bound on staleness
+                    "L1_NEGATIVE_TTL": 2.0,
+                    "INVALIDATION": "redis",  # Uses REDIS_URL, or "REDIS_URL" in OPTIONS
+                },
+            },
+        }
+
+    `L1_KEY_PREFIXES` limits L1 to keys starting with the given prefixes; other keys
+    go straight to L2.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'shared')
+        self.l1_ttl = options.get('L1_TTL', 2.0)
+        self.l1_negative_ttl = options.get('L1_NEGATIVE_TTL', self.l1_ttl)
+        self.l1_prefixes = tuple(options.get('L1_KEY_PREFIXES') or ())
+        self.local = _LocalTier(options.get('L1_MAX_ENTRIES', 10000))
+        self.invalidator = None
+        if options.get('INVALIDATION') == 'redis':
+            self.invalidator = _RedisInvalidator(
+                self.local, options.get('REDIS_URL'), options.get('CHANNEL', 'cache:invalidate')
+            )
+        self.hits = self.misses = 0
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _tiered(self, key):
+        return not self.l1_prefixes or key.startswith(self.l1_prefixes)
+
+    def _l1_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_ttl
+        return min(self.l1_ttl, timeout)
+
+    def _local_get(self, key, version):
+        if self.invalidator is not None:
+            self.invalidator.start()
+        cached = self.local.get((key, version))
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached
+
+    def _remember(self, key, version, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_ttl(timeout)
+        if ttl > 0:
+            self.local.set((key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    def _forget(self, keys):
+        for key in keys:
+            self.local.delete(key)
+        if self.invalidator is not None:
+            self.invalidator.publish(keys)
+
+    def get(self, key, default=None, version=None):
+        if not self._tiered(key):
+            return self.l2.get(key, default, version)
+        cached = self._local_get(key, version)
+        if cached is _MISSING:
+            return default
+        if cached is not None:
+            return pickle.loads(cached)
+        value = self.l2.get(key, _MISSING, version)
+        if value is _MISSING:
+            self.local.set((key, version), _MISSING, self.l1_negative_ttl)
+            return default
+        self._remember(key, version, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            cached = self._local_get(key, version) if self._tiered(key) else None
+            if cached is None:
+                remote.append(key)
+            elif cached is not _MISSING:
+                found[key] = pickle.loads(cached)
+        if remote:
+            fetched = self.l2.get_many(remote, version)
+            for key in remote:
+                if not self._tiered(key):
+                    continue
+                if key in fetched:
+                    self._remember(key, version, fetched[key])
+                else:
+                    self.local.set((key, version), _MISSING, self.l1_negative_ttl)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        if self._tiered(key):
+            self._forget([(key, version)])
+            self._remember(key, version, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        tiered = [key for key in data if self._tiered(key)]
+        self._forget([(key, version) for key in tiered])
+        for key in tiered:
+            self._remember(key, version, data[key], timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added and self._tiered(key):
+            self._forget([(key, version)])
+        return added
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version)
+        if self._tiered(key):
+            self._forget([(key, version)])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version)
+        self._forget([(key, version) for key in keys if self._tiered(key)])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version)
+        if self._tiered(key):
+            self._forget([(key, version)])
+        return touched
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        if self._tiered(key):
+            self._forget([(key, version)])
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        value = self.l2.decr(key, delta, version)
+        if self._tiered(key):
+            self._forget([(key, version)])
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        self.local.clear()
+        if self.invalidator is not None:
+            self.invalidator.publish(None)
+
+    async def aget(self, key, default=None, version=None):
+        if not self._tiered(key):
+            return await self.l2.aget(key, default, version)
+        cached = self._local_get(key, version)
+        if cached is _MISSING:
+            return default
+        if cached is not None:
+            return pickle.loads(cached)
+        value = await self.l2.aget(key, _MISSING, version)
+        if value is _MISSING:
+            self.local.set((key, version), _MISSING, self.l1_negative_ttl)
+            return default
+        self._remember(key, version, value)
+        return value
+
+    def stats(self):
+        """
+        Return the L1 hit and miss counters of this process.
+
+        Returns:
+            dict: Hits, misses, hit rate and the number of L1 entries.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'entries': len(self.local),
+        }
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Cache backend shared by every worker process on the host through a memory-mapped
+    file (see `account.shm_store.SharedMemoryStore`), for single-host deployments
+    without Redis. `add`, `incr` and `decr` are atomic across processes.
+
+        CACHES = {
+            "default": {
+                "BACKEND": "account.cache_backends.SharedMemoryCache",
+                "LOCATION": "/dev/shm/obar-cache",
+                "OPTIONS": {"BUCKETS": 16384, "WAYS": 8, "VALUE_SIZE": 256},
+            }
+        }
+
+    Capacity is fixed at BUCKETS * WAYS entries of at most VALUE_SIZE pickled bytes;
+    when a bucket is full the entry closest to expiring is evicted. Larger values are
+    not stored.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.store = get_shared_store(
+            location or default_path('cache'),
+            buckets=options.get('BUCKETS', 16384),
+            ways=options.get('WAYS', 8),
+            value_size=options.get('VALUE_SIZE', 256),
+        )
+
+    def _expires_at(self, timeout):
+        expires_at = self.get_backend_timeout(timeout)
+        return math.inf if expires_at is None else expires_at
+
+    def _pickle(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.store.value_size:
+            logger.warning("Not caching %s: %d bytes exceeds VALUE_SIZE", key, len(data))
+            return None
+        return data
+
+    def get(self, key, default=None, version=None):
+        value = self.store.get(self.make_and_validate_key(key, version=version))
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data = self._pickle(key, value)  # None drops a previous value rather than leave it stale
+        expires_at = self._expires_at(timeout)
+        self.store.transact(key, lambda current, current_expiry, now: (data, expires_at, None))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data = self._pickle(key, value)
+        if data is None:
+            return False
+        expires_at = self._expires_at(timeout)
+
+        def update(current, current_expiry, now):
+            if current is not None:
+                return KEEP, current_expiry, False
+            return data, expires_at, True
+
+        return self.store.transact(key, update)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires_at = self._expires_at(timeout)
+
+        def update(current, current_expiry, now):
+            if current is None:
+                return KEEP, current_expiry, False
+            return current, expires_at, True
+
+        return self.store.transact(key, update)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.store.transact(key, lambda current, current_expiry, now: (None, 0.0, current is not None))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def update(current, current_expiry, now):
+            if current is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(current) + delta
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL), current_expiry, value
+
+        return self.store.transact(key, update)
+
+    def has_key(self, key, version=None):
+        return self.store.get(self.make_and_validate_key(key, version=version)) is not None
+
+    def clear(self):
+        self.store.clear()
@@ -0,0 +1,109 @@
+# users/deletion.py
+
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from .models import User
+from .phone_index import phone_index
+from .profile_cache import invalidate_profile
+from .utils import DELETED_USER_VERSION, cache_user_version
+
+
+def tombstone_phone(user_id):
+    """
+    Return the placeholder phone a deleted user keeps until it is purged, which frees
+    the real number and can never match a normalized phone.
+
+    Args:
+        user_id (int): The user's primary key.
+
+    Returns:
+        str: The placeholder phone.
+    """
+    return f"del{user_id}"
+
+
+def tombstone_user(user):
+    """
+    Delete an account without touching its related rows.
+
+    A single UPDATE deactivates the user, so its tokens stop authenticating, frees its
+    phone for a new registration and clears its personal data. The tokens, permissions
+    and the row itself are removed later by `purge_deleted_users`.
+
+    Args:
+        user (User): The user to delete.
+
+    Returns:
+        bool: True if the user was deleted, False if it already was.
+    """
+    phone = user.phone
+    with transaction.atomic():
+        deleted = User.objects.filter(pk=user.pk, is_active=True).update(
+            is_active=False,
+            deleted_at=timezone.now(),
+            phone=tombstone_phone(user.pk),
+            password=make_password(None),
+            first_name='',
+            last_name='',
+            email='',
+            version=F('version') + 1,
+        )
+        if deleted:
+            phone_index.mark_unregistered(phone)
+    cache_user_version(user.pk, DELETED_USER_VERSION)  # Reject profile snapshots of the deleted user
+    invalidate_profile(user.pk)
+    return bool(deleted)
+
+
+def purge_deleted_users(batch_size=500, pause=0.1, grace=0, limit=None, progress=None):
+    """
+    Remove deleted users and their related rows in small batches.
+
+    Each batch of users has its outstanding tokens (and their blacklist entries) deleted
+    `batch_size` rows per transaction, then the user rows themselves, whose remaining
+    cascades (permissions, groups, admin log) are small. Sleeping `pause` seconds after
+    every transaction keeps the purge from monopolizing the database.
+
+    Args:
+        batch_size (int): Users, and tokens, deleted per transaction.
+        pause (float): Seconds to sleep after each transaction.
+        grace (int): Only purge users deleted at least this many seconds ago.
+        limit (int): Stop after this many users, None for all.
+        progress (callable): Called with the running totals after each batch of users.
+
+    Returns:
+        dict: The number of users and tokens purged.
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    totals = {'users': 0, 'tokens': 0}
+    while limit is None or totals['users'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals['users'])
+        user_ids = list(
+            User.objects.filter(is_active=False, deleted_at__lte=cutoff)
+            .order_by('deleted_at')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not user_ids:
+            break
+        while True:
+            token_ids = list(OutstandingToken.objects.filter(user_id__in=user_ids).values_list('pk', flat=True)[:batch_size])
+            if not token_ids:
+                break
+            with transaction.atomic():
+                OutstandingToken.objects.filter(pk__in=token_ids).delete()  # Cascades to BlacklistedToken
+            totals['tokens'] += len(token_ids)
+            time.sleep(pause)
+        with transaction.atomic():
+            User.objects.filter(pk__in=user_ids, is_active=False).delete()
+        totals['users'] += len(user_ids)
+        if progress is not None:
+            progress(totals)
+        time.sleep(pause)
+    return totals
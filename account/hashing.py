@@ -0,0 +1,245 @@
+# users/hashing.py
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .metrics import timed
+
+
+class HashingSaturatedError(Exception):
+    """
+    Raised when the hashing pool already has as many jobs as it is allowed to queue.
+    """
+
+
+def _init_worker(settings_module):
+    # Worker processes start from a fresh interpreter and need Django set up to read PASSWORD_HASHERS
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _make_password(raw_password):
+    return hashers.make_password(raw_password)
+
+
+def _check_password(raw_password, encoded):
+    return hashers.check_password(raw_password, encoded)
+
+
+def must_update(encoded):
+    """
+    Check whether an encoded password should be re-hashed with the preferred hasher.
+
+    Args:
+        encoded (str): The stored, encoded password.
+
+    Returns:
+        bool: True if the hasher or its parameters changed since the password was hashed.
+    """
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class PasswordHasherPool:
+    """
+    Runs password hashing on a size-capped process pool.
+
+    At most `workers + max_queue` hashes are in flight; further calls fail fast with
+    `HashingSaturatedError` instead of piling up behind a credential-stuffing burst.
+    With `workers=0` hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=10.0, start_method='forkserver'):
+        """
+        Args:
+            workers (int): Number of hashing processes, 0 to hash inline.
+            max_queue (int): Hashes allowed to wait for a free process.
+            timeout (float): Seconds to wait for a hash before giving up.
+            start_method (str): multiprocessing start method for the worker processes. With
+                'forkserver' or 'spawn' the entry script must guard its main code with
+                `if __name__ == '__main__'`, as manage.py and the WSGI/ASGI servers do.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.start_method = start_method
+        self.submitted = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+        self._in_flight = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def make_password(self, raw_password):
+        """
+        Hash a password with the configured Django hasher.
+
+        Args:
+            raw_password (str): The password to hash.
+
+        Returns:
+            str: The encoded password.
+
+        Raises:
+            HashingSaturatedError: If the pool is saturated.
+        """
+        return self._run(_make_password, raw_password)
+
+    def check_password(self, raw_password, encoded):
+        """
+        Check a password against an encoded hash.
+
+        Args:
+            raw_password (str): The password to check.
+            encoded (str): The stored, encoded password.
+
+        Returns:
+            bool: True if the password matches.
+
+        Raises:
+            HashingSaturatedError: If the pool is saturated.
+        """
+        if not hashers.is_password_usable(encoded):
+            return False
+        return self._run(_check_password, raw_password, encoded)
+
+    def make_passwords(self, raw_passwords, chunksize=16):
+        """
+        Hash many passwords across all worker processes, for bulk jobs.
+
+        Bulk jobs bypass the queue limit, so do not call this from request handlers.
+
+        Args:
+            raw_passwords (list): The passwords to hash.
+            chunksize (int): Passwords sent to a worker process at once.
+
+        Returns:
+            list: The encoded passwords, in the same order.
+        """
+        if not self.workers:
+            return [_make_password(raw_password) for raw_password in raw_passwords]
+        return list(self._get_executor().map(_make_password, raw_passwords, chunksize=chunksize))
+
+    async def amake_password(self, raw_password):
+        """
+        Async version of `make_password`.
+        """
+        return await self._arun(_make_password, raw_password)
+
+    async def acheck_password(self, raw_password, encoded):
+        """
+        Async version of `check_password`.
+        """
+        if not hashers.is_password_usable(encoded):
+            return False
+        return await self._arun(_check_password, raw_password, encoded)
+
+    def stats(self):
+        """
+        Return the pool size and queue counters.
+
+        Returns:
+            dict: Workers, queue limit, hashes in flight, submitted and rejected counts.
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+            }
+
+    def shutdown(self):
+        """
+        Stop the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self, func, *args):
+        with timed('hash'):
+            if not self.workers:
+                return func(*args)
+            future = self._submit(func, *args)
+            return future.result(self.timeout)
+
+    async def _arun(self, func, *args):
+        with timed('hash'):
+            if not self.workers:
+                return await asyncio.to_thread(func, *args)
+            future = self._submit(func, *args)
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingSaturatedError("Password hashing pool is saturated")
+        with self._lock:
+            self.submitted += 1
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+                )
+            return self._executor
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hasher_pool():
+    """
+    Return the process-wide password hashing pool, building it from settings on first use.
+
+    Returns:
+        PasswordHasherPool: The shared pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHasherPool(
+                    workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', 2),
+                    max_queue=getattr(settings, 'PASSWORD_HASHING_MAX_QUEUE', 16),
+                    timeout=getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 10.0),
+                    start_method=getattr(settings, 'PASSWORD_HASHING_START_METHOD', 'forkserver'),
+                )
+    return _pool
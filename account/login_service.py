@@ -0,0 +1,181 @@
+# users/login_service.py
+
+import time
+from collections import namedtuple
+
+from .hashing import HashingSaturatedError, get_hasher_pool, must_update
+from .models import User
+from .phone_index import phone_index
+from .ratelimit import get_rate_limiter
+from .utils import aget_tokens_for_user, get_tokens_for_user
+
+# Columns loaded by the login query: the password plus the profile snapshot put in the tokens
+LOGIN_FIELDS = ('id', 'password', 'is_active', 'phone', 'first_name', 'last_name', 'email', 'version', 'updated_at')
+
+HASHING_RETRY_AFTER = 1  # Seconds clients wait before retrying when password hashing is saturated
+
+LoginResult = namedtuple('LoginResult', ['success', 'status', 'body', 'retry_after', 'timings'])
+LoginResult.__doc__ = """
+Outcome of a phone/password login.
+
+Attributes:
+    success (bool): Whether the credentials were accepted.
+    status (int): HTTP status code for the response.
+    body (dict): Response body, containing the tokens on success.
+    retry_after (int): Seconds until the client may retry when blocked, else 0.
+    timings (dict): Milliseconds spent in each stage that ran.
+"""
+
+
+class _StageTimer:
+    """
+    Collects the time spent in each named stage of a login.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._stage = None
+        self._started = 0.0
+
+    def start(self, stage):
+        self.stop()
+        self._stage = stage
+        self._started = time.perf_counter()
+
+    def stop(self):
+        if self._stage is not None:
+            elapsed = (time.perf_counter() - self._started) * 1000
+            self.timings[self._stage] = round(self.timings.get(self._stage, 0) + elapsed, 3)
+            self._stage = None
+        return self.timings
+
+
+def login_with_password(phone, password, ip):
+    """
+    Authenticate a user by phone and password and mint JWT tokens.
+
+    The block state is checked before any database work, and the user row is fetched
+    once with only the columns needed to verify the password and mint the tokens.
+
+    Args:
+        phone (str): The phone number of the user.
+        password (str): The raw password to verify.
+        ip (str): The client IP address, used for rate limiting.
+
+    Returns:
+        LoginResult: The outcome, with per-stage timings (ratelimit, lookup, password, tokens).
+        A saturated or timed-out hashing pool gives a 503 with `retry_after`.
+    """
+    timer = _StageTimer()
+    limiter = get_rate_limiter()
+
+    timer.start('ratelimit')
+    limit = limiter.peek('login', phone=phone, ip=ip)
+    if not limit.allowed:
+        return LoginResult(False, 403, {"error": "Temporary access blocked."}, limit.retry_after, timer.stop())
+
+    timer.start('lookup')
+    user = None
+    if phone_index.exists(phone):  # Unknown phones are answered without a query
+        user = User.objects.only(*LOGIN_FIELDS).filter(phone=phone).first()
+    if user is None:
+        return LoginResult(False, 400, {"error": "Phone number not registered."}, 0, timer.stop())
+
+    timer.start('password')
+    hasher_pool = get_hasher_pool()
+    try:
+        valid = hasher_pool.check_password(password, user.password)
+    except (HashingSaturatedError, TimeoutError):
+        return _busy(timer)
+    # Inactive users fail like a wrong password, as in ModelBackend.user_can_authenticate
+    valid = valid and user.is_active
+    if valid and must_update(user.password):
+        # Upgrade the stored hash to the current hasher settings
+        try:
+            user.password = hasher_pool.make_password(password)
+        except (HashingSaturatedError, TimeoutError):
+            pass  # Upgraded on a later login
+        else:
+            user.save(update_fields=['password'])
+
+    if not valid:
+        timer.start('ratelimit')
+        return _failed(limiter.hit('login', phone=phone, ip=ip), timer)
+
+    timer.start('tokens')
+    tokens = get_tokens_for_user(user)
+    return LoginResult(True, 200, {"message": "Login successful.", "tokens": tokens}, 0, timer.stop())
+
+
+async def alogin_with_password(phone, password, ip):
+    """
+    Async version of `login_with_password`.
+
+    The rate limit, phone index and user query run without blocking the event loop,
+    and the password check awaits the hashing pool, so concurrent logins only share
+    the hashing processes.
+    """
+    timer = _StageTimer()
+    limiter = get_rate_limiter()
+
+    timer.start('ratelimit')
+    limit = await limiter.apeek('login', phone=phone, ip=ip)
+    if not limit.allowed:
+        return LoginResult(False, 403, {"error": "Temporary access blocked."}, limit.retry_after, timer.stop())
+
+    timer.start('lookup')
+    user = None
+    if await phone_index.aexists(phone):
+        user = await User.objects.only(*LOGIN_FIELDS).filter(phone=phone).afirst()
+    if user is None:
+        return LoginResult(False, 400, {"error": "Phone number not registered."}, 0, timer.stop())
+
+    timer.start('password')
+    hasher_pool = get_hasher_pool()
+    try:
+        valid = await hasher_pool.acheck_password(password, user.password)
+    except (HashingSaturatedError, TimeoutError):
+        return _busy(timer)
+    valid = valid and user.is_active
+    if valid and must_update(user.password):
+        try:
+            user.password = await hasher_pool.amake_password(password)
+        except (HashingSaturatedError, TimeoutError):
+            pass
+        else:
+            await user.asave(update_fields=['password'])
+
+    if not valid:
+        timer.start('ratelimit')
+        return _failed(await limiter.ahit('login', phone=phone, ip=ip), timer)
+
+    timer.start('tokens')
+    tokens = await aget_tokens_for_user(user)
+    return LoginResult(True, 200, {"message": "Login successful.", "tokens": tokens}, 0, timer.stop())
+
+
+def _failed(limit, timer):
+    # Wrong password (or inactive user), after the attempt was counted
+    timings = timer.stop()
+    if limit.remaining <= 0:
+        return LoginResult(False, 403, {"error": "You are blocked due to too many failed login attempts."}, 0, timings)
+    return LoginResult(False, 401, {"error": "Incorrect password."}, 0, timings)
+
+
+def _busy(timer):
+    return LoginResult(
+        False, 503, {"error": "Server is busy. Please try again later."}, HASHING_RETRY_AFTER, timer.stop()
+    )
+
+
+def server_timing(timings):
+    """
+    Format stage timings as a `Server-Timing` header value.
+
+    Args:
+        timings (dict): Milliseconds spent in each stage.
+
+    Returns:
+        str: The header value, e.g. "lookup;dur=1.2, password;dur=250.3".
+    """
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
@@ -0,0 +1,60 @@
+# users/management/commands/_bench.py
+
+import math
+
+
+def percentile(values, pct):
+    """
+    Return the given percentile of a list of numbers using nearest-rank.
+
+    Args:
+        values (list): The measured values.
+        pct (float): The percentile to return, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """
+    Summarize a list of latencies given in seconds.
+
+    Args:
+        latencies (list): The measured latencies in seconds.
+
+    Returns:
+        dict: Count, mean, p50, p95, p99 and max, in milliseconds.
+    """
+    count = len(latencies)
+    return {
+        'count': count,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if count else 0.0,
+    }
+
+
+def format_summary(name, summary):
+    """
+    Format a latency summary as a single line of text.
+
+    Args:
+        name (str): Label of the measured operation.
+        summary (dict): The output of `summarize`.
+
+    Returns:
+        str: The formatted line.
+    """
+    return (
+        f"{name:<28} n={summary['count']:<7} mean={summary['mean_ms']:.2f}ms "
+        f"p50={summary['p50_ms']:.2f}ms p95={summary['p95_ms']:.2f}ms "
+        f"p99={summary['p99_ms']:.2f}ms max={summary['max_ms']:.2f}ms"
+    )
@@ -0,0 +1,116 @@
+# users/management/commands/bench_admin_search.py
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.search_index import match_expression, phone_prefix, phone_prefix_range
+
+from ._bench import format_summary, summarize
+
+FIRST_NAMES = ['Ali', 'Majed', 'Sara', 'Reza', 'Maryam', 'Hossein', 'Zahra', 'Mehdi', 'Fatemeh', 'Amir', 'Neda', 'Omid']
+LAST_NAMES = ['Ahmadi', 'Hosseini', 'Karimi', 'Rezaei', 'Moradi', 'Jafari', 'Mohammadi', 'Rahimi', 'Kazemi', 'Sadeghi']
+PAGE = 100  # Admin list_per_page
+COUNT_LIMIT = 1000
+
+
+class Command(BaseCommand):
+    """
+    Compare the admin's default user search, counting and paging with the indexed ones
+    on a synthetic SQLite table of millions of users.
+
+    The table mirrors `account_user` (unique phone index, names, email) and carries the
+    FTS5 index built by `build_user_search_index`. Each query runs the SQL the admin
+    issues for a changelist page: an exact or estimated count, and one page of results.
+    """
+    help = "Benchmark admin user search, counts and pagination on a synthetic multi-million-row table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help="Users in the synthetic table.")
+        parser.add_argument('--path', help="SQLite file to use; reused when it already has the table.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs of each query.")
+
+    def handle(self, *args, **options):
+        path = options['path'] or os.path.join(tempfile.gettempdir(), f"bench-admin-search-{options['rows']}.sqlite3")
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode = WAL")
+        if not db.execute("SELECT 1 FROM sqlite_master WHERE name = 'account_user'").fetchone():
+            self._populate(db, options['rows'])
+        rows = db.execute("SELECT MAX(id) FROM account_user").fetchone()[0]
+        self.stdout.write(f"{path}: {rows} users")
+
+        name_term = 'majed kar'
+        phone_term = '0912345'
+        like = f"%{name_term}%"
+        deep_offset = (rows // 2) // PAGE * PAGE
+        low, high = phone_prefix_range(phone_prefix(phone_term)).values()
+        cursor_id = rows - deep_offset + 1
+
+        self._compare(db, options['repeat'], 'count', [
+            ("exact COUNT(*)", "SELECT COUNT(*) FROM account_user", []),
+            ("estimate MAX(id)", "SELECT MAX(id) FROM account_user", []),
+            ("estimate sqlite_stat1", "SELECT stat FROM sqlite_stat1 WHERE tbl = 'account_user' LIMIT 1", []),
+        ])
+        self._compare(db, options['repeat'], f"search {name_term!r}", [
+            ("icontains page", "SELECT id FROM account_user WHERE phone LIKE ?1 OR first_name LIKE ?1 OR last_name LIKE ?1 "
+                               f"OR email LIKE ?1 ORDER BY id DESC LIMIT {PAGE}", [like]),
+            ("icontains count", "SELECT COUNT(*) FROM account_user WHERE phone LIKE ?1 OR first_name LIKE ?1 "
+                                "OR last_name LIKE ?1 OR email LIKE ?1", [like]),
+            ("fts5 page", "SELECT id FROM account_user WHERE id IN (SELECT rowid FROM account_user_fts "
+                          f"WHERE account_user_fts MATCH ?) ORDER BY id DESC LIMIT {PAGE}", [match_expression(name_term)]),
+            ("fts5 capped count", "SELECT COUNT(*) FROM (SELECT id FROM account_user WHERE id IN (SELECT rowid FROM "
+                                  f"account_user_fts WHERE account_user_fts MATCH ?) LIMIT {COUNT_LIMIT})", [match_expression(name_term)]),
+        ])
+        self._compare(db, options['repeat'], f"search {phone_term!r}", [
+            ("icontains page", "SELECT id FROM account_user WHERE phone LIKE ?1 OR first_name LIKE ?1 OR last_name LIKE ?1 "
+                               f"OR email LIKE ?1 ORDER BY id DESC LIMIT {PAGE}", [f"%{phone_term}%"]),
+            ("phone range page", "SELECT id FROM account_user WHERE phone >= ? AND phone < ? "
+                                 f"ORDER BY id DESC LIMIT {PAGE}", [low, high]),
+            ("phone range capped count", "SELECT COUNT(*) FROM (SELECT id FROM account_user WHERE phone >= ? AND phone < ? "
+                                         f"LIMIT {COUNT_LIMIT})", [low, high]),
+        ])
+        self._compare(db, options['repeat'], f"page at offset {deep_offset}", [
+            ("offset", f"SELECT id FROM account_user ORDER BY id DESC LIMIT {PAGE} OFFSET {deep_offset}", []),
+            ("keyset", f"SELECT id FROM account_user WHERE id < ? ORDER BY id DESC LIMIT {PAGE}", [cursor_id]),
+        ])
+        db.close()
+
+    def _populate(self, db, rows):
+        started = time.perf_counter()
+        db.executescript("""
+            CREATE TABLE account_user (
+                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+                phone VARCHAR(15) NOT NULL UNIQUE,
+                first_name VARCHAR(100) NOT NULL,
+                last_name VARCHAR(100) NOT NULL,
+                email VARCHAR(254) NOT NULL
+            );
+            CREATE VIRTUAL TABLE account_user_fts USING fts5(first_name, last_name, email, content='account_user', content_rowid='id');
+        """)
+        rng = random.Random(0)
+
+        def users():
+            for i in range(1, rows + 1):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                # 7919 is coprime with 10**9, so the phones are distinct
+                yield i, f"09{i * 7919 % 10 ** 9:09d}", first, last, f"{first.lower()}.{last.lower()}{i}@example.com"
+
+        db.executemany("INSERT INTO account_user VALUES (?, ?, ?, ?, ?)", users())
+        db.execute("INSERT INTO account_user_fts(account_user_fts) VALUES ('rebuild')")
+        db.execute("ANALYZE account_user")
+        db.commit()
+        self.stdout.write(f"Created {rows} users in {time.perf_counter() - started:.1f}s")
+
+    def _compare(self, db, repeat, title, queries):
+        self.stdout.write(title)
+        for label, sql, params in queries:
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                db.execute(sql, params).fetchall()
+                latencies.append(time.perf_counter() - started)
+            self.stdout.write("  " + format_summary(label, summarize(latencies)))
@@ -0,0 +1,81 @@
+# users/management/commands/bench_admission.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from account.admission import AdmissionController, AdmissionRejected, EndpointLimit
+
+from ._bench import format_summary, summarize
+
+
+class Command(BaseCommand):
+    """
+    Simulate a threaded worker whose SMS provider has slowed down, with and without
+    admission control.
+
+    Requests arrive at a steady rate on a pool of server threads: OTP sends that now
+    take `--slow` seconds, and cheap profile reads. Without admission control the OTP
+    sends take every thread and the reads queue behind them; with it, OTP sends over
+    their limit get a fast 503 and the reads keep their reserved capacity. Reports the
+    latency, from arrival to response, of the served and the shed requests of each kind.
+    """
+    help = "Compare read and OTP latency under overload with and without admission control."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0, help="Length of each run.")
+        parser.add_argument('--threads', type=int, default=32, help="Server threads.")
+        parser.add_argument('--otp-rate', type=float, default=100, help="OTP sends per second.")
+        parser.add_argument('--read-rate', type=float, default=200, help="Profile reads per second.")
+        parser.add_argument('--slow', type=float, default=0.5, help="Seconds an OTP send takes.")
+        parser.add_argument('--read-latency', type=float, default=0.002, help="Seconds a profile read takes.")
+
+    def handle(self, *args, **options):
+        self._run('no admission control', None, options)
+        controller = AdmissionController(
+            [EndpointLimit('otp', concurrency=8, queue=8), EndpointLimit('profile', concurrency=16, queue=16, reserved=True)],
+            capacity=24,
+            reserved=8,
+            queue_timeout=2.0,
+        )
+        self._run('admission control', controller, options)
+
+    def _run(self, mode, controller, options):
+        results = {'otp': [], 'profile': []}
+        shed = {'otp': [], 'profile': []}
+        service = {'otp': options['slow'], 'profile': options['read_latency']}
+
+        def handle(group, arrived):
+            if controller is not None:
+                try:
+                    controller.acquire(group)
+                except AdmissionRejected:
+                    shed[group].append(time.perf_counter() - arrived)
+                    return
+            started = time.perf_counter()
+            time.sleep(service[group])
+            if controller is not None:
+                controller.release(group, time.perf_counter() - started)
+            results[group].append(time.perf_counter() - arrived)
+
+        arrivals = []
+        for group, rate in (('otp', options['otp_rate']), ('profile', options['read_rate'])):
+            arrivals += [(i / rate, group) for i in range(int(options['seconds'] * rate))]
+        arrivals.sort()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            begin = time.perf_counter()
+            for offset, group in arrivals:
+                delay = begin + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(handle, group, time.perf_counter())
+        elapsed = time.perf_counter() - begin
+
+        self.stdout.write(f"[{mode}]")
+        for group, latencies in results.items():
+            self.stdout.write("  " + format_summary(f"{group} ok", summarize(latencies)))
+            if shed[group]:
+                self.stdout.write("  " + format_summary(f"{group} 503", summarize(shed[group])))
+        self.stdout.write(f"  elapsed={elapsed:.2f}s")
@@ -0,0 +1,94 @@
+# users/management/commands/bench_async_views.py
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+
+from account.models import User
+from account.otp_store import get_otp_store
+
+from ._bench import format_summary, summarize
+
+STACKS = {
+    'sync': '/auth/',
+    'async': '/auth/async/',
+}
+
+
+class Command(BaseCommand):
+    """
+    Compare the sync (DRF) and async account endpoints under concurrent OTP flows.
+
+    Each flow runs check-phone -> verify -> register -> login for a fresh phone number
+    through Django's ASGI request handler, with SMS delivery going to the fake provider.
+    Users created by the benchmark are deleted afterwards.
+    """
+    help = "Benchmark the sync and async account endpoints with concurrent OTP flows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flows', type=int, default=100, help="Number of signup flows per stack.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Flows running at the same time.")
+        parser.add_argument('--stack', choices=sorted(STACKS), action='append', help="Only run the given stack.")
+
+    def handle(self, *args, **options):
+        overrides = {
+            'ALLOWED_HOSTS': ['testserver'],
+            'RATE_LIMIT_ENABLED': False,
+            'SMS_PROVIDER': 'account.sms_providers.FakeSmsProvider',
+        }
+        with override_settings(**overrides):
+            for stack in options['stack'] or sorted(STACKS):
+                latencies, errors, elapsed = asyncio.run(
+                    self._run(STACKS[stack], options['flows'], options['concurrency'])
+                )
+                self.stdout.write(f"[{stack}] {options['flows']} flows, concurrency {options['concurrency']}")
+                for endpoint, values in latencies.items():
+                    self.stdout.write("  " + format_summary(endpoint, summarize(values)))
+                self.stdout.write(
+                    f"  flows/s: {options['flows'] / elapsed:.1f}  errors: {dict(errors) or 0}  elapsed: {elapsed:.2f}s"
+                )
+
+    async def _run(self, prefix, flows, concurrency):
+        client = AsyncClient()
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        semaphore = asyncio.Semaphore(concurrency)
+        run_id = random.randint(100, 999)
+        phones = [f"09{run_id}{i:06d}" for i in range(flows)]
+
+        async def call(endpoint, expected_status, data):
+            started = time.perf_counter()
+            response = await client.post(prefix + endpoint, data, content_type='application/json')
+            latencies[endpoint].append(time.perf_counter() - started)
+            if response.status_code != expected_status:
+                errors[endpoint] += 1
+                return None
+            return response.json()
+
+        async def flow(phone):
+            async with semaphore:
+                if await call('check-phone/', 200, {'phone': phone}) is None:
+                    return
+                code = (await sync_to_async(get_otp_store().get)(phone)).code
+                verified = await call('verify/', 200, {'phone': phone, 'code': code})
+                if verified is None:
+                    return
+                registered = await call('register/', 201, {
+                    'registration_token': verified['registration_token'],
+                    'password': 'bench-password',
+                })
+                if registered is None:
+                    return
+                await call('login/', 200, {'phone': phone, 'password': 'bench-password'})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(phone) for phone in phones))
+        elapsed = time.perf_counter() - started
+
+        await sync_to_async(User.objects.filter(phone__in=phones).delete)()
+        return latencies, errors, elapsed
@@ -0,0 +1,116 @@
+# users/management/commands/bench_hashing.py
+
+import os
+import threading
+import time
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from account.hashing import HashingSaturatedError, PasswordHasherPool
+from account.models import User
+from account.utils import get_tokens_for_user
+
+from ._bench import format_summary, summarize
+
+
+class Command(BaseCommand):
+    """
+    Benchmark password hashing throughput and its effect on a cheap endpoint.
+
+    First measures hashes/sec for growing pool sizes. Then polls GET /auth/profile/
+    while a hashing burst runs inline in request threads, and again while the same
+    burst runs on the bounded pool, to show the latency impact on non-hashing requests.
+    """
+    help = "Measure hashes/sec per core and the latency impact of hashing on /auth/profile/."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashes', type=int, default=64, help="Hashes per throughput run.")
+        parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="Largest pool size to try.")
+        parser.add_argument('--burst-threads', type=int, default=16, help="Threads hashing during the latency runs.")
+        parser.add_argument('--duration', type=float, default=3.0, help="Seconds per latency run.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"hasher: {hashers.get_hasher('default').algorithm}")
+        self._throughput(options)
+        self._latency(options)
+
+    def _throughput(self, options):
+        workers = 1
+        while workers <= options['max_workers']:
+            pool = PasswordHasherPool(workers=workers, max_queue=options['hashes'])
+            pool.make_password('warm-up')  # Start the worker processes outside the measurement
+            results = []
+
+            def hash_one():
+                results.append(pool.make_password('bench-password'))
+
+            threads = [threading.Thread(target=hash_one) for _ in range(options['hashes'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            pool.shutdown()
+            rate = len(results) / elapsed
+            self.stdout.write(f"pool workers={workers:<3} {rate:8.1f} hashes/s  {rate / workers:8.1f} hashes/s/core")
+            workers *= 2
+
+    def _latency(self, options):
+        user = User.objects.create(phone='09000000000')
+        token = get_tokens_for_user(user)['access']
+        pool = PasswordHasherPool(workers=max(1, (os.cpu_count() or 2) // 2), max_queue=options['burst_threads'])
+        pool.make_password('warm-up')
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                runs = [
+                    ("profile, idle", None),
+                    ("profile, inline hashing", hashers.make_password),
+                    ("profile, pooled hashing", pool.make_password),
+                ]
+                for label, hash_func in runs:
+                    latencies, hashed, rejected = self._poll_profile(token, hash_func, options)
+                    self.stdout.write(format_summary(label, summarize(latencies)))
+                    if hash_func is not None:
+                        self.stdout.write(f"{'':<28} hashes={hashed} rejected={rejected}")
+        finally:
+            pool.shutdown()
+            user.delete()
+
+    def _poll_profile(self, token, hash_func, options):
+        stop = threading.Event()
+        counters = {'hashed': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        def burst():
+            while not stop.is_set():
+                try:
+                    hash_func('bench-password')
+                    key = 'hashed'
+                except HashingSaturatedError:
+                    key = 'rejected'
+                    time.sleep(0.001)
+                with lock:
+                    counters[key] += 1
+
+        threads = []
+        if hash_func is not None:
+            threads = [threading.Thread(target=burst) for _ in range(options['burst_threads'])]
+            for thread in threads:
+                thread.start()
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+        latencies = []
+        deadline = time.perf_counter() + options['duration']
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            client.get('/auth/profile/')
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.005)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, counters['hashed'], counters['rejected']
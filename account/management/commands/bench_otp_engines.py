@@ -0,0 +1,74 @@
+# users/management/commands/bench_otp_engines.py
+
+import random
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from account.otp_store import VERIFIED, CacheOtpStore, TotpOtpStore
+from account.otp_utils import BLOCK_TTL, DEFAULT_TTL, MAX_ATTEMPTS, VERIFIED_TTL
+
+ENGINES = {
+    'stored': CacheOtpStore,
+    'totp': TotpOtpStore,
+}
+
+
+class Command(BaseCommand):
+    """
+    Compare the stored OTP engine (`CacheOtpStore`) with the stateless TOTP engine.
+
+    For each engine, issues codes for a batch of phones, then verifies them all, against
+    a private in-memory cache. Reports issue and verify ops/sec and the number of cache
+    entries and bytes held after each phase. Only a fraction of the codes is verified
+    by default, as most signup traffic never gets past the SMS.
+    """
+    help = "Measure ops/sec and cache memory of the stored and TOTP OTP engines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=20000, help="Codes issued per engine.")
+        parser.add_argument('--verify-ratio', type=float, default=0.3, help="Share of the issued codes that get verified.")
+        parser.add_argument('--engine', choices=sorted(ENGINES), action='append', help="Only run the given engine.")
+
+    def handle(self, *args, **options):
+        phones = [f"09{random.randint(100, 999)}{i:06d}" for i in range(options['phones'])]
+        verified_phones = phones[:int(len(phones) * options['verify_ratio'])]
+        cache_settings = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'bench-otp-engines',
+                'OPTIONS': {'MAX_ENTRIES': len(phones) * 4},  # Nothing is culled during the run
+            }
+        }
+        with override_settings(CACHES=cache_settings):
+            for name in options['engine'] or list(ENGINES):
+                caches['default'].clear()
+                self._run(name, ENGINES[name](), phones, verified_phones)
+
+    def _run(self, name, store, phones, verified_phones):
+        started = time.perf_counter()
+        codes = {phone: store.issue(phone, DEFAULT_TTL) for phone in phones}
+        issue_rate = len(phones) / (time.perf_counter() - started)
+        issued_entries, issued_bytes = self._cache_size()
+
+        started = time.perf_counter()
+        outcomes = [
+            store.verify(phone, codes[phone], MAX_ATTEMPTS, BLOCK_TTL, VERIFIED_TTL)[0]
+            for phone in verified_phones
+        ]
+        verify_rate = len(verified_phones) / (time.perf_counter() - started) if verified_phones else 0
+        verified_entries, verified_bytes = self._cache_size()
+
+        self.stdout.write(f"[{name}] {len(phones)} issued, {len(verified_phones)} verified")
+        self.stdout.write(f"  issue:  {issue_rate:10.0f} ops/s   cache: {issued_entries} entries, {issued_bytes / 1024:.1f} KiB")
+        self.stdout.write(f"  verify: {verify_rate:10.0f} ops/s   cache: {verified_entries} entries, {verified_bytes / 1024:.1f} KiB")
+        failed = sum(outcome != VERIFIED for outcome in outcomes)
+        if failed:
+            self.stdout.write(self.style.WARNING(f"  {failed} verifications failed"))
+
+    @staticmethod
+    def _cache_size():
+        entries = caches['default']._cache  # LocMemCache keeps pickled values keyed by the full key
+        return len(entries), sum(len(key) + len(value) for key, value in entries.items())
@@ -0,0 +1,44 @@
+# users/management/commands/bench_phone_lookup.py
+
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from account.phone_index import _key, phone_index
+
+
+class Command(BaseCommand):
+    """
+    Compare resolving an address book one phone at a time, as repeated check-phone
+    calls do, with the batch lookup behind `/auth/lookup-phones/`.
+
+    Runs against the configured database and cache, cold (phones evicted from the
+    cache) and warm. Only reads the User table; the phone cache entries are rewritten.
+    """
+    help = "Benchmark per-phone and batch phone membership lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phones', type=int, default=5000, help="Phones in the address book.")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Phones per IN query.")
+
+    def handle(self, *args, **options):
+        phones = [f"0912{i * 7919 % 10 ** 7:07d}" for i in range(options['phones'])]
+        modes = (
+            ('one by one', lambda: {phone: phone_index.exists(phone) for phone in phones}),
+            ('batch', lambda: phone_index.exists_many(phones, chunk_size=options['chunk_size'])),
+        )
+        for mode, lookup in modes:
+            for state in ('cold', 'warm'):
+                if state == 'cold':
+                    cache.delete_many([_key(phone) for phone in phones])
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    found = lookup()
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{mode:<12} {state:<5} {elapsed * 1000:9.1f}ms queries={len(queries.captured_queries):<6} "
+                    f"registered={sum(found.values())}"
+                )
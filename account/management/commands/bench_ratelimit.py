@@ -0,0 +1,83 @@
+# users/management/commands/bench_ratelimit.py
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from account.ratelimit import RateLimiter
+
+
+class Command(BaseCommand):
+    """
+    Contention benchmark for the rate limiter.
+
+    Many threads hit the same key at once; an exact limiter lets through exactly
+    `--limit` requests. The legacy cache get/set counter is run the same way for
+    comparison, showing the counts it loses to races.
+    """
+    help = "Check that the rate limiter stays exact under many parallel workers and measure its throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='account.ratelimit.InMemoryBackend', help="Rate limit backend class.")
+        parser.add_argument('--threads', type=int, default=64, help="Number of parallel workers.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests sent by each worker.")
+        parser.add_argument('--limit', type=int, default=1000, help="Sliding window limit under test.")
+        parser.add_argument('--policy', choices=['sliding_window', 'token_bucket'], default='sliding_window')
+
+    def handle(self, *args, **options):
+        backend = import_string(options['backend'])()
+        if options['policy'] == 'sliding_window':
+            policy = {'policy': 'sliding_window', 'limit': options['limit'], 'window': 3600, 'key': 'ip'}
+        else:
+            policy = {'policy': 'token_bucket', 'rate': 0.001, 'capacity': options['limit'], 'key': 'ip'}
+        limiter = RateLimiter(backend, {'bench': policy})
+        ip = uuid.uuid4().hex
+
+        allowed, elapsed = self._hammer(options, lambda: limiter.hit('bench', ip=ip).allowed)
+        total = options['threads'] * options['requests']
+        self.stdout.write(
+            f"limiter: {allowed} of {total} allowed (limit {options['limit']}), "
+            f"{total / elapsed:.0f} checks/s over {options['threads']} threads"
+        )
+        if allowed != min(options['limit'], total):
+            raise CommandError(f"Rate limiter is not exact: allowed {allowed}, expected {options['limit']}")
+
+        key = f"bench:legacy:{ip}"
+
+        def legacy_check():
+            # The old increase_attempt pattern: read, then write back count + 1
+            count = cache.get(key, 0)
+            if count >= options['limit']:
+                return False
+            cache.set(key, count + 1, timeout=3600)
+            return True
+
+        allowed, elapsed = self._hammer(options, legacy_check)
+        self.stdout.write(
+            f"legacy get/set: {allowed} of {total} allowed (limit {options['limit']}), "
+            f"{total / elapsed:.0f} checks/s"
+        )
+        cache.delete(key)
+
+    def _hammer(self, options, check):
+        allowed = [0] * options['threads']
+        barrier = threading.Barrier(options['threads'] + 1)
+
+        def worker(index):
+            barrier.wait()
+            for _ in range(options['requests']):
+                if check():
+                    allowed[index] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return sum(allowed), time.perf_counter() - started
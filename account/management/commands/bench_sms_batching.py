@@ -0,0 +1,126 @@
+# users/management/commands/bench_sms_batching.py
+
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from account.sms_client import SmsProviderClient
+from account.sms_providers import SmsIrProvider
+from account.sms_queue import SENT, SmsDispatchQueue, get_send_status
+
+from ._bench import format_summary, summarize
+
+
+class FakeSmsIrHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the sms.ir `send/verify` and `send/likeToLike` endpoints.
+
+    Each call sleeps the server's `latency` plus `per_message_latency` per recipient.
+    """
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path.endswith('/send/likeToLike'):
+            recipients = len(body['mobiles'])
+            data = {'packId': str(uuid.uuid4()), 'messageIds': [next(self.server.ids) for _ in range(recipients)]}
+        elif self.path.endswith('/send/verify'):
+            recipients = 1
+            data = {'messageId': next(self.server.ids)}
+        else:
+            self.send_error(404)
+            return
+        with self.server.lock:
+            self.server.calls += 1
+        time.sleep(self.server.latency + self.server.per_message_latency * recipients)
+        payload = json.dumps({'status': 1, 'message': 'ok', 'data': data}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """
+    Compare one-by-one and windowed batch SMS sending against a local fake sms.ir API.
+
+    Messages are enqueued at a steady campaign rate into a dispatch queue using the
+    real `SmsIrProvider` and pooled client, first sending each message on its own,
+    then in `likeToLike` bulk calls. Reports delivered messages/sec, provider calls
+    and the enqueue-to-sent latency the batching window adds.
+    """
+    help = "Measure SMS messages/sec and added latency of windowed bulk sending with a fake sms.ir endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help="Messages sent in each mode.")
+        parser.add_argument('--rate', type=float, default=1000, help="Messages enqueued per second, 0 for all at once.")
+        parser.add_argument('--workers', type=int, default=4, help="Queue worker threads.")
+        parser.add_argument('--window-ms', type=float, default=50, help="Batching window in milliseconds.")
+        parser.add_argument('--max-size', type=int, default=100, help="Messages per bulk call.")
+        parser.add_argument('--latency', type=float, default=0.05, help="Fake API latency per call in seconds.")
+        parser.add_argument('--per-message-latency', type=float, default=0.0002, help="Fake API latency per recipient.")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSmsIrHandler)
+        server.daemon_threads = True
+        server.latency = options['latency']
+        server.per_message_latency = options['per_message_latency']
+        server.ids = itertools.count(1)
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        caches = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'bench-sms-batching',
+                'OPTIONS': {'MAX_ENTRIES': options['messages'] * 4},  # Keep every status record
+            }
+        }
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        try:
+            with override_settings(SMS_IR_BASE_URL=base_url, SMS_IR_API_KEY='bench', CACHES=caches):
+                for mode, window in (('one by one', 0.0), ('batched', options['window_ms'] / 1000)):
+                    server.calls = 0
+                    self._run(mode, window, server, options)
+        finally:
+            server.shutdown()
+
+    def _run(self, mode, window, server, options):
+        client = SmsProviderClient(pool_maxsize=options['workers'])
+        dispatch = SmsDispatchQueue(
+            SmsIrProvider(client=client),
+            workers=options['workers'],
+            maxsize=options['messages'],
+            batch_window=window,
+            batch_max_size=options['max_size'],
+        )
+        dispatch.start()
+        interval = 1 / options['rate'] if options['rate'] else 0
+        send_ids = []
+        started = time.perf_counter()
+        for i in range(options['messages']):
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            send_ids.append(dispatch.enqueue(f"0912{i:07d}", "123456"))
+        dispatch.join()
+        elapsed = time.perf_counter() - started
+        dispatch.stop()
+
+        records = [get_send_status(send_id) for send_id in send_ids]
+        sent = [record for record in records if record and record['status'] == SENT]
+        self.stdout.write(f"[{mode}]")
+        self.stdout.write("  " + format_summary("queued -> sent", summarize([r['sent_at'] - r['queued_at'] for r in sent])))
+        self.stdout.write(
+            f"  {len(sent) / elapsed:.0f} msg/s, sent={len(sent)} failed={len(records) - len(sent)} "
+            f"provider_calls={server.calls} elapsed={elapsed:.2f}s"
+        )
@@ -0,0 +1,75 @@
+# users/management/commands/bench_sms_queue.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.sms_providers import FakeSmsProvider
+from account.sms_queue import SmsDispatchQueue
+
+from ._bench import format_summary, summarize
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the SMS dispatch queue offline against the fake SMS provider.
+    """
+    help = "Measure SMS dispatch queue throughput and end-to-end latency with a fake provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help="Number of messages to send.")
+        parser.add_argument('--workers', type=int, default=8, help="Number of queue worker threads.")
+        parser.add_argument('--latency', type=float, default=0.05, help="Fake provider latency in seconds.")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Extra random provider latency in seconds.")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Probability of a simulated failure.")
+        parser.add_argument('--backoff', type=float, default=0.01, help="Delay before the first retry in seconds.")
+
+    def handle(self, *args, **options):
+        provider = FakeSmsProvider(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            seed=0,
+        )
+        dispatch = SmsDispatchQueue(
+            provider,
+            workers=options['workers'],
+            backoff=options['backoff'],
+            maxsize=options['messages'],
+        )
+        dispatch.start()
+
+        # Record when each phone's message leaves the provider, successful sends only
+        delivered_at = {}
+        send = provider.send
+
+        def timed_send(phone_number, otp):
+            response_data = send(phone_number, otp)
+            delivered_at[phone_number] = time.perf_counter()
+            return response_data
+
+        provider.send = timed_send
+
+        enqueue_latencies = []
+        queued_at = {}
+        started = time.perf_counter()
+        for i in range(options['messages']):
+            phone = f"0912{i:07d}"
+            t0 = time.perf_counter()
+            dispatch.enqueue(phone, "123456")
+            enqueue_latencies.append(time.perf_counter() - t0)
+            queued_at[phone] = t0
+        dispatch.join()
+        elapsed = time.perf_counter() - started
+        dispatch.stop()
+
+        delivery_latencies = [delivered_at[phone] - queued_at[phone] for phone in delivered_at]
+        failed = len(queued_at) - len(delivered_at)
+
+        self.stdout.write(format_summary("enqueue (request path)", summarize(enqueue_latencies)))
+        self.stdout.write(format_summary("queued -> sent", summarize(delivery_latencies)))
+        self.stdout.write(
+            f"throughput: {len(delivery_latencies) / elapsed:.1f} msg/s, "
+            f"sent={len(delivery_latencies)} failed={failed} provider_failures={provider.failed} "
+            f"elapsed={elapsed:.2f}s"
+        )
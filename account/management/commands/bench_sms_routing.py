@@ -0,0 +1,90 @@
+# users/management/commands/bench_sms_routing.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from account.sms_providers import FakeSmsProvider, SmsDeliveryError
+from account.sms_router import SmsRouter
+
+from ._bench import format_summary, summarize
+
+
+class Command(BaseCommand):
+    """
+    Compare sending OTPs through a single provider with routing them over several.
+
+    Three fake providers stand in for real ones: "a" is fast with an occasional very
+    slow call, "b" is slower but steady, and "c" fails often. Halfway through each run,
+    "a" goes down. The same sends go through "a" alone, through the router without
+    hedging, and through the router with hedging. Reports send latency, failures, the
+    share of sends each provider won and the number of hedged sends.
+    """
+    help = "Benchmark latency-aware SMS routing, failover and hedging with fake providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=400, help="OTPs sent in each mode.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent senders.")
+        parser.add_argument('--hedge-ms', type=float, default=250, help="Hedging latency budget in milliseconds.")
+        parser.add_argument('--tail-rate', type=float, default=0.05, help="Share of provider a's calls that are slow.")
+        parser.add_argument('--no-outage', action='store_true', help="Keep provider a up for the whole run.")
+
+    def handle(self, *args, **options):
+        modes = (
+            ('single provider', None),
+            ('router', 0),
+            ('router + hedging', options['hedge_ms'] / 1000),
+        )
+        for mode, hedge_after in modes:
+            providers = self._providers(options['tail_rate'])
+            if hedge_after is None:
+                sender = providers['a']
+            else:
+                sender = SmsRouter(providers, hedge_after=hedge_after, max_workers=options['concurrency'] * 3, seed=0)
+            self._run(mode, sender, providers, options)
+
+    def _providers(self, tail_rate):
+        return {
+            'a': FakeSmsProvider(latency=0.03, jitter=0.01, tail_rate=tail_rate, tail_latency=1.0, seed=1),
+            'b': FakeSmsProvider(latency=0.08, jitter=0.02, seed=2),
+            'c': FakeSmsProvider(latency=0.05, jitter=0.01, failure_rate=0.6, seed=3),
+        }
+
+    def _run(self, mode, sender, providers, options):
+        total = options['messages']
+        latencies = []
+        failures = 0
+        won = {name: 0 for name in providers}
+
+        def send(i):
+            if i == total // 2 and not options['no_outage']:
+                providers['a'].failure_rate = 1.0  # Provider a goes down
+            started = time.perf_counter()
+            try:
+                result = sender.send(f"0912{i:07d}", "123456")
+            except SmsDeliveryError:
+                return time.perf_counter() - started, None
+            return time.perf_counter() - started, result.get('provider', 'a')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for elapsed, provider in executor.map(send, range(total)):
+                latencies.append(elapsed)
+                if provider is None:
+                    failures += 1
+                else:
+                    won[provider] += 1
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"[{mode}]")
+        self.stdout.write("  " + format_summary("send", summarize(latencies)))
+        share = ' '.join(f"{name}={count / total:.0%}" for name, count in won.items())
+        hedges = getattr(sender, 'hedges', 0)
+        self.stdout.write(f"  failed={failures} won: {share} hedges={hedges} elapsed={elapsed:.2f}s")
+        if isinstance(sender, SmsRouter):
+            for name, health in sender.stats()['providers'].items():
+                self.stdout.write(
+                    f"  {name}: latency={health['latency_ms']}ms error_rate={health['error_rate']} "
+                    f"healthy={health['healthy']} calls={health['calls']}"
+                )
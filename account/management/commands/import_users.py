@@ -0,0 +1,193 @@
+# users/management/commands/import_users.py
+
+import csv
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import identify_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from account.hashing import PasswordHasherPool
+from account.models import User
+from account.phone_index import phone_index
+from account.utils import normalize_phone
+
+PROFILE_FIELDS = ('first_name', 'last_name', 'email')
+
+
+class Command(BaseCommand):
+    """
+    Bulk import users from a CSV or JSONL file.
+
+    Each row needs `phone` and either `password` (hashed during the import across a
+    process pool) or `password_hash` (an already encoded Django password). `first_name`,
+    `last_name` and `email` are optional. Phones are normalized to the 09XXXXXXXXX form the
+    auth endpoints store and look up, and deduplicated; rows that are invalid, duplicated
+    or already registered are written to the conflicts report.
+
+    The number of input rows committed so far is kept in the checkpoint file, so an
+    interrupted import resumes where it stopped when run again with the same file.
+    """
+    help = "Stream users from CSV/JSONL into the User table with parallel hashing and batched inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with a header row) or JSONL file to import.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format, guessed from the extension if omitted.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows hashed and inserted per batch.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Hashing processes, 0 hashes inline.")
+        parser.add_argument('--checkpoint', help="Checkpoint file, defaults to <path>.checkpoint.")
+        parser.add_argument('--conflicts', help="Conflicts report (CSV), defaults to <path>.conflicts.csv.")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        conflicts_path = options['conflicts'] or f"{path}.conflicts.csv"
+
+        start_row = 0
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                start_row = int(f.read().strip() or 0)
+            self.stdout.write(f"Resuming after row {start_row}")
+
+        self.pool = PasswordHasherPool(workers=options['workers'])
+        self.seen = set()
+        self.totals = {'read': 0, 'inserted': 0, 'conflicts': 0}
+        self.started = time.perf_counter()
+
+        conflicts_mode = 'a' if start_row else 'w'
+        with open(conflicts_path, conflicts_mode, newline='') as conflicts_file:
+            self.conflicts = csv.writer(conflicts_file)
+            if not start_row:
+                self.conflicts.writerow(['row', 'phone', 'reason'])
+            batch = []
+            row_number = 0
+            try:
+                for row_number, row in self._rows(path, fmt):
+                    if row_number <= start_row:
+                        continue
+                    batch.append((row_number, row))
+                    if len(batch) >= options['batch_size']:
+                        self._import_batch(batch, checkpoint_path)
+                        batch = []
+                if batch:
+                    self._import_batch(batch, checkpoint_path)
+            finally:
+                self.pool.shutdown()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: read={self.totals['read']} inserted={self.totals['inserted']} "
+            f"conflicts={self.totals['conflicts']} in {elapsed:.1f}s "
+            f"({self.totals['inserted'] / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+        if self.totals['conflicts']:
+            self.stdout.write(f"Conflicts written to {conflicts_path}")
+
+    def _rows(self, path, fmt):
+        with open(path, newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                for row_number, row in enumerate(csv.DictReader(f), start=1):
+                    yield row_number, row
+            else:
+                for row_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        yield row_number, {}
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        yield row_number, {'_error': 'invalid JSON'}
+                        continue
+                    yield row_number, row if isinstance(row, dict) else {'_error': 'not a JSON object'}
+
+    def _import_batch(self, batch, checkpoint_path):
+        self.totals['read'] += len(batch)
+        candidates = []
+        for row_number, row in batch:
+            raw_phone = row.get('phone')
+            if row.get('_error'):
+                self._conflict(row_number, raw_phone, row['_error'])
+                continue
+            phone = normalize_phone(raw_phone)
+            if phone is None:
+                self._conflict(row_number, raw_phone, 'invalid phone')
+                continue
+            if phone in self.seen:
+                self._conflict(row_number, phone, 'duplicate in file')
+                continue
+            self.seen.add(phone)
+            password_hash = row.get('password_hash')
+            if password_hash:
+                if not isinstance(password_hash, str):
+                    self._conflict(row_number, phone, 'invalid password hash')
+                    continue
+                try:
+                    identify_hasher(password_hash)
+                except ValueError:
+                    self._conflict(row_number, phone, 'unknown password hash format')
+                    continue
+            elif not row.get('password'):
+                self._conflict(row_number, phone, 'missing password')
+                continue
+            elif not isinstance(row['password'], str):
+                self._conflict(row_number, phone, 'invalid password')
+                continue
+            candidates.append((row_number, phone, row))
+
+        existing = set(
+            User.objects.filter(phone__in=[phone for _, phone, _ in candidates]).values_list('phone', flat=True)
+        )
+        new_rows = []
+        for row_number, phone, row in candidates:
+            if phone in existing:
+                self._conflict(row_number, phone, 'already registered')
+            else:
+                new_rows.append((row_number, phone, row))
+
+        # Hash the plain-text passwords of the batch across the process pool
+        to_hash = [row['password'] for _, _, row in new_rows if not row.get('password_hash')]
+        hashed = iter(self.pool.make_passwords(to_hash))
+        users = [
+            User(
+                phone=phone,
+                password=row.get('password_hash') or next(hashed),
+                **{field: row.get(field) or '' for field in PROFILE_FIELDS},
+            )
+            for _, phone, row in new_rows
+        ]
+
+        with transaction.atomic():
+            # ignore_conflicts covers phones registered by live traffic since the check above
+            User.objects.bulk_create(users, batch_size=len(users) or 1, ignore_conflicts=True)
+            # Salted hashes are unique, so a row holding our hash is one we inserted
+            stored = dict(
+                User.objects.filter(phone__in=[user.phone for user in users]).values_list('phone', 'password')
+            )
+        inserted = []
+        for (row_number, _, _), user in zip(new_rows, users):
+            if stored.get(user.phone) == user.password:
+                inserted.append(user.phone)
+            else:
+                self._conflict(row_number, user.phone, 'registered during import')
+        phone_index.mark_many_registered(inserted)
+        self.totals['inserted'] += len(inserted)
+
+        with open(checkpoint_path, 'w') as f:
+            f.write(str(batch[-1][0]))
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"row {batch[-1][0]}: inserted={self.totals['inserted']} conflicts={self.totals['conflicts']} "
+            f"({self.totals['inserted'] / elapsed:.0f} rows/s)"
+        )
+
+    def _conflict(self, row_number, phone, reason):
+        self.totals['conflicts'] += 1
+        self.conflicts.writerow([row_number, phone, reason])
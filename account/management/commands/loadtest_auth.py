@@ -0,0 +1,222 @@
+# users/management/commands/loadtest_auth.py
+
+import json
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.test import override_settings
+
+from account.models import User
+from account.otp_store import CacheOtpStore, get_otp_store
+from account.utils import cache_is_shared
+
+from ._bench import format_summary, summarize
+
+ENDPOINTS = ('check-phone', 'verify', 'register', 'login', 'refresh', 'profile')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that does not log every request of the load test.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """
+    End-to-end load test of the /auth/ API.
+
+    Every virtual user repeatedly runs check-phone -> verify -> register -> login ->
+    refresh -> profile for a fresh phone number. OTP codes are read back from the OTP
+    store, so the server must use the fake SMS provider and share its store with this command.
+
+    By default a local threaded server is started in-process with the fake provider and
+    rate limiting disabled; `--url` targets an already running server instead, and is
+    refused while OTPs live in a process-local cache. Users the run registered are
+    deleted afterwards.
+
+    Results are printed and, with `--output`, written as JSON that `--compare` can diff
+    against a previous run.
+    """
+    help = "Load test every /auth/ route at configurable concurrency and report per-endpoint latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help="Virtual users running at the same time.")
+        parser.add_argument('--flows', type=int, default=200, help="Total signup flows to run.")
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Previous results JSON to compare against.")
+
+    def handle(self, *args, **options):
+        with ExitStack() as stack:
+            base_url = options['url']
+            if base_url and isinstance(get_otp_store(), CacheOtpStore) and not cache_is_shared():
+                raise CommandError(
+                    "--url needs the default cache shared with the server (e.g. Redis), or another "
+                    "OTP_STORE: OTP codes are read back from it, and this process's local-memory "
+                    "cache never sees the server's codes."
+                )
+            if not base_url:
+                stack.enter_context(override_settings(
+                    ALLOWED_HOSTS=['127.0.0.1'],
+                    RATE_LIMIT_ENABLED=False,
+                    SMS_PROVIDER='account.sms_providers.FakeSmsProvider',
+                    SMS_PROVIDER_OPTIONS={},
+                    SMS_PROVIDERS={},  # The registry takes precedence over SMS_PROVIDER
+                ))
+                base_url = self._start_server(stack)
+            results = self._run(base_url.rstrip('/'), options)
+
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self._compare(results, options['compare'])
+
+    def _start_server(self, stack):
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(get_internal_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        stack.callback(server.server_close)
+        stack.callback(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def _run(self, base_url, options):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        run_id = random.randint(100, 999)
+        phones = [f"09{run_id}{i:06d}" for i in range(options['flows'])]
+        remaining = iter(phones)
+        created = []  # Phones this run registered; the others may belong to real accounts
+
+        def call(session, method, endpoint, path, expected_status, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = session.request(method, f"{base_url}/auth/{path}", timeout=30, **kwargs)
+                ok = response.status_code == expected_status
+            except requests.RequestException:
+                response, ok = None, False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[endpoint].append(elapsed)
+                if not ok:
+                    errors[endpoint] += 1
+            return response.json() if ok else None
+
+        def flow(session, phone):
+            checked = call(session, 'POST', 'check-phone', 'check-phone/', 200, json={'phone': phone})
+            if checked is None or checked['exists']:  # An existing account is left alone
+                return
+            code = get_otp_store().get(phone).code
+            verified = call(session, 'POST', 'verify', 'verify/', 200, json={'phone': phone, 'code': code})
+            if verified is None:
+                return
+            registered = call(session, 'POST', 'register', 'register/', 201, json={
+                'registration_token': verified['registration_token'],
+                'password': 'loadtest-password',
+            })
+            if registered is None:
+                return
+            with lock:
+                created.append(phone)
+            logged_in = call(session, 'POST', 'login', 'login/', 200, json={
+                'phone': phone,
+                'password': 'loadtest-password',
+            })
+            if logged_in is None:
+                return
+            headers = {'Authorization': f"Bearer {logged_in['tokens']['access']}"}
+            call(session, 'POST', 'refresh', 'refresh/', 200, headers=headers,
+                 json={'refresh': logged_in['tokens']['refresh']})
+            call(session, 'GET', 'profile', 'profile/', 200, headers=headers)
+
+        def virtual_user():
+            session = requests.Session()
+            while True:
+                with lock:
+                    phone = next(remaining, None)
+                if phone is None:
+                    return
+                flow(session, phone)
+
+        threads = [threading.Thread(target=virtual_user) for _ in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        User.objects.filter(phone__in=created).delete()
+
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            summary = summarize(latencies[endpoint])
+            summary['errors'] = errors[endpoint]
+            summary['throughput_rps'] = round(summary['count'] / elapsed, 2)
+            endpoints[endpoint] = summary
+        return {
+            'meta': {
+                'commit': self._commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'target': base_url,
+                'concurrency': options['concurrency'],
+                'flows': options['flows'],
+                'elapsed_s': round(elapsed, 3),
+                'flows_per_s': round(options['flows'] / elapsed, 2),
+            },
+            'endpoints': endpoints,
+        }
+
+    def _report(self, results):
+        meta = results['meta']
+        self.stdout.write(
+            f"{meta['flows']} flows at concurrency {meta['concurrency']} against {meta['target']} "
+            f"in {meta['elapsed_s']}s ({meta['flows_per_s']} flows/s)"
+        )
+        for endpoint, summary in results['endpoints'].items():
+            self.stdout.write(
+                f"{format_summary(endpoint, summary)} rps={summary['throughput_rps']} errors={summary['errors']}"
+            )
+
+    def _compare(self, results, path):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        self.stdout.write(f"Compared with {path} (commit {baseline['meta'].get('commit')}):")
+        for endpoint, summary in results['endpoints'].items():
+            before = baseline['endpoints'].get(endpoint)
+            if not before:
+                continue
+            changes = []
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+                if before[metric]:
+                    change = (summary[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f"{metric} {change:+.1f}%")
+            self.stdout.write(f"  {endpoint:<12} " + "  ".join(changes))
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
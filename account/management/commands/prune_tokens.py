@@ -0,0 +1,45 @@
+# users/management/commands/prune_tokens.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.token_maintenance import (
+    PRUNE_BATCH_SIZE, PRUNE_PAUSE, get_token_buffer, prune_expired_tokens, token_table_rows,
+)
+
+
+class Command(BaseCommand):
+    """
+    Delete expired outstanding and blacklisted JWT tokens in bounded batches.
+
+    A bounded, throttled replacement for simplejwt's `flushexpiredtokens`, which
+    deletes every expired token in one statement. Run it from cron, or keep it
+    running with `--every`.
+    """
+    help = "Prune expired outstanding/blacklisted tokens in small batches and report the token table sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help="Tokens deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=PRUNE_PAUSE, help="Seconds to sleep after each transaction.")
+        parser.add_argument('--limit', type=int, help="Stop after this many outstanding tokens.")
+        parser.add_argument('--every', type=float, help="Keep running, pruning every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            self._prune(options)
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def _prune(self, options):
+        get_token_buffer().flush()
+        started = time.perf_counter()
+        totals = prune_expired_tokens(batch_size=options['batch_size'], pause=options['pause'], limit=options['limit'])
+        elapsed = time.perf_counter() - started
+        rows = token_table_rows()
+        self.stdout.write(
+            f"Pruned {totals['outstanding']} outstanding and {totals['blacklisted']} blacklisted tokens "
+            f"in {elapsed:.2f}s ({totals['outstanding'] / elapsed if elapsed else 0:.0f} tokens/s); "
+            f"~{rows[('outstanding',)]} outstanding and ~{rows[('blacklisted',)]} blacklisted remain"
+        )
@@ -0,0 +1,34 @@
+# users/management/commands/purge_deleted_users.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.deletion import purge_deleted_users
+
+
+class Command(BaseCommand):
+    """
+    Remove the rows of deleted accounts in throttled batches. Run it periodically
+    (e.g. from cron); deletion itself only deactivates the account.
+    """
+    help = "Purge deleted users with their tokens and permissions in small, throttled batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Users, and tokens, deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep after each transaction.")
+        parser.add_argument('--grace', type=int, default=0, help="Only purge users deleted at least this many seconds ago.")
+        parser.add_argument('--limit', type=int, help="Stop after this many users.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = purge_deleted_users(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            grace=options['grace'],
+            limit=options['limit'],
+            progress=lambda totals: self.stdout.write(f"  {totals['users']} users, {totals['tokens']} tokens"),
+        )
+        self.stdout.write(
+            f"Purged {totals['users']} users and {totals['tokens']} tokens in {time.perf_counter() - started:.2f}s"
+        )
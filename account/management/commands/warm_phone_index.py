@@ -0,0 +1,22 @@
+# users/management/commands/warm_phone_index.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.phone_index import phone_index
+
+
+class Command(BaseCommand):
+    """
+    Load every registered phone number into the phone index cache.
+    """
+    help = "Warm the phone-existence cache from the User table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Phones written to the cache at once.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        loaded = phone_index.warm(batch_size=options['batch_size'])
+        self.stdout.write(f"Loaded {loaded} phones in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,306 @@
+# users/metrics.py
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKGROUND = 'background'  # Endpoint label for stages timed outside a request, e.g. SMS sends
+
+logger = logging.getLogger(__name__)
+
+_request_stages = ContextVar('request_stages', default=None)
+
+
+class Histogram:
+    """
+    Thread-safe histogram with labelled series, exported in the Prometheus text format.
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): The metric name.
+            documentation (str): The HELP text.
+            labelnames (tuple): Label names, in the order label values are passed to `observe`.
+            buckets (tuple): Sorted upper bounds of the buckets, in seconds.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # Label values -> [bucket counts (last one is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """
+        Record one observation.
+
+        Args:
+            labels (tuple): Label values matching `labelnames`.
+            value (float): The observed value, in seconds.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        Return the histogram in the Prometheus text exposition format.
+
+        Returns:
+            list: The lines of the metric family.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series[0]), series[1], series[2]) for labels, series in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            label_text = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{label_text + ',' if label_text else ''}{le}}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Thread-safe counter with labelled series, exported in the Prometheus text format.
+    """
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{{{_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Thread-safe gauge with labelled series, exported in the Prometheus text format.
+
+    Values are either set directly or, when a `collect` function is given, read from
+    it at export time (for values owned by another process, such as table sizes).
+    """
+
+    def __init__(self, name, documentation, labelnames, collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect  # Called at export time, returns {label values: value}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def set(self, labels, value):
+        with self._lock:
+            self._series[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            series = dict(self._series)
+        if self.collect is not None:
+            try:
+                series.update(self.collect())
+            except Exception:  # An unavailable source must not break the export
+                logger.exception("Collecting %s failed", self.name)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{{{_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_buckets = tuple(getattr(settings, 'METRICS_BUCKETS', DEFAULT_BUCKETS))
+
+request_duration = Histogram(
+    'auth_request_duration_seconds', "Time spent handling a request.", ('endpoint', 'method'), _buckets
+)
+stage_duration = Histogram(
+    'auth_stage_duration_seconds', "Time spent in each stage (db, cache, hash, jwt, sms) per request.",
+    ('endpoint', 'stage'), _buckets,
+)
+requests_total = Counter('auth_requests_total', "Requests handled, by response status.", ('endpoint', 'status'))
+
+tokens_pruned = Counter(
+    'auth_tokens_pruned_total', "Expired outstanding and blacklisted tokens deleted by this process.", ('table',)
+)
+tokens_written = Counter(
+    'auth_outstanding_tokens_written_total', "Outstanding-token rows inserted, one by one or in buffered batches.", ('mode',)
+)
+token_buffer_size = Gauge('auth_outstanding_token_buffer', "Outstanding-token rows waiting to be written.", ())
+token_rows = Gauge('auth_token_table_rows', "Estimated rows of the token tables.", ('table',))
+
+sms_provider_duration = Histogram(
+    'auth_sms_provider_duration_seconds', "Time spent in each SMS provider call.", ('provider', 'outcome'), _buckets
+)
+sms_hedges = Counter('auth_sms_hedged_sends_total', "Sends also tried on a second provider after the latency budget.", ())
+
+admission_active = Gauge('auth_admission_active_requests', "Requests being handled, per admission group.", ('group',))
+admission_waiting = Gauge('auth_admission_waiting_requests', "Requests waiting for a slot, per admission group.", ('group',))
+admission_wait = Histogram(
+    'auth_admission_wait_seconds', "Time admitted requests waited for a slot.", ('group',), _buckets
+)
+admission_rejected = Counter(
+    'auth_admission_rejected_total', "Requests shed with a 503, by admission group and reason.", ('group', 'reason')
+)
+
+REGISTRY = (
+    request_duration, stage_duration, requests_total,
+    tokens_pruned, tokens_written, token_buffer_size, token_rows,
+    sms_provider_duration, sms_hedges,
+    admission_active, admission_waiting, admission_wait, admission_rejected,
+)
+
+
+class RequestStages:
+    """
+    Stage timings collected while one request is handled.
+    """
+    __slots__ = ('durations',)
+
+    def __init__(self):
+        self.durations = {}  # Stage -> seconds
+
+    def add(self, stage, seconds):
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+
+def begin_request():
+    """
+    Start collecting stage timings for the current request.
+
+    Returns:
+        tuple: The context variable token for `end_request` and the `RequestStages`.
+    """
+    stages = RequestStages()
+    return _request_stages.set(stages), stages
+
+
+def end_request(token, stages, endpoint, method, status, elapsed):
+    """
+    Stop collecting stage timings and add the request to the histograms.
+
+    Args:
+        token (Token): The token returned by `begin_request`.
+        stages (RequestStages): The stages collected for the request.
+        endpoint (str): The matched URL route, used as the endpoint label.
+        method (str): The HTTP method.
+        status (int): The response status code.
+        elapsed (float): Total seconds spent on the request.
+    """
+    _request_stages.reset(token)
+    request_duration.observe((endpoint, method), elapsed)
+    requests_total.inc((endpoint, str(status)))
+    for stage, seconds in stages.durations.items():
+        stage_duration.observe((endpoint, stage), seconds)
+
+
+def record(stage, seconds):
+    """
+    Add time spent in a stage to the current request, or straight to the histograms
+    when no request is being handled (background threads).
+
+    Args:
+        stage (str): The stage name, e.g. "db".
+        seconds (float): Time spent in the stage.
+    """
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.add(stage, seconds)
+    else:
+        stage_duration.observe((BACKGROUND, stage), seconds)
+
+
+class timed:
+    """
+    Context manager that records the time spent in its block as a stage.
+
+    Usage:
+        with timed('hash'):
+            ...
+    """
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper recording every query under the "db" stage.
+    Installed on each connection by `account.signals`.
+    """
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', time.perf_counter() - started)
+
+
+def server_timing(stages, total):
+    """
+    Format the stages of a request as `Server-Timing` header entries.
+
+    Args:
+        stages (RequestStages): The stages collected for the request.
+        total (float): Total seconds spent on the request.
+
+    Returns:
+        str: The header value, e.g. "db;dur=1.2, cache;dur=0.3, total;dur=4.1".
+    """
+    entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in stages.durations.items()]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+def render():
+    """
+    Return every metric of this process in the Prometheus text exposition format.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,141 @@
+# users/middleware.py
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+from . import metrics
+from .admission import AdmissionRejected, get_admission_controller
+
+
+class StageTimingMiddleware:
+    """
+    Times every request and the stages (db, cache, hash, jwt, ...) it spends time in.
+
+    The totals are added to the process's histograms, exported at `/metrics`, and
+    returned to the client in the `Server-Timing` header, after any entries the view
+    set itself. Stages may nest, e.g. the "db" time of token creation is also part of "jwt".
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token, stages = metrics.begin_request()
+        response = self.get_response(request)
+        return self._finish(request, response, token, stages, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token, stages = metrics.begin_request()
+        response = await self.get_response(request)
+        return self._finish(request, response, token, stages, started)
+
+    def _finish(self, request, response, token, stages, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        endpoint = match.route if match else 'unmatched'  # Routes keep the label set bounded
+        metrics.end_request(token, stages, endpoint, request.method, response.status_code, elapsed)
+        if self.server_timing:
+            timing = metrics.server_timing(stages, elapsed)
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds load on the endpoint groups of `ADMISSION_LIMITS` before it piles up.
+
+    Each request to a grouped route waits for a slot of its group, as decided by the
+    `AdmissionController`, and is answered with a 503 and `Retry-After` when shed.
+    Requests to other routes pass through. The group comes from the route Django has
+    already resolved, so the slot is taken in `process_view`, before any other view
+    middleware, and freed once the response is back. Place it right after
+    `StageTimingMiddleware`, so shed requests are still counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.controller, self.routes = get_admission_controller()
+        if self.controller is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view  # Queued async requests wait without a thread
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self._release(request)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            self._release(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        group = self._group(request)
+        if group is None:
+            return None
+        try:
+            waited = self.controller.acquire(group)
+        except AdmissionRejected as e:
+            return self._reject(e)
+        self._admitted(request, group, waited)
+        return None
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        group = self._group(request)
+        if group is None:
+            return None
+        try:
+            waited = await self.controller.aacquire(group)
+        except AdmissionRejected as e:
+            return self._reject(e)
+        self._admitted(request, group, waited)
+        return None
+
+    def _group(self, request):
+        group = self.routes.get(request.resolver_match.route)
+        if group is None:
+            return None
+        methods = self.controller.limits[group].methods
+        if methods is not None and request.method not in methods:
+            return None
+        return group
+
+    def _admitted(self, request, group, waited):
+        metrics.record('admission', waited)
+        request._admission = (group, time.perf_counter())  # Freed by __call__ once the response is back
+
+    def _release(self, request):
+        admission = getattr(request, '_admission', None)
+        if admission is not None:
+            group, started = admission
+            self.controller.release(group, time.perf_counter() - started)
+
+    def _reject(self, error):
+        return JsonResponse(
+            {"error": "Server is busy. Please try again later."}, status=503,
+            headers={'Retry-After': str(error.retry_after)},
+        )
@@ -3,6 +3,8 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 
+from .hashing import get_hasher_pool
+
 
 class UserManager(BaseUserManager):
     """
@@ -15,10 +17,27 @@ class UserManager(BaseUserManager):
         if not phone:
             raise ValueError("Phone number is required")
         user = self.model(phone=phone, **extra_fields)
-        user.set_password(password)  # Securely set the user's password
+        if password is None:
+            user.set_unusable_password()
+        else:
+            user.password = get_hasher_pool().make_password(password)  # Hash on the bounded hashing pool
         user.save(using=self._db)
         return user
 
+    async def acreate_user(self, phone, password=None, **extra_fields):
+        """
+        Async version of `create_user`; the password is hashed on the bounded hashing pool.
+        """
+        if not phone:
+            raise ValueError("Phone number is required")
+        user = self.model(phone=phone, **extra_fields)
+        if password is None:
+            user.set_unusable_password()
+        else:
+            user.password = await get_hasher_pool().amake_password(password)
+        await user.asave(using=self._db)
+        return user
+
     def create_superuser(self, phone, password=None, **extra_fields):
         """
         Create and return a superuser with phone number, password, and staff permissions.
@@ -43,6 +62,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Fields for user permissions and roles
     is_staff = models.BooleanField(default=False)  # Designates whether the user is a staff member
     is_superuser = models.BooleanField(default=False)  # Designates whether the user is a superuser
+    is_active = models.BooleanField(default=True)  # False once the account is deleted; tokens stop authenticating
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)  # When the account was deleted, awaiting purge
+
+    # Incremented on every profile change; invalidates profile snapshots embedded in access tokens
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)  # Last-Modified of the profile
 
     objects = UserManager()  # Use the custom manager for user creation
 
@@ -50,3 +75,61 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'phone'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'email']  # Fields required during user creation
 
+    _loaded_values = None  # Column values as last loaded or saved, None until then
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the loaded column values so `save` can tell which ones changed.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._remember_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_values(fields)
+
+    def get_dirty_fields(self):
+        """
+        Return the fields whose values differ from the last load or save.
+
+        Returns:
+            list: Names of the changed fields; fields that were never loaded count as
+            changed once assigned.
+        """
+        loaded = self._loaded_values or {}
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname])
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        """
+        Save only the changed columns of an existing user, and skip the query entirely
+        when nothing changed. New users and explicit `update_fields` save as usual.
+        """
+        if update_fields is None and not self._state.adding and self._loaded_values is not None:
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            update_fields = dirty + [name for name in self._auto_now_fields() if name not in dirty]
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._remember_values(update_fields)
+
+    def _remember_values(self, fields=None):
+        if self._loaded_values is None:
+            self._loaded_values = {}
+        if fields is None:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        for attname in attnames:
+            if attname in self.__dict__:
+                self._loaded_values[attname] = self.__dict__[attname]
+
+    @classmethod
+    def _auto_now_fields(cls):
+        return [field.name for field in cls._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
@@ -0,0 +1,423 @@
+# users/otp_store.py
+
+import base64
+import hmac
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+
+import pyotp
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+
+from .redis_client import get_redis
+from .utils import ascii_digits
+
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+BLOCKED = 'blocked'
+
+OtpState = namedtuple('OtpState', ['code', 'expires_at', 'attempts', 'blocked_until', 'verified'])
+OtpState.__doc__ = """
+OTP state of one phone number, stored as a single record.
+
+Attributes:
+    code (str): The pending code, None once used, expired into a block or never issued.
+    expires_at (float): Unix time the code expires at.
+    attempts (int): Wrong codes entered for the pending code.
+    blocked_until (float): Unix time verification is blocked until, 0 if not blocked.
+    verified (bool): Whether the last code was verified.
+"""
+
+EMPTY_STATE = OtpState(None, 0.0, 0, 0.0, False)
+
+
+class OtpBlockedError(Exception):
+    """
+    Raised when an OTP is requested for a phone that is blocked after too many wrong codes.
+
+    Attributes:
+        retry_after (int): Seconds until the block ends.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"Phone is blocked for {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+def generate_code():
+    """
+    Return a random 6-digit code.
+    """
+    return str(random.randint(100000, 999999))
+
+
+def normalize_code(code):
+    """
+    Return an entered code with Persian and Arabic-Indic digits made ASCII and
+    surrounding whitespace removed, ready for a constant-time comparison.
+
+    Args:
+        code (str): The code entered by the user, possibly None.
+
+    Returns:
+        str: The normalized code.
+    """
+    return ascii_digits(code or '').strip()
+
+
+def _retry_after(blocked_until, now):
+    return max(math.ceil(blocked_until - now), 1)
+
+
+class CacheOtpStore:
+    """
+    OTP store keeping each phone's state as one record in the Django cache.
+
+    Updates are a get and a set under a lock striped by phone, so they are atomic
+    within the process. Use `RedisOtpStore` when several worker processes share
+    the same phones.
+    """
+
+    def __init__(self, prefix='otp', stripes=64):
+        """
+        Args:
+            prefix (str): Prefix of the record keys.
+            stripes (int): Number of locks phones are spread over.
+        """
+        self.prefix = prefix
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _key(self, phone):
+        return f"{self.prefix}:{phone}"
+
+    def _lock(self, phone):
+        return self._locks[hash(phone) % len(self._locks)]
+
+    def get(self, phone):
+        """
+        Return the current state of the phone.
+
+        Args:
+            phone (str): The phone number.
+
+        Returns:
+            OtpState: The stored state, `EMPTY_STATE` if there is none.
+        """
+        record = cache.get(self._key(phone))
+        return OtpState(*record) if record else EMPTY_STATE
+
+    def issue(self, phone, ttl):
+        """
+        Generate and store a new code for the phone, resetting its wrong attempts.
+
+        Args:
+            phone (str): The phone number.
+            ttl (int): Seconds the code stays valid.
+
+        Returns:
+            str: The code to send to the phone.
+
+        Raises:
+            OtpBlockedError: If the phone is blocked; the block is kept.
+        """
+        code = generate_code()
+        now = time.time()
+        with self._lock(phone):
+            state = self.get(phone)
+            if state.blocked_until > now:
+                raise OtpBlockedError(_retry_after(state.blocked_until, now))
+            cache.set(self._key(phone), tuple(OtpState(code, now + ttl, 0, 0.0, False)), timeout=ttl)
+        return code
+
+    def verify(self, phone, code, max_attempts, block_ttl, verified_ttl):
+        """
+        Check a code and update the phone's state in one step.
+
+        A correct code is consumed so it cannot be replayed. The `max_attempts`-th wrong
+        code discards the pending code and blocks the phone for `block_ttl` seconds.
+
+        Args:
+            phone (str): The phone number.
+            code (str): The code entered by the user.
+            max_attempts (int): Wrong codes allowed before the phone is blocked.
+            block_ttl (int): Seconds the phone stays blocked.
+            verified_ttl (int): Seconds the verified flag is kept.
+
+        Returns:
+            tuple: The outcome (VERIFIED, INVALID, EXPIRED or BLOCKED) and the seconds
+            until the block ends (0 unless blocked).
+        """
+        now = time.time()
+        key = self._key(phone)
+        with self._lock(phone):
+            state = self.get(phone)
+            if state.blocked_until > now:
+                return BLOCKED, _retry_after(state.blocked_until, now)
+            if not state.code or state.expires_at <= now:
+                return EXPIRED, 0
+            if hmac.compare_digest(normalize_code(code).encode(), state.code.encode()):
+                cache.set(key, tuple(OtpState(None, 0.0, 0, 0.0, True)), timeout=verified_ttl)
+                return VERIFIED, 0
+            attempts = state.attempts + 1
+            if attempts >= max_attempts:
+                cache.set(key, tuple(OtpState(None, 0.0, attempts, now + block_ttl, False)), timeout=block_ttl)
+                return BLOCKED, block_ttl
+            cache.set(key, tuple(state._replace(attempts=attempts)), timeout=math.ceil(state.expires_at - now))
+            return INVALID, 0
+
+
+ISSUE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'b') or '0')
+if blocked > now then
+    return tostring(blocked - now)
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'c', ARGV[2], 'e', tostring(now + tonumber(ARGV[3])), 'a', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return '0'
+"""
+
+VERIFY_SCRIPT = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'c', 'e', 'b')
+local blocked = tonumber(state[3] or '0')
+if blocked > now then
+    return {'blocked', tostring(blocked - now)}
+end
+if not state[1] or state[1] == '' or tonumber(state[2] or '0') <= now then
+    return {'expired', '0'}
+end
+if state[1] == ARGV[2] then
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'v', 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return {'verified', '0'}
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'a', 1)
+if attempts >= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'c', '', 'b', tostring(now + tonumber(ARGV[4])))
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return {'blocked', ARGV[4]}
+end
+return {'invalid', '0'}
+"""
+
+
+class RedisOtpStore:
+    """
+    OTP store keeping each phone's state as one Redis hash, shared by every worker and host.
+
+    Issuing and verifying are each a single Lua script call, which Redis runs atomically.
+    """
+
+    def __init__(self, url=None, prefix='otp'):
+        """
+        Args:
+            url (str): Redis connection URL, `settings.REDIS_URL` if omitted.
+            prefix (str): Prefix of the record keys.
+        """
+        self.client = get_redis(url)
+        self.prefix = prefix
+        self._issue = self.client.register_script(ISSUE_SCRIPT)
+        self._verify = self.client.register_script(VERIFY_SCRIPT)
+
+    def _key(self, phone):
+        return f"{self.prefix}:{phone}"
+
+    def get(self, phone):
+        """
+        See `CacheOtpStore.get`.
+        """
+        record = {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in self.client.hgetall(self._key(phone)).items()
+        }
+        if not record:
+            return EMPTY_STATE
+        return OtpState(
+            record.get('c') or None,
+            float(record.get('e', 0)),
+            int(record.get('a', 0)),
+            float(record.get('b', 0)),
+            record.get('v') == '1',
+        )
+
+    def issue(self, phone, ttl):
+        """
+        See `CacheOtpStore.issue`.
+        """
+        code = generate_code()
+        blocked_for = float(self._issue(keys=[self._key(phone)], args=[time.time(), code, ttl]))
+        if blocked_for > 0:
+            raise OtpBlockedError(max(math.ceil(blocked_for), 1))
+        return code
+
+    def verify(self, phone, code, max_attempts, block_ttl, verified_ttl):
+        """
+        See `CacheOtpStore.verify`.
+        """
+        outcome, retry_after = self._verify(
+            keys=[self._key(phone)],
+            args=[time.time(), normalize_code(code), max_attempts, block_ttl, verified_ttl],
+        )
+        outcome = outcome.decode() if isinstance(outcome, bytes) else outcome
+        return outcome, (max(math.ceil(float(retry_after)), 1) if outcome == BLOCKED else 0)
+
+
+class TotpOtpStore:
+    """
+    Stateless OTP engine deriving each phone's code from a per-phone secret and the
+    current time step (RFC 6238 TOTP), so issuing a code writes nothing.
+
+    The per-phone secret is an HMAC of the phone keyed by `SECRET_KEY`. A code is
+    accepted during its own step and the `valid_steps` steps after it. Verifying a
+    correct code adds a small used-code marker so it cannot be replayed; wrong codes
+    are counted in the cache and block the phone like the stored engines do. Every
+    process and replica derives the same codes, so only the markers are shared.
+
+    A code requested after the current step's code was used is the next step's code,
+    which is accepted one step early, so a user never gets a spent code back.
+    """
+
+    def __init__(self, prefix='otp', step=60, valid_steps=None, digits=6):
+        """
+        Args:
+            prefix (str): Prefix of the marker and counter keys.
+            step (int): Length of a time step in seconds.
+            valid_steps (int): Steps a code stays valid after its own, derived from
+                `CACHE_TTL` if omitted.
+            digits (int): Code length.
+        """
+        self.prefix = prefix
+        self.step = step
+        if valid_steps is None:
+            valid_steps = math.ceil(getattr(settings, 'CACHE_TTL', 300) / step)
+        self.valid_steps = valid_steps
+        self.digits = digits
+
+    def _totp(self, phone):
+        digest = salted_hmac('account.otp_store.TotpOtpStore', phone, algorithm='sha256').digest()
+        return pyotp.TOTP(base64.b32encode(digest).decode(), digits=self.digits, interval=self.step)
+
+    def _counter(self, now):
+        return int(now // self.step)
+
+    def get(self, phone):
+        """
+        Return the phone's current code and counters.
+
+        Args:
+            phone (str): The phone number.
+
+        Returns:
+            OtpState: The code of the current step and the wrong attempt and block state.
+        """
+        counter = self._counter(time.time())
+        values = cache.get_many([self._attempts_key(phone), self._block_key(phone)])
+        return OtpState(
+            self._totp(phone).generate_otp(counter),
+            (counter + 1 + self.valid_steps) * self.step,
+            values.get(self._attempts_key(phone), 0),
+            values.get(self._block_key(phone), 0.0),
+            False,
+        )
+
+    def issue(self, phone, ttl):
+        """
+        Return the code of the current time step, or of the next one if the current
+        code was already used. Nothing is written; `ttl` is unused because validity
+        is fixed by `step` and `valid_steps`.
+
+        Args:
+            phone (str): The phone number.
+            ttl (int): Unused.
+
+        Returns:
+            str: The code to send to the phone.
+
+        Raises:
+            OtpBlockedError: If the phone is blocked, or both codes were used; the
+                latter lasts until the step ends.
+        """
+        now = time.time()
+        current = self._counter(now)
+        keys = [self._block_key(phone), self._used_key(phone, current), self._used_key(phone, current + 1)]
+        values = cache.get_many(keys)
+        blocked_until = values.get(keys[0], 0.0)
+        if blocked_until > now:
+            raise OtpBlockedError(_retry_after(blocked_until, now))
+        if keys[1] not in values:
+            return self._totp(phone).generate_otp(current)
+        if keys[2] not in values:
+            return self._totp(phone).generate_otp(current + 1)
+        raise OtpBlockedError(_retry_after((current + 1) * self.step, now))
+
+    def verify(self, phone, code, max_attempts, block_ttl, verified_ttl):
+        """
+        See `CacheOtpStore.verify`. A correct code costs one block check and one
+        `add` of its used-code marker.
+        """
+        now = time.time()
+        blocked_until = cache.get(self._block_key(phone), 0.0)
+        if blocked_until > now:
+            return BLOCKED, _retry_after(blocked_until, now)
+
+        code = normalize_code(code).encode()
+        totp = self._totp(phone)
+        current = self._counter(now)
+        for counter in range(current + 1, current - self.valid_steps - 1, -1):  # The next step's code may be issued early
+            if hmac.compare_digest(totp.generate_otp(counter).encode(), code):
+                # The marker lives as long as the code could still be accepted
+                marker_ttl = (counter + 1 + self.valid_steps) * self.step - now
+                if cache.add(self._used_key(phone, counter), 1, timeout=math.ceil(marker_ttl)):
+                    return VERIFIED, 0
+                return EXPIRED, 0  # Already used
+
+        attempts_key = self._attempts_key(phone)
+        cache.add(attempts_key, 0, timeout=block_ttl)
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:  # Expired between add and incr
+            cache.set(attempts_key, 1, timeout=block_ttl)
+            attempts = 1
+        if attempts >= max_attempts:
+            cache.set(self._block_key(phone), now + block_ttl, timeout=block_ttl)
+            cache.delete(attempts_key)
+            return BLOCKED, block_ttl
+        return INVALID, 0
+
+    def _used_key(self, phone, counter):
+        return f"{self.prefix}:used:{phone}:{counter}"
+
+    def _attempts_key(self, phone):
+        return f"{self.prefix}:wrong:{phone}"
+
+    def _block_key(self, phone):
+        return f"{self.prefix}:block:{phone}"
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """
+    Return the process-wide OTP store, building it from settings on first use.
+
+    Returns:
+        CacheOtpStore or RedisOtpStore: The shared OTP store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_class = import_string(getattr(settings, 'OTP_STORE', 'account.otp_store.CacheOtpStore'))
+                _store = store_class(**getattr(settings, 'OTP_STORE_OPTIONS', {}))
+    return _store
@@ -1,16 +1,29 @@
 # users/otp_utils.py
 
-import random
-import requests
-from django.core.cache import cache
+import math
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from .otp_store import BLOCKED, EXPIRED, VERIFIED, get_otp_store
+from .sms_queue import FAILED, QUEUED, get_dispatch_queue, get_send_status
 
 DEFAULT_TTL = getattr(settings, 'CACHE_TTL', 300)  # Default time-to-live for OTP cache
+MAX_ATTEMPTS = getattr(settings, 'OTP_MAX_ATTEMPTS', 3)  # Wrong codes before the phone is blocked
+BLOCK_TTL = getattr(settings, 'OTP_BLOCK_TTL', 3600)  # Seconds a phone stays blocked
+VERIFIED_TTL = getattr(settings, 'OTP_VERIFIED_TTL', 600)  # Seconds the verified flag is kept
+RESEND_COOLDOWN = getattr(settings, 'OTP_RESEND_COOLDOWN', 60)  # Seconds a sent code is reused instead of re-sent
+
+
+def _resend_key(phone_number):
+    return f"otp:resend:{phone_number}"
 
 
 def generate_otp(phone_number):
     """
-    Generate a 6-digit OTP and store it in the cache with the phone number as the key.
+    Generate a 6-digit OTP and store it in the phone's OTP record.
 
     Args:
         phone_number (str): The phone number to associate the OTP with.
@@ -19,93 +32,147 @@ def generate_otp(phone_number):
         str: The generated OTP.
 
     Raises:
-        ValueError: If there is an error while generating the OTP.
+        OtpBlockedError: If the phone is blocked after too many wrong codes.
     """
-    try:
-        otp = str(random.randint(100000, 999999))  # Generate a 6-digit OTP
-        otp_key = f"otp:{phone_number}"  # Cache key for OTP
-        cache.set(otp_key, otp, timeout=DEFAULT_TTL)  # Store OTP in cache for the default TTL
-        return otp
-    except Exception as e:
-        raise ValueError(f"Error generating OTP: {e}")
+    return get_otp_store().issue(phone_number, DEFAULT_TTL)  # Replaces any pending code, keeps a block
+
+
+def pending_send(phone_number):
+    """
+    Return the phone's last send while it is within the resend cooldown.
+
+    A send whose delivery failed for good does not hold the cooldown.
+
+    Args:
+        phone_number (str): The phone number.
+
+    Returns:
+        dict: The send identifier, its status and `resend_in` (seconds left in the
+        cooldown), or None if a new code may be sent.
+    """
+    marker = cache.get(_resend_key(phone_number))
+    if marker is None:
+        return None
+    resend_in = math.ceil(marker['expires_at'] - time.time())
+    if resend_in <= 0:
+        return None
+    record = get_send_status(marker['send_id'])
+    status = record['status'] if record else QUEUED
+    if status == FAILED:
+        return None
+    return {"send_id": marker['send_id'], "status": status, "resend_in": resend_in, "reused": True}
 
 
 def send_otp_sms(phone_number):
     """
-    Generate an OTP and send it via SMS to the specified phone number.
+    Generate an OTP and queue it for delivery via SMS to the specified phone number.
+
+    Sends are single-flight per phone: the first request claims the phone's resend
+    cooldown (`OTP_RESEND_COOLDOWN`) with an atomic cache add, and requests arriving
+    during the cooldown, concurrent or retried, get that send back instead of a new
+    code and SMS. The code already sent stays valid, so nothing is lost.
+
+    The SMS itself is sent by the background dispatch queue, so this returns as soon
+    as the OTP is stored and the message is queued.
 
     Args:
         phone_number (str): The phone number to send the OTP to.
 
     Returns:
-        dict: The response data from the SMS service.
+        dict: The send identifier, its status, `resend_in` (seconds until a new code
+        can be sent) and `reused` (True if an earlier send was returned).
 
     Raises:
-        Exception: If there is an error sending the OTP via SMS.
+        OtpBlockedError: If the phone is blocked after too many wrong codes.
+        QueueFullError: If the dispatch queue cannot accept more messages.
     """
-    otp = generate_otp(phone_number)  # Generate the OTP
-    url, headers, payload = make_requests(phone_number, otp)  # Prepare the request data for SMS API
-    url1, headers1, payload1 = make_requests("09102664392", "testshod")
-    requests.post(url1, headers=headers1, json=payload1)
-    # Send the OTP SMS to the given phone number
-    response = requests.post(url, headers=headers, json=payload)
-    response_data = response.json()
+    key = _resend_key(phone_number)
+    send_id = uuid.uuid4().hex
+    marker = {'send_id': send_id, 'expires_at': time.time() + RESEND_COOLDOWN}
+    while not cache.add(key, marker, timeout=RESEND_COOLDOWN):
+        pending = pending_send(phone_number)
+        if pending is not None:
+            return pending
+        cache.delete(key)  # The previous send failed or just expired: take over
+    try:
+        otp = generate_otp(phone_number)  # Generate the OTP
+        get_dispatch_queue().enqueue(phone_number, otp, send_id=send_id)  # Hand the SMS to the background workers
+    except Exception:
+        cache.delete(key)  # Nothing was sent, let the next request try again
+        raise
+    return {"send_id": send_id, "status": QUEUED, "resend_in": RESEND_COOLDOWN, "reused": False}
 
-    # Handle response errors from SMS service
-    if response_data.get('status') != 1:
-        raise Exception(f"Failed to send OTP via SMS: {response_data.get('message', 'Unknown error')}")
 
-    return response_data
+async def asend_otp_sms(phone_number):
+    """
+    Async version of `send_otp_sms`; neither step waits on the SMS provider.
+
+    Args:
+        phone_number (str): The phone number to send the OTP to.
+
+    Returns:
+        dict: The send identifier, its status, `resend_in` and `reused`.
+
+    Raises:
+        OtpBlockedError: If the phone is blocked after too many wrong codes.
+        QueueFullError: If the dispatch queue cannot accept more messages.
+    """
+    return await sync_to_async(send_otp_sms, thread_sensitive=False)(phone_number)
+
+
+async def apending_send(phone_number):
+    """
+    Async version of `pending_send`.
+    """
+    return await sync_to_async(pending_send, thread_sensitive=False)(phone_number)
 
 
 def verify_otp(phone_number, otp_input):
     """
     Verify the OTP input against the stored OTP for the given phone number.
 
+    The check, the wrong-attempt count and the block are a single atomic update of the
+    phone's OTP record. A correct OTP is consumed, and the `OTP_MAX_ATTEMPTS`-th wrong
+    one blocks the phone for `OTP_BLOCK_TTL` seconds.
+
     Args:
         phone_number (str): The phone number associated with the OTP.
         otp_input (str): The OTP input to verify.
 
     Returns:
-        dict: A dictionary indicating success or failure with a message.
+        dict: A dictionary indicating success or failure with a message, plus
+        `retry_after` when the phone is blocked.
         int: HTTP status code.
     """
-    otp_key = f"otp:{phone_number}"  # Cache key for OTP
-    real_otp = cache.get(otp_key)  # Get the stored OTP from cache
-
-    # Check if OTP is expired or not found
-    if not real_otp:
+    outcome, retry_after = get_otp_store().verify(
+        phone_number, otp_input, MAX_ATTEMPTS, BLOCK_TTL, VERIFIED_TTL
+    )
+    if outcome in (VERIFIED, BLOCKED):
+        cache.delete(_resend_key(phone_number))  # The sent code is used up; don't hand it out again
+    if outcome == VERIFIED:
+        return {"success": True, "message": "OTP verified successfully"}, 200
+    if outcome == BLOCKED:
+        return {
+            "success": False,
+            "error": "Too many wrong OTP attempts. You are blocked.",
+            "retry_after": retry_after,
+        }, 403
+    if outcome == EXPIRED:
         return {"success": False, "error": "OTP expired or not found"}, 400
+    return {"success": False, "error": "Invalid OTP"}, 400
 
-    # Check if the entered OTP matches the stored OTP
-    if otp_input != real_otp:
-        wrong_key = f"otp:wrong:phone:{phone_number}"  # Cache key for failed attempts
-        current_attempts = cache.get(wrong_key, 0)  # Get the current number of failed attempts
-        cache.set(wrong_key, current_attempts + 1, timeout=3600)  # Increment failed attempts count
 
-        # Block the user if there are too many failed attempts
-        if current_attempts + 1 >= 3:
-            cache.set(f"block:phone:{phone_number}", True, timeout=3600)  # Block for 1 hour
-            return {"success": False, "error": "Too many wrong OTP attempts. You are blocked."}, 429
-
-        return {"success": False, "error": "Invalid OTP"}, 400
-
-    # Clear wrong OTP attempts on successful verification
-    cache.delete(f"otp:wrong:phone:{phone_number}")
-    cache.set(f"verified:{phone_number}", True, timeout=600)  # Mark OTP as verified for 10 minutes
-
-    return {"success": True, "message": "OTP verified successfully"}, 200
-
-
-def make_requests(phone_number, otp):
+async def averify_otp(phone_number, otp_input):
     """
-    Prepare the SMS API request to send the OTP to the phone number.
+    Async version of `verify_otp`.
 
     Args:
-        phone_number (str): The phone number to send the OTP to.
-        otp (str): The OTP to send.
+        phone_number (str): The phone number associated with the OTP.
+        otp_input (str): The OTP input to verify.
 
     Returns:
-        tuple: URL, headers, and payload for the SMS API request.
+        dict: A dictionary indicating success or failure with a message.
+        int: HTTP status code.
     """
-    url = "https://api.sms.ir/v1/send/verify"  # SMS API URL
+    return await sync_to_async(verify_otp, thread_sensitive=False)(phone_number, otp_input)
+
@@ -0,0 +1,187 @@
+# users/phone_index.py
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+POSITIVE_TTL = getattr(settings, 'PHONE_INDEX_POSITIVE_TTL', 24 * 3600)  # Registered phones
+NEGATIVE_TTL = getattr(settings, 'PHONE_INDEX_NEGATIVE_TTL', 600)  # Unregistered phones
+
+
+def _key(phone):
+    return f"phone:exists:{phone}"
+
+
+class PhoneIndex:
+    """
+    Cached phone membership in front of the `User` table.
+
+    Both registered and unregistered phones are cached, so enumeration traffic and
+    retries for unknown numbers stop reaching the database. Entries are kept coherent
+    by the user save/delete signals (see `account.signals`).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def exists(self, phone):
+        """
+        Check whether a user with the given phone number exists.
+
+        Args:
+            phone (str): The phone number to check.
+
+        Returns:
+            bool: True if the phone is registered, False otherwise.
+        """
+        cached = cache.get(_key(phone))
+        if cached is not None:
+            self._count(hit=True)
+            return cached
+        self._count(hit=False)
+        from .models import User
+
+        found = User.objects.filter(phone=phone).exists()
+        self._fill(phone, found)
+        return found
+
+    async def aexists(self, phone):
+        """
+        Async version of `exists`.
+        """
+        cached = await cache.aget(_key(phone))
+        if cached is not None:
+            self._count(hit=True)
+            return cached
+        self._count(hit=False)
+        from .models import User
+
+        found = await User.objects.filter(phone=phone).aexists()
+        await cache.aadd(_key(phone), found, timeout=POSITIVE_TTL if found else NEGATIVE_TTL)  # See `_fill`
+        return found
+
+    def exists_many(self, phones, chunk_size=500):
+        """
+        Check which of many phone numbers are registered, with one cache read
+        and one `IN` query per `chunk_size` phones the cache did not know.
+
+        Args:
+            phones (list): The phone numbers to check.
+            chunk_size (int): Phones per `IN` query.
+
+        Returns:
+            dict: Whether each phone is registered, by phone.
+        """
+        phones = list(dict.fromkeys(phones))
+        cached = cache.get_many([_key(phone) for phone in phones])
+        found = {}
+        missing = []
+        for phone in phones:
+            value = cached.get(_key(phone))
+            if value is None:
+                missing.append(phone)
+            else:
+                found[phone] = value
+        self._count(hit=True, amount=len(found))
+        self._count(hit=False, amount=len(missing))
+        if not missing:
+            return found
+        from .models import User
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            registered = set(User.objects.filter(phone__in=chunk).values_list('phone', flat=True))
+            for phone in chunk:
+                found[phone] = phone in registered
+                self._fill(phone, found[phone])
+        return found
+
+    def mark_registered(self, phone):
+        """
+        Record that the phone is registered once the current transaction commits.
+
+        Args:
+            phone (str): The registered phone number.
+        """
+        transaction.on_commit(lambda: self._store(phone, True))
+
+    def mark_unregistered(self, phone):
+        """
+        Record that the phone is no longer registered once the current transaction commits.
+
+        Args:
+            phone (str): The phone number that was freed.
+        """
+        transaction.on_commit(lambda: self._store(phone, False))
+
+    def mark_many_registered(self, phones):
+        """
+        Record a batch of newly registered phones, e.g. after a bulk insert that
+        bypassed the save signals.
+
+        Args:
+            phones (list): The registered phone numbers.
+        """
+        cache.set_many({_key(phone): True for phone in phones}, timeout=POSITIVE_TTL)
+
+    def warm(self, batch_size=5000):
+        """
+        Load every registered phone from the `User` table into the cache.
+
+        Args:
+            batch_size (int): Number of phones written to the cache at once.
+
+        Returns:
+            int: The number of phones loaded.
+        """
+        from .models import User
+
+        loaded = 0
+        batch = {}
+        for phone in User.objects.values_list('phone', flat=True).iterator(chunk_size=batch_size):
+            batch[_key(phone)] = True
+            if len(batch) >= batch_size:
+                cache.set_many(batch, timeout=POSITIVE_TTL)
+                loaded += len(batch)
+                batch = {}
+        if batch:
+            cache.set_many(batch, timeout=POSITIVE_TTL)
+            loaded += len(batch)
+        return loaded
+
+    def stats(self):
+        """
+        Return the hit and miss counters of this process.
+
+        Returns:
+            dict: Hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _store(self, phone, found):
+        # Authoritative: the save/delete hooks overwrite whatever is cached
+        cache.set(_key(phone), found, timeout=POSITIVE_TTL if found else NEGATIVE_TTL)
+
+    def _fill(self, phone, found):
+        # A database read may predate a registration whose hook stored True meanwhile, so never overwrite
+        cache.add(_key(phone), found, timeout=POSITIVE_TTL if found else NEGATIVE_TTL)
+
+    def _count(self, hit, amount=1):
+        with self._lock:
+            if hit:
+                self.hits += amount
+            else:
+                self.misses += amount
+
+
+phone_index = PhoneIndex()  # Process-wide phone index
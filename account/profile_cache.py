@@ -0,0 +1,70 @@
+# users/profile_cache.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import UserSerializer
+
+PROFILE_CACHE_TTL = getattr(settings, 'PROFILE_CACHE_TTL', 3600)  # Seconds a rendered profile stays cached
+
+
+def _key(user_id):
+    return f"profile:body:{user_id}"
+
+
+def profile_etag(user):
+    """
+    Return the ETag of the user's profile, derived from the user version that
+    every profile change increments.
+
+    Args:
+        user (User or SnapshotUser): The user.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    return quote_etag(f"{user.pk}-{user.version}")
+
+
+def profile_last_modified(user):
+    """
+    Return the time of the user's last profile change.
+
+    Args:
+        user (User or SnapshotUser): The user.
+
+    Returns:
+        int: Unix timestamp, or None if unknown.
+    """
+    return int(user.updated_at.timestamp()) if getattr(user, 'updated_at', None) else None
+
+
+def get_profile_body(user):
+    """
+    Return the user's profile rendered as JSON by `UserSerializer`, from the cache
+    when it was rendered at the same user version.
+
+    Args:
+        user (User or SnapshotUser): The user.
+
+    Returns:
+        bytes: The JSON body.
+    """
+    cached = cache.get(_key(user.pk))
+    if cached is not None and cached[0] == user.version:
+        return cached[1]
+    body = JSONRenderer().render(UserSerializer(user).data)
+    cache.set(_key(user.pk), (user.version, body), timeout=PROFILE_CACHE_TTL)
+    return body
+
+
+def invalidate_profile(user_id):
+    """
+    Drop the user's cached profile after an update or deletion.
+
+    Args:
+        user_id (int): The user's primary key.
+    """
+    cache.delete(_key(user_id))
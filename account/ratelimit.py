@@ -0,0 +1,457 @@
+# users/ratelimit.py
+
+import math
+import struct
+import threading
+import time
+import uuid
+from array import array
+from collections import deque, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .redis_client import get_redis
+from .shm_store import default_path, get_shared_store
+
+SLIDING_WINDOW = 'sliding_window'
+TOKEN_BUCKET = 'token_bucket'
+
+KEY_PHONE = 'phone'
+KEY_IP = 'ip'
+KEY_PHONE_IP = 'phone+ip'
+
+Decision = namedtuple('Decision', ['allowed', 'remaining', 'retry_after'])
+Decision.__doc__ = """
+Result of a rate limit check.
+
+Attributes:
+    allowed (bool): Whether the request is within the limit.
+    remaining (int): Requests left before the limit is reached.
+    retry_after (int): Seconds until a request would be allowed again, 0 if allowed.
+"""
+
+ALLOW_ALL = Decision(True, math.inf, 0)
+
+
+class InMemoryBackend:
+    """
+    Rate limit backend keeping its state in process memory.
+
+    Each check is a single operation under a lock striped by key, so counts stay exact
+    under any number of threads. Limits are per process.
+    """
+    is_async_safe = True  # No I/O, safe to call from the event loop
+
+    def __init__(self, stripes=64):
+        """
+        Args:
+            stripes (int): Number of locks keys are spread over.
+        """
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._windows = {}  # key -> (deque of hit timestamps, expires_at)
+        self._buckets = {}  # key -> (tokens, updated_at, expires_at)
+        self._last_sweep = time.monotonic()
+
+    def _lock(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    def sliding_window(self, key, limit, window, cost=1, consume=True):
+        """
+        Check (and optionally record) `cost` hits against a sliding window log.
+
+        Args:
+            key (str): The rate limit key.
+            limit (int): Maximum hits within the window.
+            window (float): Window length in seconds.
+            cost (int): Number of hits this request counts for.
+            consume (bool): Record the hits if allowed; False only peeks.
+
+        Returns:
+            Decision: The outcome of the check.
+        """
+        now = time.monotonic()
+        self._maybe_sweep(now)
+        with self._lock(key):
+            hits, _ = self._windows.get(key, (None, None))
+            if hits is None:
+                hits = deque()
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            count = len(hits)
+            if count + cost > limit:
+                retry_after = window
+                if cost <= limit:
+                    retry_after = hits[count + cost - limit - 1] + window - now
+                if hits:
+                    self._windows[key] = (hits, hits[-1] + window)
+                return Decision(False, max(limit - count, 0), max(math.ceil(retry_after), 1))
+            if consume:
+                hits.extend([now] * cost)
+                count += cost
+            if hits:
+                self._windows[key] = (hits, hits[-1] + window)
+            return Decision(True, limit - count, 0)
+
+    def token_bucket(self, key, rate, capacity, cost=1, consume=True):
+        """
+        Check (and optionally take) `cost` tokens from a token bucket.
+
+        Args:
+            key (str): The rate limit key.
+            rate (float): Tokens added per second.
+            capacity (int): Maximum tokens in the bucket.
+            cost (int): Tokens this request needs.
+            consume (bool): Take the tokens if allowed; False only peeks.
+
+        Returns:
+            Decision: The outcome of the check.
+        """
+        now = time.monotonic()
+        self._maybe_sweep(now)
+        with self._lock(key):
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, None))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < cost:
+                retry_after = (min(cost, capacity) - tokens) / rate  # A cost above capacity never fits
+                self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+                return Decision(False, int(tokens), max(math.ceil(retry_after), 1))
+            if consume:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return Decision(True, int(tokens), 0)
+
+    def reset(self, key):
+        """
+        Forget all state for the key.
+
+        Args:
+            key (str): The rate limit key.
+        """
+        with self._lock(key):
+            self._windows.pop(key, None)
+            self._buckets.pop(key, None)
+
+    def _maybe_sweep(self, now):
+        # Drop expired keys about once a minute so memory stays bounded
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for store in (self._windows, self._buckets):
+            for key, state in list(store.items()):
+                if state[-1] <= now:
+                    with self._lock(key):
+                        current = store.get(key)
+                        if current is not None and current[-1] <= now:
+                            del store[key]
+
+
+TOKEN_STATE = struct.Struct('<dd')  # tokens, updated_at
+
+
+class SharedMemoryBackend:
+    """
+    Rate limit backend keeping its state in a memory-mapped file shared by every
+    worker process on the host (see `account.shm_store.SharedMemoryStore`).
+
+    Each check is one atomic update of the key's slot, so limits are exact across
+    workers without Redis. A sliding window stores one timestamp per hit, so limits
+    can be at most `value_size / 8` hits.
+    """
+    is_async_safe = True  # Memory and file locks only, safe to call from the event loop
+
+    def __init__(self, path=None, buckets=4096, ways=8, value_size=256):
+        """
+        Args:
+            path (str): The backing file, /dev/shm/obar-ratelimit if omitted.
+            buckets (int): Number of buckets in the store.
+            ways (int): Slots per bucket.
+            value_size (int): Bytes per slot.
+        """
+        self.store = get_shared_store(
+            path or default_path('ratelimit'), buckets=buckets, ways=ways, value_size=value_size
+        )
+
+    def sliding_window(self, key, limit, window, cost=1, consume=True):
+        """
+        See `InMemoryBackend.sliding_window`.
+        """
+        if limit > self.store.value_size // 8:
+            raise ImproperlyConfigured(f"Sliding window limit {limit} does not fit in a {self.store.value_size}-byte slot")
+
+        def update(value, expires_at, now):
+            hits = [hit for hit in array('d', value or b'') if hit > now - window]
+            count = len(hits)
+            if count + cost > limit:
+                retry_after = window
+                if cost <= limit:
+                    retry_after = hits[count + cost - limit - 1] + window - now
+                decision = Decision(False, max(limit - count, 0), max(math.ceil(retry_after), 1))
+            else:
+                if consume:
+                    hits.extend([now] * cost)
+                    count += cost
+                decision = Decision(True, limit - count, 0)
+            if not hits:
+                return None, 0.0, decision
+            return array('d', hits).tobytes(), hits[-1] + window, decision
+
+        return self.store.transact(key, update)
+
+    def token_bucket(self, key, rate, capacity, cost=1, consume=True):
+        """
+        See `InMemoryBackend.token_bucket`.
+        """
+        def update(value, expires_at, now):
+            tokens, updated_at = TOKEN_STATE.unpack(value) if value else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+            if tokens < cost:
+                retry_after = (min(cost, capacity) - tokens) / rate  # A cost above capacity never fits
+                decision = Decision(False, int(tokens), max(math.ceil(retry_after), 1))
+            else:
+                if consume:
+                    tokens -= cost
+                decision = Decision(True, int(tokens), 0)
+            return TOKEN_STATE.pack(tokens, now), now + (capacity - tokens) / rate + 1, decision
+
+        return self.store.transact(key, update)
+
+    def reset(self, key):
+        """
+        See `InMemoryBackend.reset`.
+        """
+        self.store.transact(key, lambda value, expires_at, now: (None, 0.0, None))
+
+
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consume = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+if count + cost > limit then
+    local retry = window
+    if cost <= limit then
+        local entry = redis.call('ZRANGE', key, count + cost - limit - 1, count + cost - limit - 1, 'WITHSCORES')
+        retry = tonumber(entry[2]) + window - now
+    end
+    return {0, limit - count, tostring(retry)}
+end
+if consume == 1 then
+    for i = 1, cost do
+        redis.call('ZADD', key, now, ARGV[6] .. ':' .. i)
+    end
+    redis.call('PEXPIRE', key, math.ceil(window * 1000))
+    count = count + cost
+end
+return {1, limit - count, '0'}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local consume = tonumber(ARGV[5])
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 1
+local retry = 0
+if tokens < cost then
+    allowed = 0
+    retry = (cost - tokens) / rate
+elseif consume == 1 then
+    tokens = tokens - cost
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', key, math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, math.floor(tokens), tostring(retry)}
+"""
+
+
+class RedisBackend:
+    """
+    Rate limit backend keeping its state in Redis, shared by every worker and host.
+
+    Each check is a single Lua script call, which Redis runs atomically.
+    """
+    is_async_safe = False  # Network I/O, run in a worker thread from async code
+
+    def __init__(self, url=None, prefix='rl'):
+        """
+        Args:
+            url (str): Redis connection URL, `settings.REDIS_URL` if omitted.
+            prefix (str): Prefix added to every key.
+        """
+        self.client = get_redis(url)
+        self.prefix = prefix
+        self._sliding_window = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._token_bucket = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def sliding_window(self, key, limit, window, cost=1, consume=True):
+        """
+        See `InMemoryBackend.sliding_window`.
+        """
+        if cost > limit:
+            return Decision(False, limit, math.ceil(window))
+        allowed, remaining, retry_after = self._sliding_window(
+            keys=[f"{self.prefix}:{key}"],
+            args=[time.time(), window, limit, cost, int(consume), uuid.uuid4().hex],
+        )
+        return Decision(bool(allowed), max(int(remaining), 0), self._retry_after(allowed, retry_after))
+
+    def token_bucket(self, key, rate, capacity, cost=1, consume=True):
+        """
+        See `InMemoryBackend.token_bucket`.
+        """
+        if cost > capacity:
+            return Decision(False, 0, math.ceil(capacity / rate))  # Never fits in the bucket
+        allowed, remaining, retry_after = self._token_bucket(
+            keys=[f"{self.prefix}:{key}"],
+            args=[time.time(), rate, capacity, cost, int(consume)],
+        )
+        return Decision(bool(allowed), int(remaining), self._retry_after(allowed, retry_after))
+
+    def reset(self, key):
+        """
+        See `InMemoryBackend.reset`.
+        """
+        self.client.delete(f"{self.prefix}:{key}")
+
+    @staticmethod
+    def _retry_after(allowed, retry_after):
+        return 0 if allowed else max(math.ceil(float(retry_after)), 1)
+
+
+class RateLimiter:
+    """
+    Applies the per-endpoint policies declared in `settings.RATE_LIMITS`.
+
+    A policy looks like::
+
+        'login': {'policy': 'sliding_window', 'limit': 3, 'window': 3600, 'key': 'phone+ip'}
+        'lookup': {'policy': 'token_bucket', 'rate': 1.0, 'capacity': 100, 'key': 'ip'}
+
+    `key` selects what the limit is counted by: 'phone', 'ip' or 'phone+ip'.
+    """
+
+    def __init__(self, backend, policies):
+        """
+        Args:
+            backend: An `InMemoryBackend`, `RedisBackend` or compatible object.
+            policies (dict): Endpoint name to policy mapping.
+        """
+        self.backend = backend
+        self.policies = policies
+
+    def hit(self, endpoint, phone=None, ip=None, cost=1):
+        """
+        Count a request against the endpoint's limit if it is allowed.
+
+        Args:
+            endpoint (str): The endpoint name in `RATE_LIMITS`.
+            phone (str): The phone number of the request.
+            ip (str): The client IP address.
+            cost (int): Number of hits (or tokens) the request counts for.
+
+        Returns:
+            Decision: The outcome of the check.
+        """
+        return self._check(endpoint, phone, ip, cost, True)
+
+    def peek(self, endpoint, phone=None, ip=None, cost=1):
+        """
+        Check whether a request would be allowed without counting it.
+
+        Args:
+            endpoint (str): The endpoint name in `RATE_LIMITS`.
+            phone (str): The phone number of the request.
+            ip (str): The client IP address.
+            cost (int): Number of hits (or tokens) the request would count for.
+
+        Returns:
+            Decision: The outcome of the check.
+        """
+        return self._check(endpoint, phone, ip, cost, False)
+
+    def reset(self, endpoint, phone=None, ip=None):
+        """
+        Clear the endpoint's counter for the given phone and IP.
+
+        Args:
+            endpoint (str): The endpoint name in `RATE_LIMITS`.
+            phone (str): The phone number of the request.
+            ip (str): The client IP address.
+        """
+        policy = self.policies.get(endpoint)
+        if policy is not None:
+            self.backend.reset(self._key(endpoint, policy, phone, ip))
+
+    async def ahit(self, endpoint, phone=None, ip=None, cost=1):
+        """
+        Async version of `hit`.
+        """
+        return await self._acheck(endpoint, phone, ip, cost, True)
+
+    async def apeek(self, endpoint, phone=None, ip=None, cost=1):
+        """
+        Async version of `peek`.
+        """
+        return await self._acheck(endpoint, phone, ip, cost, False)
+
+    async def _acheck(self, endpoint, phone, ip, cost, consume):
+        if self.backend.is_async_safe:
+            return self._check(endpoint, phone, ip, cost, consume)
+        return await sync_to_async(self._check, thread_sensitive=False)(endpoint, phone, ip, cost, consume)
+
+    def _check(self, endpoint, phone, ip, cost, consume):
+        policy = self.policies.get(endpoint)
+        if policy is None or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return ALLOW_ALL
+        key = self._key(endpoint, policy, phone, ip)
+        kind = policy.get('policy', SLIDING_WINDOW)
+        if kind == SLIDING_WINDOW:
+            return self.backend.sliding_window(key, policy['limit'], policy['window'], cost, consume)
+        if kind == TOKEN_BUCKET:
+            return self.backend.token_bucket(key, policy['rate'], policy['capacity'], cost, consume)
+        raise ImproperlyConfigured(f"Unknown rate limit policy {kind!r} for {endpoint!r}")
+
+    @staticmethod
+    def _key(endpoint, policy, phone, ip):
+        key_by = policy.get('key', KEY_PHONE_IP)
+        if key_by == KEY_PHONE:
+            return f"{endpoint}:{phone}"
+        if key_by == KEY_IP:
+            return f"{endpoint}:{ip}"
+        if key_by == KEY_PHONE_IP:
+            return f"{endpoint}:{phone}:{ip}"
+        raise ImproperlyConfigured(f"Unknown rate limit key {key_by!r} for {endpoint!r}")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide rate limiter, building it from settings on first use.
+
+    Returns:
+        RateLimiter: The shared rate limiter.
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                backend_class = import_string(getattr(settings, 'RATE_LIMIT_BACKEND', 'account.ratelimit.InMemoryBackend'))
+                backend = backend_class(**getattr(settings, 'RATE_LIMIT_BACKEND_OPTIONS', {}))
+                _limiter = RateLimiter(backend, getattr(settings, 'RATE_LIMITS', {}))
+    return _limiter
@@ -0,0 +1,41 @@
+# users/redis_client.py
+
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import redis
+except ImportError:  # redis is only needed by the Redis-backed stores
+    redis = None
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis(url=None):
+    """
+    Return a shared Redis client for the given URL.
+
+    Args:
+        url (str): Redis connection URL, `settings.REDIS_URL` if omitted.
+
+    Returns:
+        redis.Redis: A client backed by a connection pool shared per URL.
+
+    Raises:
+        ImproperlyConfigured: If the redis package is missing or no URL is configured.
+    """
+    if redis is None:
+        raise ImproperlyConfigured("The redis package is required for Redis-backed stores: pip install redis")
+    url = url or getattr(settings, 'REDIS_URL', None)
+    if not url:
+        raise ImproperlyConfigured("REDIS_URL must be set to use a Redis-backed store")
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = _clients[url] = redis.Redis.from_url(url)
+    return client
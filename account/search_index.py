@@ -0,0 +1,205 @@
+# users/search_index.py
+
+import re
+
+from django.db import DatabaseError, connection
+
+from .models import User
+
+FTS_TABLE = 'account_user_fts'  # SQLite FTS5 index over the users' names and email
+FTS_COLUMNS = ('first_name', 'last_name', 'email')
+MIN_PHONE_DIGITS = 3  # Digits after the country code or leading 0 a phone search needs, e.g. "912"
+
+_PHONE_PREFIX = re.compile(r'^\+?\d{2,}$')
+_SEPARATORS = re.compile(r'[\s\-().]')
+_TERMS = re.compile(r'\w+')
+
+_available = None  # Whether the FTS table exists, checked once per process
+
+
+def phone_prefix(term):
+    """
+    Return the local-form prefix of the phone numbers a search term can match.
+
+    Accepts the same country prefixes as `normalize_phone` (+98, 0098, 98, or none),
+    so "+98912", "98912", "912" and "0912" all give "0912". Terms with fewer than
+    `MIN_PHONE_DIGITS` digits past the prefix, such as "98" or "+98", would match
+    nearly every phone and are not treated as phone searches.
+
+    Args:
+        term (str): The search term.
+
+    Returns:
+        str: The phone prefix, or None if the term is not a long enough run of digits.
+    """
+    term = _SEPARATORS.sub('', term)
+    if not _PHONE_PREFIX.match(term):
+        return None
+    if term.startswith('+98'):
+        term = '0' + term[3:]
+    elif term.startswith('0098'):
+        term = '0' + term[4:]
+    elif term.startswith('98'):
+        term = '0' + term[2:]
+    elif term.startswith('9'):
+        term = '0' + term
+    if len(term.lstrip('0')) < MIN_PHONE_DIGITS:
+        return None
+    return term
+
+
+def phone_prefix_range(prefix):
+    """
+    Return lookups matching the phones starting with a prefix as a range scan on the
+    unique phone index, which `startswith` (LIKE) cannot use on every backend.
+
+    Args:
+        prefix (str): The phone prefix.
+
+    Returns:
+        dict: `phone__gte`/`phone__lt` lookups.
+    """
+    return {'phone__gte': prefix, 'phone__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def match_expression(term):
+    """
+    Build an FTS5 query matching rows with every word of the term as a word prefix.
+
+    Words are quoted so FTS5 operators in the term are matched literally.
+
+    Args:
+        term (str): The search term.
+
+    Returns:
+        str: The MATCH expression, or None if the term has no words.
+    """
+    words = _TERMS.findall(term)
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+def is_available():
+    """
+    Return whether the full-text index can be used: the database is SQLite and
+    `build_user_search_index` has created the index.
+
+    Returns:
+        bool: True if the index exists.
+    """
+    global _available
+    if _available is None:
+        if connection.vendor != 'sqlite':
+            _available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _available = cursor.fetchone() is not None
+    return _available
+
+
+def build_index():
+    """
+    Create the FTS5 index and the triggers keeping it in sync with the User table,
+    then (re)build it from the table's rows.
+
+    The index is an external-content table over the User table, so it stores only
+    the inverted index, not a second copy of the columns. Triggers rather than
+    signals keep it current, so bulk imports and queryset updates are indexed too.
+
+    Returns:
+        int: The number of users indexed.
+
+    Raises:
+        DatabaseError: If the database is not SQLite or lacks FTS5.
+    """
+    global _available
+    if connection.vendor != 'sqlite':
+        raise DatabaseError("The user search index needs SQLite with FTS5")
+    table = User._meta.db_table
+    columns = ', '.join(FTS_COLUMNS)
+    new = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+    statements = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, content='{table}', content_rowid='id')",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new});
+        END""",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        indexed = cursor.fetchone()[0]
+    _available = True
+    return indexed
+
+
+def drop_index():
+    """
+    Remove the FTS5 index and its triggers; admin search falls back to `icontains`.
+    """
+    global _available
+    with connection.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    _available = False
+
+
+def search_ids_sql():
+    """
+    Return the SQL selecting the ids of the users matching an FTS5 expression, for
+    use as a `pk__in` subquery.
+
+    Returns:
+        str: The SQL, with one parameter for the MATCH expression.
+    """
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+
+
+def estimate_row_count(model):
+    """
+    Estimate the number of rows of a model's table from the database's statistics
+    instead of an exact COUNT(*), which scans the whole table.
+
+    Uses `pg_class.reltuples` on PostgreSQL, `information_schema` on MySQL, and on
+    SQLite the row count from `sqlite_stat1` (kept by ANALYZE) or else the id range.
+
+    Args:
+        model (Model): The model.
+
+    Returns:
+        int: The estimated row count, or None if the backend has no estimate.
+    """
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+        'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+    }
+    query = queries.get(connection.vendor)
+    if query is None:
+        return None
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(*query)
+            row = cursor.fetchone()
+        except DatabaseError:  # sqlite_stat1 only exists once ANALYZE has run
+            row = None
+        if connection.vendor == 'sqlite':
+            if row is not None:
+                return int(row[0].split()[0])  # "rows [rows per index key...]"
+            pk = model._meta.pk.column
+            cursor.execute(f"SELECT MAX({pk}) - MIN({pk}) + 1 FROM {table}")
+            row = cursor.fetchone()
+    if row is None or row[0] is None or int(row[0]) < 0:  # reltuples is -1 before the first ANALYZE
+        return None
+    return int(row[0])
@@ -13,3 +13,4 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User  # The model to serialize
         fields = ['id', 'phone', 'first_name', 'last_name', 'email']  # Fields to include in the serialized output
+        read_only_fields = ['id', 'phone']  # The phone is changed only through verification
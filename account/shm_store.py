@@ -0,0 +1,227 @@
+# users/shm_store.py
+
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'OBARSHM1'
+HEADER = struct.Struct('<8sIII')  # magic, buckets, ways, value_size
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<16sdI')  # key digest, expires_at (unix time, 0 = empty), value length
+
+KEEP = object()  # Returned by an update function to leave the entry unchanged
+
+
+def default_path(name):
+    """
+    Return the default file of a shared store, in /dev/shm when available.
+
+    Args:
+        name (str): The store name.
+
+    Returns:
+        str: The file path.
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f"obar-{name}")
+
+
+class SharedMemoryStore:
+    """
+    Fixed-size key/value store in a memory-mapped file shared by every process on the host.
+
+    Keys are hashed into buckets of `ways` slots each; a slot holds up to `value_size`
+    bytes and an expiry time. When a bucket is full, the entry closest to expiring is
+    evicted, so memory stays bounded at `buckets * ways` entries. Each operation holds
+    the bucket's lock (a thread lock plus an fcntl byte-range lock on the bucket), so
+    read-modify-write updates are atomic across threads and processes.
+    """
+
+    def __init__(self, path, buckets=4096, ways=8, value_size=256, stripes=64):
+        """
+        Args:
+            path (str): The backing file, created if missing. Put it on tmpfs (/dev/shm).
+            buckets (int): Number of buckets.
+            ways (int): Slots per bucket.
+            value_size (int): Maximum value size in bytes.
+            stripes (int): Number of thread locks buckets are spread over.
+
+        Raises:
+            ImproperlyConfigured: If the file exists with a different layout.
+        """
+        self.path = path
+        self.buckets = buckets
+        self.ways = ways
+        self.value_size = value_size
+        self.slot_size = SLOT_HEADER.size + value_size
+        self.bucket_size = self.slot_size * ways
+        self.size = HEADER_SIZE + self.bucket_size * buckets
+        self.evictions = 0
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._init_file()
+        self._mm = mmap.mmap(self._fd, self.size)
+
+    def _init_file(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, self.buckets, self.ways, self.value_size), 0)
+                return
+            header = HEADER.unpack(os.pread(self._fd, HEADER.size, 0))
+            if header != (MAGIC, self.buckets, self.ways, self.value_size):
+                raise ImproperlyConfigured(
+                    f"{self.path} was created with a different layout {header[1:]}; remove it or use another path"
+                )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _locked(self, bucket):
+        offset = HEADER_SIZE + bucket * self.bucket_size
+        with self._thread_locks[bucket % len(self._thread_locks)]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.bucket_size, offset)
+            try:
+                yield offset
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.bucket_size, offset)
+
+    def _locate(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        return digest, int.from_bytes(digest[:8], 'little') % self.buckets
+
+    def _find(self, offset, digest, now):
+        """
+        Return the slot holding the live entry for the digest, and the slot a new entry
+        should go to (a free or expired slot, else the one closest to expiring).
+        """
+        target = None
+        target_expiry = math.inf
+        for way in range(self.ways):
+            slot = offset + way * self.slot_size
+            slot_digest, expires_at, _ = SLOT_HEADER.unpack_from(self._mm, slot)
+            if expires_at <= now:  # Empty or expired
+                if target_expiry > 0:
+                    target, target_expiry = slot, 0
+                continue
+            if slot_digest == digest:
+                return slot, slot
+            if expires_at < target_expiry:
+                target, target_expiry = slot, expires_at
+        return None, target
+
+    def transact(self, key, update):
+        """
+        Atomically read, update and write the entry for a key.
+
+        Args:
+            key (str): The key.
+            update (callable): Called as `update(value, expires_at, now)` with the current
+                value (bytes, None if absent) and expiry; returns `(new_value, new_expires_at,
+                result)`. `new_value` None deletes the entry, `KEEP` leaves it unchanged.
+
+        Returns:
+            The `result` returned by `update`.
+
+        Raises:
+            ValueError: If the new value is larger than `value_size`.
+        """
+        digest, bucket = self._locate(key)
+        now = time.time()
+        with self._locked(bucket) as offset:
+            slot, target = self._find(offset, digest, now)
+            value, expires_at = None, 0.0
+            if slot is not None:
+                _, expires_at, length = SLOT_HEADER.unpack_from(self._mm, slot)
+                start = slot + SLOT_HEADER.size
+                value = bytes(self._mm[start:start + length])
+            new_value, new_expires_at, result = update(value, expires_at, now)
+            if new_value is KEEP:
+                return result
+            if new_value is None:
+                if slot is not None:
+                    SLOT_HEADER.pack_into(self._mm, slot, b'', 0.0, 0)
+                return result
+            if len(new_value) > self.value_size:
+                raise ValueError(f"Value of {len(new_value)} bytes exceeds the slot size of {self.value_size}")
+            if slot is None:
+                _, target_expiry, _ = SLOT_HEADER.unpack_from(self._mm, target)
+                if target_expiry > now:
+                    self.evictions += 1
+            SLOT_HEADER.pack_into(self._mm, target, digest, new_expires_at, len(new_value))
+            start = target + SLOT_HEADER.size
+            self._mm[start:start + len(new_value)] = new_value
+            return result
+
+    def get(self, key):
+        """
+        Return the live value of a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            bytes: The value, or None if the key is absent or expired.
+        """
+        return self.transact(key, lambda value, expires_at, now: (KEEP, expires_at, value))
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with ExitStack() as stack:
+            for lock in self._thread_locks:  # In order, as `transact` never holds two
+                stack.enter_context(lock)
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.size - HEADER_SIZE, HEADER_SIZE)
+            try:
+                self._mm[HEADER_SIZE:] = bytes(self.size - HEADER_SIZE)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.size - HEADER_SIZE, HEADER_SIZE)
+
+    def stats(self):
+        """
+        Return the number of live entries and this process's eviction count.
+
+        Returns:
+            dict: Entries, capacity and evictions.
+        """
+        now = time.time()
+        entries = 0
+        for slot in range(HEADER_SIZE, self.size, self.slot_size):
+            if SLOT_HEADER.unpack_from(self._mm, slot)[1] > now:
+                entries += 1
+        return {'entries': entries, 'capacity': self.buckets * self.ways, 'evictions': self.evictions}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_shared_store(path, **options):
+    """
+    Return the process-wide store for a file, opening it on first use.
+
+    Args:
+        path (str): The backing file.
+        **options: Layout options passed to `SharedMemoryStore`.
+
+    Returns:
+        SharedMemoryStore: The shared store.
+    """
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = SharedMemoryStore(path, **options)
+    return store
@@ -0,0 +1,37 @@
+# users/signals.py
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .metrics import time_query
+from .models import User
+from .phone_index import phone_index
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    """
+    Keep the phone index coherent when a user is created or saved.
+    """
+    if instance.is_active:  # Deleted users hold a placeholder phone
+        phone_index.mark_registered(instance.phone)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """
+    Free the user's phone in the phone index when the user is deleted.
+    """
+    if instance.is_active:  # Tombstoned users already freed their phone
+        phone_index.mark_unregistered(instance.phone)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """
+    Time every query of new database connections under the "db" stage.
+    """
+    if getattr(settings, 'METRICS_ENABLED', True) and time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
@@ -0,0 +1,247 @@
+# users/sms_client.py
+
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a request is rejected because the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that fails fast after repeated provider failures.
+
+    After `failure_threshold` consecutive failures the breaker opens and rejects calls
+    for `reset_timeout` seconds. It then lets a single trial call through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker.
+            reset_timeout (float): Seconds the breaker stays open before a trial call.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0  # Consecutive failures
+        self.trips = 0  # Number of times the breaker opened
+        self.rejected = 0  # Calls rejected while open
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check whether a call may go through.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True  # Only one trial call at a time
+                return
+            self.rejected += 1
+        raise CircuitOpenError("SMS provider circuit is open")
+
+    def record_success(self):
+        """
+        Record a successful call and close the breaker.
+        """
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the breaker when the threshold is reached.
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        """
+        Return the breaker state and counters.
+
+        Returns:
+            dict: State, consecutive failures, trips and rejected calls.
+        """
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class SmsProviderClient:
+    """
+    Long-lived HTTP client for SMS providers.
+
+    Each worker thread keeps its own keep-alive session, so connections (and their TLS
+    handshakes) are reused across sends. Every request has connect and read timeouts and
+    goes through a circuit breaker.
+    """
+
+    def __init__(self, connect_timeout=3.0, read_timeout=10.0, pool_connections=4, pool_maxsize=8, breaker=None):
+        """
+        Args:
+            connect_timeout (float): Seconds allowed to establish a connection.
+            read_timeout (float): Seconds allowed to wait for the response.
+            pool_connections (int): Number of hosts kept in each session's pool.
+            pool_maxsize (int): Connections kept alive per host in each session.
+            breaker (CircuitBreaker): Breaker guarding the provider, a default one if omitted.
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.breaker = breaker or CircuitBreaker()
+        self._local = threading.local()
+        self._sessions = []  # Every session created, used for pool statistics
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def post(self, url, headers=None, json=None):
+        """
+        Send a POST request through the calling thread's pooled session.
+
+        Args:
+            url (str): The request URL.
+            headers (dict): The request headers.
+            json (dict): The JSON body.
+
+        Returns:
+            requests.Response: The provider response.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            requests.RequestException: If the request fails or times out.
+        """
+        self.breaker.allow()
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self._session().post(url, headers=headers, json=json, timeout=self.timeout)
+        except Exception:  # Any failure, e.g. an unserializable body, ends a half-open trial
+            self._record_error()
+            raise
+        if response.status_code >= 500:
+            self._record_error()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _record_error(self):
+        with self._lock:
+            self.errors += 1
+        self.breaker.record_failure()
+
+    def stats(self):
+        """
+        Return connection pool and circuit breaker statistics.
+
+        Returns:
+            dict: Request and error counts, connections opened, connection reuse rate
+            and the breaker state.
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+            requests_sent = self.requests
+            errors = self.errors
+
+        connections = 0
+        pooled_requests = 0
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        pooled_requests += pool.num_requests
+
+        return {
+            'sessions': len(sessions),
+            'requests': requests_sent,
+            'errors': errors,
+            'connections_opened': connections,
+            'connection_reuse_rate': round(1 - connections / pooled_requests, 4) if pooled_requests else 0.0,
+            'breaker': self.breaker.stats(),
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def build_sms_client():
+    """
+    Build a new SMS provider client, with its own pools and circuit breaker, from settings.
+
+    Returns:
+        SmsProviderClient: The client.
+    """
+    return SmsProviderClient(
+        connect_timeout=getattr(settings, 'SMS_HTTP_CONNECT_TIMEOUT', 3.0),
+        read_timeout=getattr(settings, 'SMS_HTTP_READ_TIMEOUT', 10.0),
+        pool_maxsize=getattr(settings, 'SMS_HTTP_POOL_MAXSIZE', 8),
+        breaker=CircuitBreaker(
+            failure_threshold=getattr(settings, 'SMS_BREAKER_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'SMS_BREAKER_RESET_TIMEOUT', 30.0),
+        ),
+    )
+
+
+def get_sms_client():
+    """
+    Return the process-wide SMS provider client, building it from settings on first use.
+
+    Returns:
+        SmsProviderClient: The shared client.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_sms_client()
+    return _client
@@ -0,0 +1,356 @@
+# users/sms_providers.py
+
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+
+from .sms_client import CircuitOpenError, get_sms_client
+
+
+class SmsDeliveryError(Exception):
+    """
+    Raised when an SMS provider fails to deliver a message.
+
+    Attributes:
+        retryable (bool): Whether the dispatch queue should retry the send.
+    """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class HttpSmsProvider:
+    """
+    Base of the HTTP provider adapters.
+
+    An adapter turns a message into the provider's request (`build_request`) and the
+    provider's response into a result or an error (`parse_response`); this class posts
+    the request through a pooled client with timeouts and a circuit breaker.
+    """
+
+    def __init__(self, client=None):
+        """
+        Args:
+            client (SmsProviderClient): HTTP client to use, the shared pooled client if omitted.
+        """
+        self.client = client or get_sms_client()
+
+    def build_request(self, phone_number, otp):
+        """
+        Prepare the request sending the OTP to the phone number.
+
+        Returns:
+            tuple: URL, headers, and JSON payload (None for no body).
+        """
+        raise NotImplementedError
+
+    def parse_response(self, response, response_data):
+        """
+        Check the provider's response.
+
+        Args:
+            response (requests.Response): The HTTP response.
+            response_data (dict): Its decoded JSON body.
+
+        Returns:
+            dict: The response data.
+
+        Raises:
+            SmsDeliveryError: If the provider rejected the message.
+        """
+        raise NotImplementedError
+
+    def send(self, phone_number, otp):
+        """
+        Send the OTP to the phone number.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+
+        Returns:
+            dict: The response data from the SMS service.
+
+        Raises:
+            SmsDeliveryError: If the request fails or the provider rejects the message.
+        """
+        url, headers, payload = self.build_request(phone_number, otp)  # Prepare the request data for SMS API
+        response, response_data = self._post(url, headers, payload)
+        return self.parse_response(response, response_data)
+
+    def stats(self):
+        """
+        Return the client's connection pool and circuit breaker statistics.
+        """
+        return self.client.stats()
+
+    def _post(self, url, headers, payload):
+        try:
+            response = self.client.post(url, headers=headers, json=payload)
+            return response, response.json()
+        except CircuitOpenError as e:
+            raise SmsDeliveryError(str(e))
+        except (requests.RequestException, ValueError) as e:
+            raise SmsDeliveryError(f"SMS request failed: {e}")
+
+
+class SmsIrProvider(HttpSmsProvider):
+    """
+    SMS provider backed by the sms.ir verify API, and its likeToLike API for bulk sends.
+
+    Options left as None are read from the `SMS_IR_*` settings on each send.
+    """
+
+    def __init__(self, client=None, base_url=None, api_key=None, template_id=None, line_number=None, bulk_text=None):
+        """
+        Args:
+            client (SmsProviderClient): HTTP client to use, the shared pooled client if omitted.
+            base_url (str): API root, `SMS_IR_BASE_URL` if omitted.
+            api_key (str): API key, `SMS_IR_API_KEY` if omitted.
+            template_id (int): Verify template containing the code, `SMS_IR_TEMPLATE_ID` if omitted.
+            line_number (int): Sender line of bulk sends, `SMS_IR_LINE_NUMBER` if omitted.
+            bulk_text (str): Text of bulk sends with a `{code}` field, `SMS_IR_BULK_TEXT` if omitted.
+        """
+        super().__init__(client)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.template_id = template_id
+        self.line_number = line_number
+        self.bulk_text = bulk_text
+
+    def _option(self, value, setting, default):
+        return value if value is not None else getattr(settings, setting, default)
+
+    def _headers(self):
+        return {
+            'Content-Type': 'application/json',
+            'Accept': 'text/plain',
+            'x-api-key': self._option(self.api_key, 'SMS_IR_API_KEY', ''),  # sms.ir API key
+        }
+
+    def build_request(self, phone_number, otp):
+        """
+        Prepare the sms.ir verify request sending the OTP to the phone number.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+
+        Returns:
+            tuple: URL, headers, and payload for the SMS API request.
+        """
+        url = f"{self._option(self.base_url, 'SMS_IR_BASE_URL', 'https://api.sms.ir/v1')}/send/verify"
+        payload = {
+            "mobile": phone_number,
+            "templateId": self._option(self.template_id, 'SMS_IR_TEMPLATE_ID', 0),  # Verify template containing the code
+            "parameters": [
+                {"name": "Code", "value": otp},
+            ],
+        }
+        return url, self._headers(), payload
+
+    def build_bulk_request(self, messages):
+        """
+        Prepare one sms.ir "likeToLike" request sending each OTP to its phone number.
+
+        The bulk API takes plain texts sent from the line number, so each OTP is
+        formatted into the bulk text instead of the verify template.
+
+        Args:
+            messages (list): `(phone_number, otp)` pairs.
+
+        Returns:
+            tuple: URL, headers, and payload for the SMS API request.
+        """
+        url = f"{self._option(self.base_url, 'SMS_IR_BASE_URL', 'https://api.sms.ir/v1')}/send/likeToLike"
+        text = self._option(self.bulk_text, 'SMS_IR_BULK_TEXT', 'Your verification code: {code}')
+        payload = {
+            "lineNumber": self._option(self.line_number, 'SMS_IR_LINE_NUMBER', 0),
+            "messageTexts": [text.format(code=otp) for _, otp in messages],
+            "mobiles": [phone_number for phone_number, _ in messages],
+            "sendDateTime": None,  # Send now
+        }
+        return url, self._headers(), payload
+
+    def parse_response(self, response, response_data):
+        # Handle response errors from SMS service
+        if response_data.get('status') != 1:
+            raise SmsDeliveryError(
+                f"Failed to send OTP via SMS: {response_data.get('message', 'Unknown error')}",
+                retryable=response.status_code >= 500,
+            )
+        return response_data
+
+    def send_bulk(self, messages):
+        """
+        Send many OTPs in one sms.ir "likeToLike" call.
+
+        Args:
+            messages (list): `(phone_number, otp)` pairs.
+
+        Returns:
+            list: One result per message, in order: the recipient's response data, or an
+            `SmsDeliveryError` if sms.ir returned no message id for it.
+
+        Raises:
+            SmsDeliveryError: If the request fails or sms.ir rejects the whole batch.
+        """
+        url, headers, payload = self.build_bulk_request(messages)
+        response, response_data = self._post(url, headers, payload)
+        self.parse_response(response, response_data)
+
+        data = response_data.get('data') or {}
+        message_ids = data.get('messageIds') or []
+        results = []
+        for index in range(len(messages)):
+            message_id = message_ids[index] if index < len(message_ids) else None
+            if message_id:
+                results.append({"status": 1, "data": {"messageId": message_id, "packId": data.get('packId')}})
+            else:
+                results.append(SmsDeliveryError("Recipient rejected by sms.ir", retryable=False))
+        return results
+
+
+class KavenegarProvider(HttpSmsProvider):
+    """
+    SMS provider backed by the Kavenegar verify lookup API.
+    """
+
+    def __init__(self, api_key, template, client=None, base_url='https://api.kavenegar.com/v1'):
+        """
+        Args:
+            api_key (str): Kavenegar API key.
+            template (str): Name of the verify template containing the code.
+            client (SmsProviderClient): HTTP client to use, the shared pooled client if omitted.
+            base_url (str): API root.
+        """
+        super().__init__(client)
+        self.api_key = api_key
+        self.template = template
+        self.base_url = base_url
+
+    def build_request(self, phone_number, otp):
+        """
+        Prepare the Kavenegar lookup request sending the OTP to the phone number.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+
+        Returns:
+            tuple: URL (parameters in the query string), headers, and no payload.
+        """
+        query = urlencode({'receptor': phone_number, 'token': otp, 'template': self.template})
+        return f"{self.base_url}/{self.api_key}/verify/lookup.json?{query}", {'Accept': 'application/json'}, None
+
+    def parse_response(self, response, response_data):
+        result = response_data.get('return') or {}
+        if result.get('status') != 200:
+            raise SmsDeliveryError(
+                f"Failed to send OTP via SMS: {result.get('message', 'Unknown error')}",
+                retryable=response.status_code >= 500,
+            )
+        return response_data
+
+
+class FakeSmsProvider:
+    """
+    Local stand-in for a real SMS provider, used for benchmarks and offline development.
+
+    Every delivered OTP is kept in `outbox` so that a benchmark can read it back.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, seed=None, per_message_latency=0.0,
+                 tail_rate=0.0, tail_latency=1.0):
+        """
+        Args:
+            latency (float): Simulated provider latency in seconds.
+            jitter (float): Maximum random latency added on top of `latency`.
+            failure_rate (float): Probability (0-1) that a send fails with a retryable error.
+            seed (int): Optional seed for reproducible failures.
+            per_message_latency (float): Simulated extra latency per message of a bulk call.
+            tail_rate (float): Probability (0-1) that a call is slow.
+            tail_latency (float): Latency in seconds of a slow call.
+
+        The latency and failure attributes may be changed while sends are running, to
+        simulate a provider degrading or recovering.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.per_message_latency = per_message_latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.outbox = {}  # Last OTP delivered per phone number
+        self.sent = 0  # Number of successful sends
+        self.failed = 0  # Number of simulated failures
+        self.calls = 0  # Number of provider calls, single or bulk
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, phone_number, otp):
+        """
+        Simulate sending the OTP to the phone number.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+
+        Returns:
+            dict: A response shaped like the sms.ir response.
+
+        Raises:
+            SmsDeliveryError: If the simulated send fails.
+        """
+        with self._lock:
+            delay = self._delay()
+            fail = self._random.random() < self.failure_rate
+            self.calls += 1
+        time.sleep(delay)
+
+        with self._lock:
+            if fail:
+                self.failed += 1
+                raise SmsDeliveryError("Simulated provider failure")
+            self.sent += 1
+            self.outbox[phone_number] = otp
+        return {"status": 1, "message": "ok", "data": {"messageId": self.sent}}
+
+    def send_bulk(self, messages):
+        """
+        Simulate sending many OTPs in one provider call.
+
+        Args:
+            messages (list): `(phone_number, otp)` pairs.
+
+        Returns:
+            list: One result per message: a response shaped like the sms.ir response, or
+            an `SmsDeliveryError` for a simulated per-recipient failure.
+        """
+        with self._lock:
+            delay = self._delay() + self.per_message_latency * len(messages)
+            failures = [self._random.random() < self.failure_rate for _ in messages]
+            self.calls += 1
+        time.sleep(delay)
+
+        results = []
+        with self._lock:
+            for (phone_number, otp), fail in zip(messages, failures):
+                if fail:
+                    self.failed += 1
+                    results.append(SmsDeliveryError("Simulated provider failure"))
+                    continue
+                self.sent += 1
+                self.outbox[phone_number] = otp
+                results.append({"status": 1, "message": "ok", "data": {"messageId": self.sent}})
+        return results
+
+    def _delay(self):
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            return self.tail_latency
+        return self.latency + self._random.uniform(0, self.jitter)
@@ -0,0 +1,370 @@
+# users/sms_queue.py
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import timed
+from .sms_providers import SmsDeliveryError
+from .sms_router import build_sms_provider
+
+logger = logging.getLogger(__name__)
+
+STATUS_TTL = getattr(settings, 'SMS_STATUS_TTL', 3600)  # How long a send's status record is kept
+
+# Send statuses stored in the status record
+QUEUED = 'queued'
+SENDING = 'sending'
+RETRYING = 'retrying'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the dispatch queue cannot accept more messages.
+    """
+
+
+def status_key(send_id):
+    """
+    Return the cache key holding the status record of a send.
+
+    Args:
+        send_id (str): The identifier returned by `SmsDispatchQueue.enqueue`.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"sms:status:{send_id}"
+
+
+def get_send_status(send_id):
+    """
+    Return the status record of a send.
+
+    Args:
+        send_id (str): The identifier returned by `SmsDispatchQueue.enqueue`.
+
+    Returns:
+        dict: The status record, or None if it is unknown or expired.
+    """
+    return cache.get(status_key(send_id))
+
+
+class SmsDispatchQueue:
+    """
+    Background queue that delivers OTP messages through a pool of worker threads.
+
+    Failed sends are retried with exponential backoff up to `max_retries` times.
+    Each send keeps a status record in the cache, see `get_send_status`.
+
+    With a `batch_window` and a provider offering `send_bulk`, each worker collects
+    the messages arriving within the window after the first one (at most
+    `batch_max_size`) and sends them in one bulk call. Each message's result then
+    goes to its own status, and failed messages are retried one by one.
+    """
+
+    def __init__(self, provider, workers=4, max_retries=3, backoff=0.5, max_backoff=8.0, maxsize=10000,
+                 batch_window=0.0, batch_max_size=100):
+        """
+        Args:
+            provider: Object with a `send(phone_number, otp)` method, and optionally
+                `send_bulk(messages)` for batching.
+            workers (int): Number of worker threads.
+            max_retries (int): Retries after the first failed attempt.
+            backoff (float): Delay in seconds before the first retry, doubled on each retry.
+            max_backoff (float): Upper bound for the retry delay in seconds.
+            maxsize (int): Maximum number of messages waiting to be sent.
+            batch_window (float): Seconds a worker waits to fill a batch, 0 sends one by one.
+            batch_max_size (int): Maximum messages per bulk call.
+        """
+        self.provider = provider
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_window = batch_window if hasattr(provider, 'send_bulk') else 0.0
+        self.batch_max_size = batch_max_size
+        self._ready = queue.Queue(maxsize=maxsize)  # Messages that can be sent now
+        self._delayed = []  # Heap of (due_time, seq, job) waiting for a retry
+        self._seq = itertools.count()
+        self._delayed_cond = threading.Condition()
+        self._threads = []
+        self._started = False
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._pending = 0  # Messages not yet sent or failed for good
+        self._pending_cond = threading.Condition()
+
+    def start(self):
+        """
+        Start the worker threads and the retry scheduler, if not already running.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"sms-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            scheduler = threading.Thread(target=self._schedule, name="sms-retry-scheduler", daemon=True)
+            scheduler.start()
+            self._threads.append(scheduler)
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker threads after the messages already queued are handled.
+        Retries still waiting for their backoff delay are dropped.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for each thread.
+        """
+        with self._lock:
+            if not self._started:
+                return
+            self._stopping = True
+            for _ in range(self.workers):
+                self._ready.put(None)  # Sentinel that stops one worker
+            with self._delayed_cond:
+                self._delayed_cond.notify_all()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+            self._started = False
+
+    def enqueue(self, phone_number, otp, send_id=None):
+        """
+        Queue an OTP message for delivery and record its status.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+            send_id (str): Identifier to record the send under, generated if omitted.
+
+        Returns:
+            str: The send identifier, usable with `get_send_status`.
+
+        Raises:
+            QueueFullError: If the queue is at capacity.
+        """
+        job = self._new_job(phone_number, otp, send_id)
+        self._set_status(job, QUEUED)
+        self._put(job)
+        return job['send_id']
+
+    def _new_job(self, phone_number, otp, send_id=None):
+        self.start()
+        return {
+            'send_id': send_id or uuid.uuid4().hex,
+            'phone': phone_number,
+            'otp': otp,
+            'attempts': 0,
+            'queued_at': time.time(),
+        }
+
+    def _put(self, job):
+        with self._pending_cond:
+            self._pending += 1
+        try:
+            self._ready.put_nowait(job)
+        except queue.Full:
+            self._finish(job, FAILED, error="Dispatch queue is full")
+            raise QueueFullError("SMS dispatch queue is full")
+
+    def join(self, timeout=None):
+        """
+        Block until every queued message, including pending retries, has been sent or has failed.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the queue drained, False on timeout.
+        """
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def qsize(self):
+        """
+        Return the number of messages waiting to be sent, including pending retries.
+        """
+        with self._delayed_cond:
+            return self._ready.qsize() + len(self._delayed)
+
+    def _work(self):
+        while True:
+            job = self._ready.get()
+            if job is None:
+                return
+            if self.batch_window <= 0:
+                self._deliver_safely(job)
+                continue
+            jobs, stopping = self._collect(job)
+            if len(jobs) > 1:
+                self._deliver_batch(jobs)
+            else:
+                self._deliver_safely(job)
+            if stopping:
+                return
+
+    def _deliver_safely(self, job):
+        try:
+            self._deliver(job)
+        except Exception:  # Never let a worker die on an unexpected error
+            logger.exception("Unexpected error while sending SMS %s", job['send_id'])
+            self._finish(job, FAILED, error="Unexpected error")
+
+    def _collect(self, job):
+        """
+        Gather the messages arriving within the batch window after `job`.
+
+        Returns:
+            tuple: The batch, and whether the stop sentinel was taken from the queue.
+        """
+        jobs = [job]
+        deadline = time.monotonic() + self.batch_window
+        while len(jobs) < self.batch_max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._ready.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def _deliver_batch(self, jobs):
+        finished = set()
+        try:
+            records = {}
+            for job in jobs:
+                job['attempts'] += 1
+                records[status_key(job['send_id'])] = self._status_record(job, SENDING, batch_size=len(jobs))
+            cache.set_many(records, timeout=STATUS_TTL)
+            try:
+                with timed('sms'):
+                    results = self.provider.send_bulk([(job['phone'], job['otp']) for job in jobs])
+            except Exception as e:  # The whole call failed: each message is retried on its own
+                retryable = e.retryable if isinstance(e, SmsDeliveryError) else True
+                results = [SmsDeliveryError(str(e), retryable=retryable)] * len(jobs)
+            if len(results) != len(jobs):
+                raise ValueError(f"Provider returned {len(results)} results for {len(jobs)} messages")
+            sent_at = time.time()
+            for job, result in zip(jobs, results):
+                finished.add(job['send_id'])
+                if isinstance(result, SmsDeliveryError):
+                    self._fail(job, result, result.retryable)
+                else:
+                    self._finish(job, SENT, sent_at=sent_at, response=result, batch_size=len(jobs))
+        except Exception:  # Never let a worker die on an unexpected error
+            logger.exception("Unexpected error while sending a batch of %d SMS", len(jobs))
+            for job in jobs:
+                if job['send_id'] not in finished:
+                    self._finish(job, FAILED, error="Unexpected error")
+
+    def _deliver(self, job):
+        job['attempts'] += 1
+        self._set_status(job, SENDING)
+        try:
+            with timed('sms'):
+                response_data = self.provider.send(job['phone'], job['otp'])
+        except SmsDeliveryError as e:
+            self._fail(job, e, e.retryable)
+            return
+        except Exception as e:
+            self._fail(job, e, True)
+            return
+        self._finish(job, SENT, sent_at=time.time(), response=response_data)
+
+    def _fail(self, job, error, retryable):
+        if not retryable or job['attempts'] > self.max_retries:
+            logger.warning("Giving up on SMS %s after %d attempts: %s", job['send_id'], job['attempts'], error)
+            self._finish(job, FAILED, error=str(error))
+            return
+
+        delay = min(self.backoff * (2 ** (job['attempts'] - 1)), self.max_backoff)
+        self._set_status(job, RETRYING, error=str(error), retry_at=time.time() + delay)
+        with self._delayed_cond:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), job))
+            self._delayed_cond.notify()
+
+    def _schedule(self):
+        while True:
+            with self._delayed_cond:
+                while not self._stopping and (
+                    not self._delayed or self._delayed[0][0] > time.monotonic()
+                ):
+                    timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                    self._delayed_cond.wait(timeout)
+                if self._stopping:
+                    dropped = [job for _, _, job in self._delayed]
+                    self._delayed = []
+                    break
+                _, _, job = heapq.heappop(self._delayed)
+            self._ready.put(job)
+
+        for job in dropped:
+            self._finish(job, FAILED, error="Dispatch queue stopped")
+
+    def _finish(self, job, status, **extra):
+        self._set_status(job, status, **extra)
+        with self._pending_cond:
+            self._pending -= 1
+            if self._pending == 0:
+                self._pending_cond.notify_all()
+
+    def _set_status(self, job, status, **extra):
+        cache.set(status_key(job['send_id']), self._status_record(job, status, **extra), timeout=STATUS_TTL)
+
+    def _status_record(self, job, status, **extra):
+        record = {
+            'send_id': job['send_id'],
+            'phone': job['phone'],
+            'status': status,
+            'attempts': job['attempts'],
+            'queued_at': job['queued_at'],
+            'updated_at': time.time(),
+        }
+        record.update(extra)
+        return record
+
+
+_dispatch_queue = None
+_dispatch_queue_lock = threading.Lock()
+
+
+def get_dispatch_queue():
+    """
+    Return the process-wide dispatch queue, building it from settings on first use.
+
+    Returns:
+        SmsDispatchQueue: The shared dispatch queue.
+    """
+    global _dispatch_queue
+    if _dispatch_queue is None:
+        with _dispatch_queue_lock:
+            if _dispatch_queue is None:
+                _dispatch_queue = SmsDispatchQueue(
+                    build_sms_provider(),
+                    workers=getattr(settings, 'SMS_QUEUE_WORKERS', 4),
+                    max_retries=getattr(settings, 'SMS_QUEUE_MAX_RETRIES', 3),
+                    backoff=getattr(settings, 'SMS_QUEUE_BACKOFF', 0.5),
+                    max_backoff=getattr(settings, 'SMS_QUEUE_MAX_BACKOFF', 8.0),
+                    maxsize=getattr(settings, 'SMS_QUEUE_MAXSIZE', 10000),
+                    batch_window=getattr(settings, 'SMS_BATCH_WINDOW_MS', 0) / 1000,
+                    batch_max_size=getattr(settings, 'SMS_BATCH_MAX_SIZE', 100),
+                )
+    return _dispatch_queue
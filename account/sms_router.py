@@ -0,0 +1,297 @@
+# users/sms_router.py
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .sms_client import build_sms_client
+from .sms_providers import HttpSmsProvider, SmsDeliveryError
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHealth:
+    """
+    Rolling latency and error rate of one provider, as exponentially weighted moving
+    averages, and whether it is currently ejected for failing too often.
+
+    Each call's latency counts for at most `OUTLIER_FACTOR` times the average, so one
+    slow call does not push a fast provider out of rotation, while a sustained
+    slowdown still raises the average within a few calls.
+    """
+    OUTLIER_FACTOR = 3
+
+    def __init__(self, alpha=0.2, max_error_rate=0.5, eject_seconds=30.0):
+        """
+        Args:
+            alpha (float): Weight of the newest call in the moving averages.
+            max_error_rate (float): Error rate above which a failure ejects the provider.
+            eject_seconds (float): Seconds an ejected provider is only used as a last resort.
+        """
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.eject_seconds = eject_seconds
+        self.latency = None  # Seconds, of successful calls only; None until the first one
+        self.error_rate = 0.0
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        """
+        Add the outcome of a call to the averages.
+
+        Args:
+            seconds (float): Duration of the call.
+            ok (bool): Whether it succeeded.
+        """
+        with self._lock:
+            self.calls += 1
+            self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+            if ok:
+                if self.latency is None:
+                    self.latency = seconds
+                else:
+                    seconds = min(seconds, self.latency * self.OUTLIER_FACTOR)
+                    self.latency = self.alpha * seconds + (1 - self.alpha) * self.latency
+                return
+            self.errors += 1
+            if self.error_rate > self.max_error_rate:
+                self.ejected_until = time.monotonic() + self.eject_seconds
+
+    def healthy(self):
+        return time.monotonic() >= self.ejected_until
+
+    def score(self):
+        """
+        Return the expected cost of a call: lower is better. Providers without a
+        successful call yet score 0, so they are tried.
+        """
+        return (self.latency or 0.0) * (1 + self.error_rate)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'latency_ms': round(self.latency * 1000, 3) if self.latency is not None else None,
+                'error_rate': round(self.error_rate, 4),
+                'healthy': self.healthy(),
+                'calls': self.calls,
+                'errors': self.errors,
+            }
+
+
+class SmsRouter:
+    """
+    Provider that routes each send to the fastest healthy one of several providers.
+
+    Providers are ranked by rolling latency, weighted by their error rate; providers
+    ejected for failing are tried last. A failed send moves on to the next provider.
+    A send still running after `hedge_after` seconds is also started on the next
+    provider, and the first success wins, which cuts the tail latency of a slow
+    provider at the cost of the occasional duplicate SMS carrying the same code.
+
+    A share `explore_rate` of sends tries another healthy provider first, so that the
+    latency of a provider that was slow once, and then lost its traffic, stays current.
+
+    Bulk sends go to the best provider supporting them, failing over the same way,
+    but are never hedged.
+    """
+
+    def __init__(self, providers, hedge_after=1.5, alpha=0.2, max_error_rate=0.5, eject_seconds=30.0,
+                 explore_rate=0.05, max_workers=16, seed=None):
+        """
+        Args:
+            providers (dict): Provider objects by name, in order of preference.
+            hedge_after (float): Latency budget in seconds before hedging, 0 disables hedging.
+            alpha (float): Weight of the newest call in the rolling averages.
+            max_error_rate (float): Error rate above which a provider is ejected.
+            eject_seconds (float): Seconds an ejected provider is tried last.
+            explore_rate (float): Share (0-1) of sends tried first on another healthy provider.
+            max_workers (int): Threads running provider calls.
+            seed (int): Optional seed for reproducible exploration.
+        """
+        self.providers = dict(providers)
+        self.hedge_after = hedge_after
+        self.explore_rate = explore_rate
+        self.health = {
+            name: ProviderHealth(alpha=alpha, max_error_rate=max_error_rate, eject_seconds=eject_seconds)
+            for name in self.providers
+        }
+        self.hedges = 0
+        self._lock = threading.Lock()  # Guards the hedge count, updated from every dispatch worker
+        self._random = random.Random(seed)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sms-router')
+
+    def ranked(self, bulk=False):
+        """
+        Return the provider names in the order to try them.
+
+        Args:
+            bulk (bool): Only include providers with `send_bulk`.
+
+        Returns:
+            list: Healthy providers by score, then ejected ones.
+        """
+        names = [name for name, provider in self.providers.items() if not bulk or hasattr(provider, 'send_bulk')]
+        return sorted(names, key=lambda name: (not self.health[name].healthy(), self.health[name].score()))
+
+    def send(self, phone_number, otp):
+        """
+        Send the OTP through the best provider, failing over and hedging as needed.
+
+        Args:
+            phone_number (str): The phone number to send the OTP to.
+            otp (str): The OTP to send.
+
+        Returns:
+            dict: The winning provider's response data, with the provider name under `provider`.
+
+        Raises:
+            SmsDeliveryError: If every provider failed; retryable if any failure was.
+        """
+        candidates = self.ranked()
+        healthy = [name for name in candidates[1:] if self.health[name].healthy()]
+        if healthy and self._random.random() < self.explore_rate:
+            explored = self._random.choice(healthy)
+            candidates.remove(explored)
+            candidates.insert(0, explored)
+        pending = {}
+        errors = []
+
+        def launch():
+            name = candidates[len(pending) + len(errors)]
+            pending[self._executor.submit(self._call, name, 'send', phone_number, otp)] = name
+
+        launch()
+        while pending:
+            can_launch = len(pending) + len(errors) < len(candidates)
+            timeout = self.hedge_after if can_launch and self.hedge_after else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:  # Over the latency budget: hedge on the next provider
+                with self._lock:
+                    self.hedges += 1
+                metrics.sms_hedges.inc(())
+                launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return dict(future.result(), provider=name)
+                except SmsDeliveryError as e:
+                    errors.append(e)
+            if len(pending) + len(errors) < len(candidates):
+                launch()  # Fail over
+        raise SmsDeliveryError(
+            f"Every SMS provider failed: {'; '.join(str(e) for e in errors)}",
+            retryable=any(e.retryable for e in errors),
+        )
+
+    def send_bulk(self, messages):
+        """
+        Send many OTPs in one call to the best provider supporting bulk sends,
+        failing over to the next one if the whole call fails. Without any bulk
+        provider, the messages are routed one by one.
+
+        Args:
+            messages (list): `(phone_number, otp)` pairs.
+
+        Returns:
+            list: One result per message, as returned by the provider's `send_bulk`.
+
+        Raises:
+            SmsDeliveryError: If every bulk provider failed.
+        """
+        if not self.ranked(bulk=True):
+            results = []
+            for phone_number, otp in messages:
+                try:
+                    results.append(self.send(phone_number, otp))
+                except SmsDeliveryError as e:
+                    results.append(e)
+            return results
+        errors = []
+        for name in self.ranked(bulk=True):
+            try:
+                return self._call(name, 'send_bulk', messages)
+            except SmsDeliveryError as e:
+                errors.append(e)
+        raise SmsDeliveryError(
+            f"Every bulk SMS provider failed: {'; '.join(str(e) for e in errors)}",
+            retryable=any(e.retryable for e in errors),
+        )
+
+    def _call(self, name, method, *args):
+        started = time.perf_counter()
+        try:
+            result = getattr(self.providers[name], method)(*args)
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            self.health[name].record(elapsed, ok=False)
+            metrics.sms_provider_duration.observe((name, 'error'), elapsed)
+            if isinstance(e, SmsDeliveryError):
+                raise
+            raise SmsDeliveryError(f"{name}: {e}") from e
+        elapsed = time.perf_counter() - started
+        self.health[name].record(elapsed, ok=True)
+        metrics.sms_provider_duration.observe((name, 'ok'), elapsed)
+        return result
+
+    def stats(self):
+        """
+        Return each provider's rolling latency, error rate and health, and the hedge count.
+
+        Returns:
+            dict: Router statistics.
+        """
+        providers = {}
+        for name, provider in self.providers.items():
+            providers[name] = self.health[name].stats()
+            if hasattr(provider, 'stats'):
+                providers[name]['client'] = provider.stats()
+        with self._lock:
+            hedges = self.hedges
+        return {'providers': providers, 'hedges': hedges}
+
+
+def build_sms_provider():
+    """
+    Build the SMS provider from settings: the provider registry `SMS_PROVIDERS` routed
+    through an `SmsRouter` when it has several entries, else the single `SMS_PROVIDER`.
+
+    Each registry entry is `{'CLASS': dotted path, 'OPTIONS': keyword arguments}`. HTTP
+    providers in the registry get their own client, so one provider's circuit breaker
+    never blocks another.
+
+    Returns:
+        The provider, with `send` and possibly `send_bulk`.
+    """
+    registry = getattr(settings, 'SMS_PROVIDERS', {})
+    if not registry:
+        provider_class = import_string(getattr(settings, 'SMS_PROVIDER', 'account.sms_providers.SmsIrProvider'))
+        return provider_class(**getattr(settings, 'SMS_PROVIDER_OPTIONS', {}))
+
+    providers = {}
+    for name, entry in registry.items():
+        provider_class = import_string(entry['CLASS'])
+        options = dict(entry.get('OPTIONS', {}))
+        if issubclass(provider_class, HttpSmsProvider):
+            options.setdefault('client', build_sms_client())
+        providers[name] = provider_class(**options)
+    if len(providers) == 1:
+        return next(iter(providers.values()))
+    return SmsRouter(
+        providers,
+        hedge_after=getattr(settings, 'SMS_ROUTER_HEDGE_AFTER_MS', 1500) / 1000,
+        alpha=getattr(settings, 'SMS_ROUTER_EWMA_ALPHA', 0.2),
+        max_error_rate=getattr(settings, 'SMS_ROUTER_MAX_ERROR_RATE', 0.5),
+        eject_seconds=getattr(settings, 'SMS_ROUTER_EJECT_SECONDS', 30.0),
+        explore_rate=getattr(settings, 'SMS_ROUTER_EXPLORE_RATE', 0.05),
+        max_workers=getattr(settings, 'SMS_QUEUE_WORKERS', 4) * 2,
+    )
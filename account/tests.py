@@ -0,0 +1,448 @@
+# users/tests.py
+
+import csv
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from . import hashing, otp_store, sms_queue
+from .models import User
+from .otp_store import (
+    BLOCKED, EXPIRED, INVALID, VERIFIED, CacheOtpStore, OtpBlockedError, RedisOtpStore, TotpOtpStore,
+    get_otp_store,
+)
+from .phone_index import phone_index
+from .sms_client import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, SmsProviderClient
+from .utils import get_tokens_for_user
+
+try:
+    import fakeredis
+except ImportError:  # fakeredis is only needed by the Redis OTP store tests
+    fakeredis = None
+
+# Fast hashing inline, no rate limits, and an instant fake SMS provider instead of a real one
+TEST_SETTINGS = override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    PASSWORD_HASHING_WORKERS=0,
+    RATE_LIMIT_ENABLED=False,
+    SMS_PROVIDER='account.sms_providers.FakeSmsProvider',
+    SMS_PROVIDER_OPTIONS={'latency': 0},
+    SMS_PROVIDERS={},
+)
+
+PASSWORD = 'test-password-123'
+
+
+def setUpModule():
+    TEST_SETTINGS.enable()
+    # Process-wide singletons are built from the settings on first use
+    hashing._pool = None
+    sms_queue._dispatch_queue = None
+    otp_store._store = None
+
+
+def tearDownModule():
+    TEST_SETTINGS.disable()
+
+
+def wrong_code(code):
+    return '000000' if code != '000000' else '111111'
+
+
+class AuthFlowTests(TestCase):
+    """
+    check-phone -> verify -> register -> login through the sync views.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def _signup(self, phone, normalized):
+        response = self.client.post('/auth/check-phone/', {'phone': phone}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['exists'])
+        code = get_otp_store().get(normalized).code
+        self.assertTrue(code)
+        return code
+
+    def test_sync_flow(self):
+        code = self._signup('09121234567', '09121234567')
+        response = self.client.post('/auth/verify/', {'phone': '09121234567', 'code': code},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/auth/register/', {
+                'registration_token': response.json()['registration_token'],
+                'password': PASSWORD,
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('access', response.json()['tokens'])
+
+        response = self.client.post('/auth/check-phone/', {'phone': '09121234567'}, content_type='application/json')
+        self.assertEqual(response.json(), {'exists': True})
+        response = self.client.post('/auth/login/', {'phone': '09121234567', 'password': PASSWORD},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.json()['tokens'])
+        response = self.client.post('/auth/login/', {'phone': '09121234567', 'password': 'wrong'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_phone_forms_reach_the_same_account(self):
+        code = self._signup('+989121234567', '09121234567')
+        response = self.client.post('/auth/verify/', {'phone': '00989121234567', 'code': code},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/auth/register/', {
+                'registration_token': response.json()['registration_token'],
+                'password': PASSWORD,
+            }, content_type='application/json')
+        self.assertTrue(User.objects.filter(phone='09121234567').exists())
+
+        for phone in ('09121234567', '9121234567', '۰۹۱۲۱۲۳۴۵۶۷'):
+            response = self.client.post('/auth/check-phone/', {'phone': phone}, content_type='application/json')
+            self.assertEqual(response.json(), {'exists': True})
+        response = self.client.post('/auth/login/', {'phone': '989121234567', 'password': PASSWORD},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/auth/check-phone/', {'phone': '12345'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_inactive_user_cannot_log_in(self):
+        User.objects.create_user('09121234567', PASSWORD, is_active=False)
+        response = self.client.post('/auth/login/', {'phone': '09121234567', 'password': PASSWORD},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_is_recorded_as_returned(self):
+        user = User.objects.create_user('09121234567', PASSWORD)
+        tokens = get_tokens_for_user(user)
+        self.assertEqual(OutstandingToken.objects.get(user=user).token, tokens['refresh'])
+
+
+class AsyncAuthFlowTests(TransactionTestCase):
+    """
+    The same flow through the async views. Commits for real, so the phone index hooks
+    run as they do in production.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_async_flow(self):
+        response = await self.async_client.post('/auth/async/check-phone/', {'phone': '+989351234567'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['exists'])
+        code = get_otp_store().get('09351234567').code
+
+        response = await self.async_client.post('/auth/async/verify/', {'phone': '09351234567', 'code': code},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post('/auth/async/register/', {
+            'registration_token': response.json()['registration_token'],
+            'password': PASSWORD,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        response = await self.async_client.post('/auth/async/check-phone/', {'phone': '09351234567'},
+                                                content_type='application/json')
+        self.assertEqual(response.json(), {'exists': True})
+        response = await self.async_client.post('/auth/async/login/', {'phone': '9351234567', 'password': PASSWORD},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json()['tokens'])
+
+
+class PhoneIndexTests(TestCase):
+    """
+    The cached phone index stays coherent with registrations and deletions.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_registration_replaces_cached_negative(self):
+        self.assertFalse(phone_index.exists('09121234567'))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('09121234567', PASSWORD)
+        self.assertTrue(phone_index.exists('09121234567'))
+        self.assertEqual(phone_index.exists_many(['09121234567', '09121234568']),
+                         {'09121234567': True, '09121234568': False})
+
+    def test_database_read_never_overwrites_hook(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('09121234567', PASSWORD)
+        # A read that started before the registration committed
+        phone_index._fill('09121234567', False)
+        self.assertTrue(phone_index.exists('09121234567'))
+
+    def test_profile_deletion_frees_phone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user('09121234567', PASSWORD)
+        self.assertTrue(phone_index.exists('09121234567'))
+        access = get_tokens_for_user(user)['access']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/auth/profile/delete/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(phone_index.exists('09121234567'))
+
+    def test_row_deletion_frees_phone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user('09121234567', PASSWORD)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertFalse(phone_index.exists('09121234567'))
+
+
+class CircuitBreakerTests(TestCase):
+    """
+    Closed -> open -> half-open transitions of the SMS circuit breaker.
+    """
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_half_open_allows_one_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.allow()  # The trial call
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.allow()
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.trips, 2)
+
+    def test_unexpected_error_ends_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        client = SmsProviderClient(breaker=breaker)
+        breaker.record_failure()
+        session = mock.Mock()
+        session.post.side_effect = TypeError("not JSON serializable")
+        with mock.patch.object(client, '_session', return_value=session):
+            with self.assertRaises(TypeError):
+                client.post('https://sms.example/send', json={'x': object()})
+            with self.assertRaises(TypeError):  # Let through as a new trial, not rejected
+                client.post('https://sms.example/send', json={'x': object()})
+        self.assertEqual(client.errors, 2)
+
+
+class OtpStoreTestsMixin:
+    """
+    Attempts, blocking and single use, shared by every OTP store.
+    """
+    phone = '09121234567'
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        cache.clear()
+        self.store = self.make_store()
+
+    def verify(self, code):
+        return self.store.verify(self.phone, code, max_attempts=3, block_ttl=60, verified_ttl=60)
+
+    def test_correct_code_is_used_once(self):
+        code = self.store.issue(self.phone, 300)
+        self.assertEqual(self.verify(code), (VERIFIED, 0))
+        self.assertEqual(self.verify(code)[0], EXPIRED)
+
+    def test_persian_digits(self):
+        code = self.store.issue(self.phone, 300)
+        self.assertEqual(self.verify(code.translate(str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹'))), (VERIFIED, 0))
+
+    def test_wrong_codes_block(self):
+        code = self.store.issue(self.phone, 300)
+        self.assertEqual(self.verify(wrong_code(code)), (INVALID, 0))
+        self.assertEqual(self.verify(wrong_code(code)), (INVALID, 0))
+        outcome, retry_after = self.verify(wrong_code(code))
+        self.assertEqual(outcome, BLOCKED)
+        self.assertGreater(retry_after, 0)
+        self.assertEqual(self.verify(code)[0], BLOCKED)  # Even the right code
+        with self.assertRaises(OtpBlockedError):
+            self.store.issue(self.phone, 300)
+
+    def test_phones_are_independent(self):
+        code = self.store.issue(self.phone, 300)
+        for _ in range(3):
+            self.verify(wrong_code(code))
+        other = self.store.issue('09121234568', 300)
+        self.assertEqual(
+            self.store.verify('09121234568', other, max_attempts=3, block_ttl=60, verified_ttl=60), (VERIFIED, 0)
+        )
+
+
+class CacheOtpStoreTests(OtpStoreTestsMixin, TestCase):
+
+    def make_store(self):
+        return CacheOtpStore(prefix='test-otp')
+
+    def test_attempts_are_recorded(self):
+        code = self.store.issue(self.phone, 300)
+        self.verify(wrong_code(code))
+        self.assertEqual(self.store.get(self.phone).attempts, 1)
+
+    def test_new_code_resets_attempts(self):
+        code = self.store.issue(self.phone, 300)
+        self.verify(wrong_code(code))
+        self.store.issue(self.phone, 300)
+        self.assertEqual(self.store.get(self.phone).attempts, 0)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RedisOtpStoreTests(OtpStoreTestsMixin, TestCase):
+
+    def make_store(self):
+        with mock.patch('account.otp_store.get_redis', return_value=fakeredis.FakeRedis()):
+            return RedisOtpStore(prefix='test-otp')
+
+    def test_attempts_are_recorded(self):
+        code = self.store.issue(self.phone, 300)
+        self.verify(wrong_code(code))
+        self.assertEqual(self.store.get(self.phone).attempts, 1)
+
+
+class TotpOtpStoreTests(OtpStoreTestsMixin, TestCase):
+
+    def make_store(self):
+        return TotpOtpStore(prefix='test-otp', step=60, valid_steps=2)
+
+    def test_used_code_is_not_issued_again(self):
+        code = self.store.issue(self.phone, 300)
+        self.assertEqual(self.verify(code), (VERIFIED, 0))
+        again = self.store.issue(self.phone, 300)
+        self.assertNotEqual(again, code)
+        self.assertEqual(self.verify(again), (VERIFIED, 0))
+
+
+class ImportUsersTests(TestCase):
+    """
+    `import_users` conflicts report and checkpoint resume.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def _import(self, path, *args):
+        call_command('import_users', path, '--workers', '0', *args, stdout=StringIO())
+
+    def _conflicts(self, path):
+        with open(f"{path}.conflicts.csv", newline='') as f:
+            return {(row['phone'], row['reason']) for row in csv.DictReader(f)}
+
+    def test_conflicts(self):
+        User.objects.create_user('09120000001', PASSWORD)
+        path = self._write('users.jsonl', '\n'.join([
+            '{"phone": "+989120000002", "password": "secret-1", "first_name": "Sara"}',
+            '{"phone": "09120000002", "password": "secret-2"}',
+            '{"phone": "09120000001", "password": "secret-3"}',
+            '{"phone": "12345", "password": "secret-4"}',
+            '{"phone": "09120000003"}',
+            '{"phone": "09120000004", "password": 1234}',
+            '["09120000005"]',
+            '{"phone": "09120000006", "password_hash": "not-a-hash"}',
+            '{"phone": "09120000007", "password": "secret-7"}',
+        ]) + '\n')
+        self._import(path)
+
+        self.assertEqual(
+            set(User.objects.values_list('phone', flat=True)), {'09120000001', '09120000002', '09120000007'}
+        )
+        self.assertTrue(User.objects.get(phone='09120000002').check_password('secret-1'))
+        self.assertEqual(self._conflicts(path), {
+            ('09120000002', 'duplicate in file'),
+            ('09120000001', 'already registered'),
+            ('12345', 'invalid phone'),
+            ('09120000003', 'missing password'),
+            ('09120000004', 'invalid password'),
+            ('', 'not a JSON object'),
+            ('09120000006', 'unknown password hash format'),
+        })
+        self.assertTrue(phone_index.exists('09120000007'))
+
+    def test_resume_from_checkpoint(self):
+        path = self._write('users.csv', 'phone,password\n' + ''.join(
+            f"0912000000{i},secret-{i}\n" for i in range(1, 5)
+        ))
+        self._write('users.csv.checkpoint', '2')
+        self._import(path)
+        self.assertEqual(set(User.objects.values_list('phone', flat=True)), {'09120000003', '09120000004'})
+        with open(f"{path}.checkpoint") as f:
+            self.assertEqual(f.read(), '4')
+
+        self._import(path)  # Everything is committed: nothing left to do
+        self.assertEqual(User.objects.count(), 2)
+        self._import(path, '--restart')
+        self.assertEqual(User.objects.count(), 4)
+        self.assertIn(('09120000003', 'already registered'), self._conflicts(path))
+
+
+class ProfileConditionalTests(TestCase):
+    """
+    ETag and Last-Modified revalidation of `GET /auth/profile/`.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('09121234567', PASSWORD, first_name='Ali')
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {get_tokens_for_user(self.user)['access']}"}
+
+    def test_not_modified_until_profile_changes(self):
+        response = self.client.get('/auth/profile/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Ali')
+        etag = response['ETag']
+
+        response = self.client.get('/auth/profile/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.patch('/auth/profile/update/', {'first_name': 'Reza'},
+                                     content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.version, 2)
+
+        response = self.client.get('/auth/profile/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['first_name'], 'Reza')
+
+    def test_unchanged_update_skips_the_database(self):
+        with self.assertNumQueries(1):  # Loading the user only
+            response = self.client.patch('/auth/profile/update/', {'first_name': 'Ali'},
+                                         content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,288 @@
+# users/token_maintenance.py
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from . import metrics
+from .search_index import estimate_row_count
+
+logger = logging.getLogger(__name__)
+
+BUFFERED = getattr(settings, 'TOKEN_OUTSTANDING_BUFFER', False)  # Write outstanding tokens in batches
+BUFFER_SIZE = getattr(settings, 'TOKEN_OUTSTANDING_BUFFER_SIZE', 500)  # Rows per batch insert
+FLUSH_INTERVAL = getattr(settings, 'TOKEN_OUTSTANDING_FLUSH_INTERVAL', 1.0)  # Seconds a row may wait in the buffer
+PRUNE_INTERVAL = getattr(settings, 'TOKEN_PRUNE_INTERVAL', 3600)  # Seconds between scheduled prunes, 0 disables them
+PRUNE_BATCH_SIZE = getattr(settings, 'TOKEN_PRUNE_BATCH_SIZE', 1000)  # Tokens deleted per transaction
+PRUNE_PAUSE = getattr(settings, 'TOKEN_PRUNE_PAUSE', 0.05)  # Seconds to sleep between prune transactions
+PRUNE_MAX_ROWS = getattr(settings, 'TOKEN_PRUNE_MAX_ROWS', 100000)  # Tokens deleted per scheduled prune
+
+PRUNE_LOCK_KEY = 'tokens:prune:lock'  # Held by the process running the scheduled prune
+
+
+class BufferedRefreshToken(RefreshToken):
+    """
+    Refresh token that skips the outstanding-token INSERT of `RefreshToken.for_user`,
+    which would record the token before its extra claims are set; `create_refresh_token`
+    records the finished token itself, directly or through the `OutstandingTokenBuffer`.
+    Blacklisting works as usual, creating the row if it was not written yet.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return super(BlacklistMixin, cls).for_user(user)
+
+
+class OutstandingTokenBuffer:
+    """
+    Collects outstanding-token rows and writes them with one bulk INSERT per batch,
+    from a background thread, instead of one INSERT per login.
+
+    A batch is written once it holds `batch_size` rows or its oldest row has waited
+    `interval` seconds, and at process exit. If writes keep failing, rows beyond
+    `max_pending` are dropped; the table is only a record of issued tokens, and
+    blacklisting recreates a missing row.
+    """
+
+    def __init__(self, batch_size=500, interval=1.0, max_pending=None):
+        """
+        Args:
+            batch_size (int): Rows written per INSERT.
+            interval (float): Seconds between writes of a partial batch.
+            max_pending (int): Rows kept while writes fail, defaults to 20 batches.
+        """
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending or batch_size * 20
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, token, user):
+        """
+        Queue the outstanding-token row of a refresh token.
+
+        Args:
+            token (RefreshToken): The token, with all its claims set.
+            user (User): The user it was issued to.
+        """
+        self._start()
+        row = OutstandingToken(
+            user_id=user.pk,
+            jti=token[api_settings.JTI_CLAIM],
+            token=str(token),
+            created_at=token.current_time,
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+        metrics.token_buffer_size.set((), pending)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write every queued row.
+
+        Returns:
+            int: The number of rows written.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            OutstandingToken.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+        except Exception:
+            logger.exception("Writing %d outstanding tokens failed", len(rows))
+            with self._lock:
+                self._rows[:0] = rows
+                dropped = len(self._rows) - self.max_pending
+                if dropped > 0:
+                    del self._rows[:dropped]
+                    logger.warning("Dropped %d outstanding tokens", dropped)
+            return 0
+        finally:
+            metrics.token_buffer_size.set((), len(self._rows))
+        metrics.tokens_written.inc(('buffered',), len(rows))
+        return len(rows)
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="outstanding-token-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_token_buffer():
+    """
+    Return the process-wide outstanding-token buffer, configured from the
+    `TOKEN_OUTSTANDING_*` settings.
+
+    Returns:
+        OutstandingTokenBuffer: The shared buffer.
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = OutstandingTokenBuffer(batch_size=BUFFER_SIZE, interval=FLUSH_INTERVAL)
+    return _buffer
+
+
+def create_refresh_token(user, claims):
+    """
+    Create a refresh token for the user and record it in the outstanding-token table,
+    with one INSERT or, when `TOKEN_OUTSTANDING_BUFFER` is set, through the buffer.
+
+    Args:
+        user (User): The user the token is issued to.
+        claims (dict): Extra claims to set on the token.
+
+    Returns:
+        RefreshToken: The token.
+    """
+    token = BufferedRefreshToken.for_user(user)  # Recorded below, once every claim is set
+    for claim, value in claims.items():
+        token[claim] = value
+    if BUFFERED:
+        get_token_buffer().add(token, user)
+        return token
+    OutstandingToken.objects.create(
+        user_id=user.pk,
+        jti=token[api_settings.JTI_CLAIM],
+        token=str(token),  # The exact string returned to the client
+        created_at=token.current_time,
+        expires_at=datetime_from_epoch(token['exp']),
+    )
+    metrics.tokens_written.inc(('direct',))
+    return token
+
+
+def prune_expired_tokens(batch_size=1000, pause=0.05, limit=None, progress=None):
+    """
+    Delete expired outstanding tokens, with their blacklist entries, in batches.
+
+    Batches are walked in id order, `batch_size` tokens per transaction with a pause
+    after each, so pruning a large backlog never holds long locks.
+
+    Args:
+        batch_size (int): Tokens deleted per transaction.
+        pause (float): Seconds to sleep after each transaction.
+        limit (int): Stop after this many outstanding tokens, None for all.
+        progress (callable): Called with the running totals after each batch.
+
+    Returns:
+        dict: The number of outstanding and blacklisted tokens deleted.
+    """
+    now = timezone.now()
+    totals = {'outstanding': 0, 'blacklisted': 0}
+    last_id = 0
+    while limit is None or totals['outstanding'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals['outstanding'])
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lt=now, pk__gt=last_id)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not ids:
+            break
+        _, deleted = OutstandingToken.objects.filter(pk__in=ids).delete()  # Cascades to BlacklistedToken
+        blacklisted = deleted.get(BlacklistedToken._meta.label, 0)
+        totals['outstanding'] += len(ids)
+        totals['blacklisted'] += blacklisted
+        metrics.tokens_pruned.inc(('outstanding',), len(ids))
+        metrics.tokens_pruned.inc(('blacklisted',), blacklisted)
+        if progress is not None:
+            progress(totals)
+        if len(ids) < size:
+            break
+        last_id = ids[-1]
+        time.sleep(pause)
+    return totals
+
+
+def token_table_rows():
+    """
+    Estimate the size of the token tables from the database statistics.
+
+    Returns:
+        dict: Estimated rows keyed by `(table,)`.
+    """
+    return {
+        (name,): estimate_row_count(model) or 0
+        for name, model in (('outstanding', OutstandingToken), ('blacklisted', BlacklistedToken))
+    }
+
+
+metrics.token_rows.collect = token_table_rows
+
+_pruner = None
+_pruner_lock = threading.Lock()
+
+
+def start_pruner():
+    """
+    Start this process's scheduled prune, every `TOKEN_PRUNE_INTERVAL` seconds.
+    Called once per process from `AccountConfig.ready`.
+
+    Every process runs the schedule, but a cache lock lets only one of them prune in
+    each interval. The lock needs a cache shared by all processes, so without one
+    nothing is scheduled and `prune_tokens` should run from cron instead. Does nothing
+    when the interval is 0.
+    """
+    global _pruner
+    if _pruner is not None or not PRUNE_INTERVAL:
+        return
+    from .utils import cache_is_shared
+
+    if not cache_is_shared():
+        logger.info("Scheduled token pruning is off: the default cache is not shared; run prune_tokens from cron")
+        return
+    with _pruner_lock:
+        if _pruner is None:
+            _pruner = threading.Thread(target=_prune_periodically, name="token-pruner", daemon=True)
+            _pruner.start()
+
+
+def _prune_periodically():
+    while True:
+        time.sleep(PRUNE_INTERVAL)
+        if not cache.add(PRUNE_LOCK_KEY, True, timeout=PRUNE_INTERVAL):
+            continue  # Another process prunes this interval
+        try:
+            close_old_connections()
+            totals = prune_expired_tokens(batch_size=PRUNE_BATCH_SIZE, pause=PRUNE_PAUSE, limit=PRUNE_MAX_ROWS)
+            logger.info("Pruned %(outstanding)d outstanding and %(blacklisted)d blacklisted tokens", totals)
+        except Exception:
+            logger.exception("Pruning expired tokens failed")
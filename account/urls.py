@@ -9,7 +9,9 @@ from .views import (
     update_user_profile,
     delete_user_profile,
     register_user,
-    login
+    login,
+    lookup_phones,
+    sms_stats
 )
 
 urlpatterns = [
@@ -21,4 +23,6 @@ urlpatterns = [
     path('profile/delete/', delete_user_profile),  # Delete user profile
     path('register/', register_user),  # User registration endpoint
     path('check-phone/', check_phone_or_send_otp),  # Check phone number or send OTP
+    path('lookup-phones/', lookup_phones),  # Which of many phones are registered, for contact sync
+    path('sms/stats/', sms_stats),  # SMS client pool and circuit breaker statistics (staff only)
 ]
@@ -1,9 +1,66 @@
 # users/utils.py
 
-from datetime import timedelta
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
-from django.utils.timezone import now
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.db import transaction
+from django.db.models import F
+
+from .metrics import timed
+from .token_maintenance import create_refresh_token
+
+USER_VERSION_TTL = getattr(settings, 'USER_VERSION_TTL', 24 * 3600)  # How long a user's version stays cached
+DELETED_USER_VERSION = 0  # Cached for deleted users; never matches a token's version
+
+# Persian and Arabic-Indic digits mapped to ASCII
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+_PHONE_SEPARATORS = re.compile(r'[\s\-().]')
+_MOBILE_PHONE = re.compile(r'^09\d{9}$')
+
+# Token claims holding the profile snapshot and the version it was taken at
+PROFILE_CLAIM = 'prf'
+VERSION_CLAIM = 'ver'
+
+
+def ascii_digits(value):
+    """
+    Replace the Persian and Arabic-Indic digits of a string with ASCII digits.
+
+    Args:
+        value (str): The text as entered.
+
+    Returns:
+        str: The text with ASCII digits.
+    """
+    return str(value).translate(_DIGITS)
+
+
+def normalize_phone(phone):
+    """
+    Normalize an Iranian mobile number to the local 09XXXXXXXXX form.
+
+    Accepts Persian/Arabic digits, separators and the +98/0098/98 country prefixes.
+
+    Args:
+        phone (str): The phone number as entered.
+
+    Returns:
+        str: The normalized phone number, or None if it is not a valid mobile number.
+    """
+    if not phone:
+        return None
+    phone = _PHONE_SEPARATORS.sub('', ascii_digits(phone))
+    if phone.startswith('+98'):
+        phone = '0' + phone[3:]
+    elif phone.startswith('0098'):
+        phone = '0' + phone[4:]
+    elif phone.startswith('98') and len(phone) == 12:
+        phone = '0' + phone[2:]
+    elif phone.startswith('9') and len(phone) == 10:
+        phone = '0' + phone
+    return phone if _MOBILE_PHONE.match(phone) else None
 
 
 def get_tokens_for_user(user):
@@ -16,46 +73,131 @@ def get_tokens_for_user(user):
     Returns:
         dict: A dictionary containing the refresh and access tokens.
     """
-    refresh = RefreshToken.for_user(user)  # Generate a refresh token for the user
+    with timed('jwt'):
+        # Embed a profile snapshot, copied into every access token minted from this refresh token
+        refresh = create_refresh_token(user, {PROFILE_CLAIM: profile_snapshot(user), VERSION_CLAIM: user.version})
+        cache_user_version(user.pk, user.version)
+        return {
+            'refresh': str(refresh),  # Return the refresh token as a string
+            'access': str(refresh.access_token),  # Return the access token as a string
+        }
+
+
+# Token creation writes an OutstandingToken row, so it runs in a worker thread
+aget_tokens_for_user = sync_to_async(get_tokens_for_user)
+
+
+def profile_snapshot(user):
+    """
+    Return the compact profile snapshot embedded in the user's tokens.
+
+    Args:
+        user (User): The user to snapshot.
+
+    Returns:
+        dict: Phone, first name, last name, email and last update time under short keys.
+    """
     return {
-        'refresh': str(refresh),  # Return the refresh token as a string
-        'access': str(refresh.access_token),  # Return the access token as a string
+        'ph': user.phone,
+        'fn': user.first_name,
+        'ln': user.last_name,
+        'em': user.email,
+        'up': int(user.updated_at.timestamp()) if user.updated_at else None,
     }
 
 
-def is_blocked(ip_or_phone):
+# Backends whose entries other worker processes cannot see
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    """
+    Return whether a configured cache is shared by all worker processes.
+
+    Looks through `InstrumentedCache` and `TieredCache` to the backend storing the entries.
+
+    Args:
+        alias (str): The `CACHES` alias.
+
+    Returns:
+        bool: False for process-local backends such as `LocMemCache`.
+    """
+    config = settings.CACHES.get(alias, {})
+    backend = config.get('BACKEND', '')
+    options = config.get('OPTIONS', {})
+    if backend == 'account.cache_backends.InstrumentedCache':
+        backend = options.get('BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+    elif backend == 'account.cache_backends.TieredCache':
+        return cache_is_shared(options.get('L2', 'shared'))
+    return backend not in PROCESS_LOCAL_CACHES
+
+
+def snapshot_auth_enabled():
+    """
+    Return whether requests may authenticate from the profile snapshot in their token.
+
+    The snapshot is checked against the user version cached by `bump_user_version`, so
+    with a process-local cache one worker would keep trusting a snapshot another worker
+    invalidated. `USER_SNAPSHOT_AUTH` None enables it only when the default cache is shared.
+
+    Returns:
+        bool: True to trust current snapshots, False to always load the user.
+    """
+    enabled = getattr(settings, 'USER_SNAPSHOT_AUTH', None)
+    return cache_is_shared() if enabled is None else enabled
+
+
+def user_version_key(user_id):
     """
-    Check if the given IP or phone number is blocked.
+    Return the cache key holding the user's current version.
 
     Args:
-        ip_or_phone (str): The IP address or phone number to check.
+        user_id (int): The user's primary key.
 
     Returns:
-        bool: True if blocked, False otherwise.
+        str: The cache key.
     """
-    return cache.get(f"blocked:{ip_or_phone}") is not None  # Check if the block key exists in cache
+    return f"user:ver:{user_id}"
 
 
-def block_for_1_hour(ip_or_phone):
+def cache_user_version(user_id, version):
     """
-    Block the given IP or phone number for 1 hour.
+    Store the user's current version in the cache.
 
     Args:
-        ip_or_phone (str): The IP address or phone number to block.
+        user_id (int): The user's primary key.
+        version (int): The current version, `DELETED_USER_VERSION` for deleted users.
     """
-    cache.set(f"blocked:{ip_or_phone}", True, timeout=3600)  # Set the block status in cache for 1 hour
+    cache.set(user_version_key(user_id), version, timeout=USER_VERSION_TTL)
 
 
-def increase_attempt(key):
+def get_cached_user_version(user_id):
     """
-    Increase the attempt counter for the given key and return the new count.
+    Return the user's cached version.
 
     Args:
-        key (str): The key to track the number of attempts (e.g., IP or phone).
+        user_id (int): The user's primary key.
 
     Returns:
-        int: The updated number of attempts.
+        int: The cached version, or None if it is not cached.
+    """
+    return cache.get(user_version_key(user_id))
+
+
+def bump_user_version(user):
+    """
+    Save the user's changed columns and increment its version in the same UPDATE,
+    then cache the new version, invalidating the profile snapshots in tokens issued
+    before the change.
+
+    Args:
+        user (User): The user whose profile changed, with the changes assigned but not saved.
     """
-    count = cache.get(key, 0)  # Get the current attempt count, default to 0
-    cache.set(key, count + 1, timeout=3600)  # Increment the attempt count in cache for 1 hour
-    return count + 1  # Return the new attempt count
+    with transaction.atomic():
+        user.version = F('version') + 1
+        user.save()  # UPDATE of the changed columns and the version only
+        user.refresh_from_db(fields=['version'])  # The version concurrent updates left
+    cache_user_version(user.pk, user.version)
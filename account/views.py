@@ -1,16 +1,37 @@
 # accounts/views.py
 
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from .authentication import ClaimsJWTAuthentication
+from .deletion import tombstone_user
 from .models import User
-from .otp_utils import generate_otp, verify_otp, send_otp_sms
-from .utils import increase_attempt, is_blocked, get_tokens_for_user
-from django.contrib.auth import authenticate
+from .hashing import HashingSaturatedError
+from .login_service import login_with_password, server_timing
+from . import metrics
+from .metrics import timed
+from .otp_store import OtpBlockedError
+from .otp_utils import pending_send, verify_otp, send_otp_sms
+from .phone_index import phone_index
+from .profile_cache import get_profile_body, invalidate_profile, profile_etag, profile_last_modified
+from .ratelimit import get_rate_limiter
+from .serializers import UserSerializer
+from .sms_queue import QueueFullError, get_dispatch_queue
+from .sms_router import SmsRouter
+from .utils import bump_user_version, get_tokens_for_user, normalize_phone
 from rest_framework import status
+import json
 import uuid
+from django.conf import settings
 from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+PHONE_LOOKUP_MAX_PHONES = getattr(settings, 'PHONE_LOOKUP_MAX_PHONES', 5000)  # Phones per lookup request
+PHONE_LOOKUP_CHUNK_SIZE = getattr(settings, 'PHONE_LOOKUP_CHUNK_SIZE', 500)  # Phones per cache round trip and IN query
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -29,25 +50,38 @@ def check_phone_or_send_otp(request):
 
     if not phone:
         return Response({"error": "Phone number is required."}, status=400)
+    phone = normalize_phone(phone)  # One form for +98, 0098, 98 and 9 prefixes and Persian digits
+    if phone is None:
+        return Response({"error": "Invalid phone number."}, status=400)
 
     # Check if user exists
-    user_exists = User.objects.filter(phone=phone).exists()
+    user_exists = phone_index.exists(phone)
 
     if user_exists:
         return Response({"exists": True})
     else:
-        # Rate limiting for OTP sending
-        key = f"otp_send_{ip}"
-        if is_blocked(key):
-            return Response({"error": "Too many OTP requests. Please try again later."}, status=429)
-
-        # Generate and send OTP
-        otp = send_otp_sms(phone)
-        increase_attempt(key)
+        # A code sent within the resend cooldown is reused, without counting against the limit
+        sent = pending_send(phone)
+        if sent is None:
+            # Rate limiting for OTP sending
+            limit = get_rate_limiter().hit('check-phone', phone=phone, ip=ip)
+            if not limit.allowed:
+                return Response({"error": "Too many OTP requests. Please try again later."}, status=429,
+                                headers={'Retry-After': str(limit.retry_after)})
+
+            # Generate the OTP and queue the SMS, unless a concurrent request just did
+            try:
+                sent = send_otp_sms(phone)
+            except OtpBlockedError as e:
+                return Response({"error": "Too many wrong OTP attempts. You are blocked."}, status=403,
+                                headers={'Retry-After': str(e.retry_after)})
+            except QueueFullError:
+                return Response({"error": "SMS service is busy. Please try again later."}, status=503)
 
         return Response({
             "exists": False,
-            "message": "OTP sent successfully."
+            "message": "OTP already sent." if sent["reused"] else "OTP sent successfully.",
+            "resend_in": sent["resend_in"],
         })
 
 @api_view(['POST'])
@@ -64,15 +98,20 @@ def verify(request):
     """
     phone = request.data.get("phone")
     code = request.data.get("code")
-    ip = request.META.get('REMOTE_ADDR')
-    otp_key = f"otp_verify_{phone}_{ip}"
 
-    if is_blocked(otp_key):
-        return Response({"error": "Too many attempts. You are blocked."}, status=403)
+    if not phone or not code:
+        return Response({"error": "Phone number and code are required."}, status=400)
+    phone = normalize_phone(phone)
+    if phone is None:
+        return Response({"error": "Invalid phone number."}, status=400)
 
-    if not verify_otp(phone, code):
-        increase_attempt(otp_key)
-        return Response({"error": "Incorrect OTP."}, status=400)
+    # One atomic update of the phone's OTP record: check, count wrong attempts, block
+    result, status_code = verify_otp(phone, code)
+    if not result["success"]:
+        if "retry_after" in result:
+            return Response({"error": "Too many attempts. You are blocked."}, status=status_code,
+                            headers={'Retry-After': str(result["retry_after"])})
+        return Response({"error": "Incorrect OTP."}, status=status_code)
 
     # Generate registration token
     reg_token = uuid.uuid4().hex
@@ -101,28 +140,16 @@ def login(request):
 
     if not phone or not password:
         return Response({"error": "Phone number and password are required."}, status=400)
+    phone = normalize_phone(phone)
+    if phone is None:
+        return Response({"error": "Invalid phone number."}, status=400)
 
-    # Check if user exists
-    user = User.objects.filter(phone=phone).first()
-
-    if not user:
-        return Response({"error": "Phone number not registered."}, status=400)
-
-    # Check if the user is blocked
-    key = f"login_{phone}_{ip}"
-    if is_blocked(key):
-        return Response({"error": "Temporary access blocked."}, status=403)
-
-    # Validate password
-    user = authenticate(request, phone=phone, password=password)
-
-    if user:
-        tokens = get_tokens_for_user(user)
-        return Response({"message": "Login successful.", "tokens": tokens})
-    else:
-        if increase_attempt(key) >= 3:
-            return Response({"error": "You are blocked due to too many failed login attempts."}, status=403)
-        return Response({"error": "Incorrect password."}, status=401)
+    # Check the block state, load the user once, verify the password and mint tokens
+    result = login_with_password(phone, password, ip)
+    headers = {'Server-Timing': server_timing(result.timings)}
+    if result.retry_after:
+        headers['Retry-After'] = str(result.retry_after)
+    return Response(result.body, status=result.status, headers=headers)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -143,7 +170,7 @@ def register_user(request):
     email = request.data.get("email", "")
 
     # Validate registration token
-    phone = cache.get(f"reg_token:{reg_token}")
+    phone = normalize_phone(cache.get(f"reg_token:{reg_token}"))  # Verified phones are stored normalized
     if not phone:
         return Response({"error": "Invalid or expired registration token."}, status=403)
 
@@ -154,12 +181,18 @@ def register_user(request):
     if not password:
         return Response({"error": "Password is required."}, status=400)
 
-    # Create and save user
-    user = User.objects.create_user(phone=phone, password=password)
-    user.first_name = first_name
-    user.last_name = last_name
-    user.email = email
-    user.save()
+    # Create the user with a single INSERT
+    try:
+        user = User.objects.create_user(
+            phone=phone,
+            password=password,
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+        )
+    except (HashingSaturatedError, TimeoutError):
+        return Response({"error": "Server is busy. Please try again later."}, status=503,
+                        headers={'Retry-After': '1'})
 
     # Delete registration token from cache
     cache.delete(f"reg_token:{reg_token}")
@@ -171,6 +204,7 @@ def register_user(request):
     }, status=201)
 
 @api_view(['POST'])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def refresh_jwt_token(request):
     """
@@ -187,38 +221,102 @@ def refresh_jwt_token(request):
         return Response({"error": "Refresh token is required."}, status=400)
 
     try:
-        refresh = RefreshToken(refresh_token)
-        access_token = str(refresh.access_token)
+        with timed('jwt'):
+            refresh = RefreshToken(refresh_token)
+            access_token = str(refresh.access_token)
         return Response({"access": access_token})
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request):
     """
     Retrieve the authenticated user's profile information.
+    The user usually comes from the access token's profile snapshot, without a query.
+
+    Responses carry an ETag (the user version) and Last-Modified, so clients polling
+    with If-None-Match or If-Modified-Since get `304 Not Modified` until the profile
+    changes. The rendered body is cached per user version.
 
     Args:
         request (Request): The request object containing user details.
 
     Returns:
-        Response: API response with user's profile information.
+        HttpResponse: API response with user's profile information, or 304.
     """
     user = request.user
-    return Response({
-        'phone': user.phone,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'email': user.email,
-    })
+    etag = profile_etag(user)
+    last_modified = profile_last_modified(user)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(get_profile_body(user), content_type='application/json')
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'  # Clients must revalidate, which is cheap
+    return response
 
-@api_view(['PUT'])
+@api_view(['POST'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def lookup_phones(request):
+    """
+    Report which of many phone numbers are registered, for contact-sync clients.
+
+    Phones are normalized, then resolved through the phone index (one cache read,
+    and one `IN` query per chunk of phones the cache did not know) before the
+    view returns, so the work stays within the request's admission slot and timings.
+    Nothing is sent and nothing is written besides the cache. The results are
+    streamed as one JSON line per phone, in request order. Each distinct valid phone
+    costs one token of the caller's `phone-lookup` rate limit.
+
+    Args:
+        request (Request): The request object containing the `phones` list.
+
+    Returns:
+        StreamingHttpResponse: NDJSON lines `{"phone", "normalized", "registered"}`,
+        or `{"phone", "error"}` for invalid numbers.
+    """
+    phones = request.data.get("phones")
+    if not isinstance(phones, list) or not phones:
+        return Response({"error": "A non-empty list of phone numbers is required."}, status=400)
+    if len(phones) > PHONE_LOOKUP_MAX_PHONES:
+        return Response({"error": f"At most {PHONE_LOOKUP_MAX_PHONES} phone numbers per request."}, status=400)
+
+    normalized = [normalize_phone(phone) if isinstance(phone, (str, int)) else None for phone in phones]
+    cost = len({phone for phone in normalized if phone})
+    limit = get_rate_limiter().hit('phone-lookup', phone=request.user.phone, cost=max(cost, 1))
+    if not limit.allowed:
+        return Response({"error": "Too many phone lookups. Please try again later."}, status=429,
+                        headers={'Retry-After': str(limit.retry_after)})
+
+    registered = phone_index.exists_many([phone for phone in normalized if phone], chunk_size=PHONE_LOOKUP_CHUNK_SIZE)
+    return StreamingHttpResponse(_lookup_lines(phones, normalized, registered), content_type='application/x-ndjson')
+
+def _lookup_lines(phones, normalized, registered):
+    # One block of NDJSON lines per chunk of phones; only serialization runs while streaming
+    for start in range(0, len(phones), PHONE_LOOKUP_CHUNK_SIZE):
+        chunk = normalized[start:start + PHONE_LOOKUP_CHUNK_SIZE]
+        lines = []
+        for raw, phone in zip(phones[start:start + PHONE_LOOKUP_CHUNK_SIZE], chunk):
+            if phone is None:
+                line = {"phone": raw, "error": "Invalid phone number."}
+            else:
+                line = {"phone": raw, "normalized": phone, "registered": registered[phone]}
+            lines.append(json.dumps(line) + "\n")
+        yield "".join(lines)
+
+@api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def update_user_profile(request):
     """
     Update the authenticated user's profile information.
 
+    Only the fields present in the request are changed, for both PUT and PATCH. Only
+    changed columns are written, and a request that changes nothing skips the database.
+
     Args:
         request (Request): The request object containing the new profile data.
 
@@ -226,17 +324,17 @@ def update_user_profile(request):
         Response: API response indicating successful profile update.
     """
     user = request.user
-    user.first_name = request.data.get('first_name', user.first_name)
-    user.last_name = request.data.get('last_name', user.last_name)
-    user.email = request.data.get('email', user.email)
-    user.save()
+    serializer = UserSerializer(user, data=request.data, partial=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    for field, value in serializer.validated_data.items():
+        setattr(user, field, value)
+    if user.get_dirty_fields():
+        bump_user_version(user)  # One UPDATE of the changed columns and the version
+        invalidate_profile(user.pk)
     return Response({
         'message': 'Profile updated successfully',
-        'data': {
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'email': user.email,
-        }
+        'data': UserSerializer(user).data,
     })
 
 @api_view(['DELETE'])
@@ -245,12 +343,57 @@ def delete_user_profile(request):
     """
     Delete the authenticated user's profile.
 
+    The account is deactivated and its phone freed at once; its tokens and other
+    related rows are removed later by the `purge_deleted_users` command.
+
     Args:
         request (Request): The request object for deleting the profile.
 
     Returns:
         Response: API response indicating successful profile deletion.
     """
-    user = request.user
-    user.delete()
+    tombstone_user(request.user)
     return Response({'message': 'User deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sms_stats(request):
+    """
+    Report the SMS provider client's connection pool and circuit breaker statistics
+    along with the dispatch queue depth for this worker process. When several
+    providers are configured, each has its own client, reported under `routing`
+    with the provider's rolling latency and health.
+
+    Args:
+        request (Request): The request object from a staff user.
+
+    Returns:
+        Response: API response with the SMS delivery statistics.
+    """
+    dispatch = get_dispatch_queue()
+    provider = dispatch.provider
+    stats = {'queue_depth': dispatch.qsize()}
+    if isinstance(provider, SmsRouter):
+        stats['routing'] = provider.stats()
+    elif hasattr(provider, 'stats'):
+        stats['client'] = provider.stats()  # The client the provider actually sends with
+    return Response(stats)
+
+
+@require_GET
+def export_metrics(request):
+    """
+    Export the request and stage timing histograms of this worker process in the
+    Prometheus text format. When `METRICS_TOKEN` is set, scrapers must send it as a
+    bearer token.
+
+    Args:
+        request (HttpRequest): The scrape request.
+
+    Returns:
+        HttpResponse: The metrics in the Prometheus text exposition format.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
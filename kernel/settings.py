@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'account.middleware.StageTimingMiddleware',
+    'account.middleware.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -154,9 +156,135 @@ SIMPLE_JWT = {
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "account.cache_backends.InstrumentedCache",  # Times cache calls, see METRICS_* below
         "LOCATION": "unique-dev-cache",
+        "OPTIONS": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
     }
 }
 
 CACHE_TTL = 300 
+
+# SMS delivery
+SMS_IR_API_KEY = os.environ.get('SMS_IR_API_KEY', '')
+SMS_IR_BASE_URL = os.environ.get('SMS_IR_BASE_URL', 'https://api.sms.ir/v1')  # sms.ir API root
+SMS_IR_TEMPLATE_ID = int(os.environ.get('SMS_IR_TEMPLATE_ID', '0'))
+SMS_IR_LINE_NUMBER = int(os.environ.get('SMS_IR_LINE_NUMBER', '0'))  # Sender line of bulk sends
+SMS_IR_BULK_TEXT = 'Your verification code: {code}'  # Text of bulk sends, which cannot use the verify template
+SMS_PROVIDER = os.environ.get('SMS_PROVIDER', 'account.sms_providers.SmsIrProvider')
+SMS_PROVIDER_OPTIONS = {}  # Keyword arguments for the provider class
+# Providers routed by latency with failover, used instead of SMS_PROVIDER when set, e.g.
+# {'smsir': {'CLASS': 'account.sms_providers.SmsIrProvider'},
+#  'kavenegar': {'CLASS': 'account.sms_providers.KavenegarProvider',
+#                'OPTIONS': {'api_key': os.environ.get('KAVENEGAR_API_KEY', ''), 'template': 'verify'}}}
+SMS_PROVIDERS = {}
+SMS_ROUTER_HEDGE_AFTER_MS = 1500  # Milliseconds before a slow send is also started on the next provider, 0 disables
+SMS_ROUTER_EWMA_ALPHA = 0.2  # Weight of the newest call in each provider's rolling latency and error rate
+SMS_ROUTER_MAX_ERROR_RATE = 0.5  # Rolling error rate above which a provider is ejected
+SMS_ROUTER_EJECT_SECONDS = 30.0  # Seconds an ejected provider is only tried last
+SMS_ROUTER_EXPLORE_RATE = 0.05  # Share of sends tried first on another healthy provider, to keep its latency current
+SMS_QUEUE_WORKERS = 4  # Background threads sending SMS per process
+SMS_QUEUE_MAX_RETRIES = 3  # Retries after the first failed attempt
+SMS_QUEUE_BACKOFF = 0.5  # Seconds before the first retry, doubled on each retry
+SMS_QUEUE_MAX_BACKOFF = 8.0
+SMS_QUEUE_MAXSIZE = 10000  # Messages waiting to be sent before new sends are rejected
+SMS_BATCH_WINDOW_MS = 0  # Milliseconds a worker collects messages into one bulk call, 0 sends one by one
+SMS_BATCH_MAX_SIZE = 100  # Messages per bulk call
+SMS_STATUS_TTL = 3600  # How long a send's status record is kept
+SMS_HTTP_CONNECT_TIMEOUT = 3.0  # Seconds allowed to connect to the SMS provider
+SMS_HTTP_READ_TIMEOUT = 10.0  # Seconds allowed to wait for the SMS provider's response
+SMS_HTTP_POOL_MAXSIZE = 8  # Keep-alive connections per worker thread
+SMS_BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures that open the circuit breaker
+SMS_BREAKER_RESET_TIMEOUT = 30.0  # Seconds before a trial call is let through an open breaker
+
+# Rate limiting
+REDIS_URL = os.environ.get('REDIS_URL', '')  # Used by the Redis-backed stores
+RATE_LIMIT_ENABLED = True
+# Use account.ratelimit.SharedMemoryBackend for several workers on one host, account.ratelimit.RedisBackend across hosts
+RATE_LIMIT_BACKEND = 'account.ratelimit.InMemoryBackend'
+RATE_LIMIT_BACKEND_OPTIONS = {}
+RATE_LIMITS = {
+    # OTP sends per client IP
+    'check-phone': {'policy': 'sliding_window', 'limit': 10, 'window': 3600, 'key': 'ip'},
+    # Wrong passwords per phone and IP
+    'login': {'policy': 'sliding_window', 'limit': 3, 'window': 3600, 'key': 'phone+ip'},
+    # Phones looked up per signed-in user: a whole address book at once, then 2 per second
+    'phone-lookup': {'policy': 'token_bucket', 'rate': 2, 'capacity': 5000, 'key': 'phone'},
+}
+
+# Phone-existence cache
+PHONE_INDEX_POSITIVE_TTL = 24 * 3600  # Seconds a registered phone stays cached
+PHONE_INDEX_NEGATIVE_TTL = 600  # Seconds an unregistered phone stays cached
+PHONE_LOOKUP_MAX_PHONES = 5000  # Phones per batch lookup request, at most the 'phone-lookup' bucket capacity
+PHONE_LOOKUP_CHUNK_SIZE = 500  # Phones per cache round trip and IN query
+
+# Password hashing pool
+PASSWORD_HASHING_WORKERS = min(4, os.cpu_count() or 1)  # Hashing processes per worker, 0 hashes inline
+PASSWORD_HASHING_MAX_QUEUE = 16  # Hashes allowed to wait before requests are rejected with 503
+PASSWORD_HASHING_TIMEOUT = 10.0  # Seconds to wait for a hash
+PASSWORD_HASHING_START_METHOD = 'forkserver'  # Worker processes start from a clean server, not a fork of a threaded worker
+
+# Profile snapshots in access tokens
+# Snapshots are only trusted against a user version cached where every worker sees it,
+# so with the local-memory cache above requests always load the user from the database.
+# Configure a shared cache (Redis, or TieredCache in front of it) to enable the fast path.
+USER_SNAPSHOT_AUTH = None  # None: only with a shared default cache, True/False to force
+USER_VERSION_TTL = 24 * 3600  # Seconds a user's version stays cached for snapshot checks
+
+# Request and stage timing metrics
+METRICS_ENABLED = True  # Time requests and their db/cache/hash/jwt/sms stages
+METRICS_SERVER_TIMING = True  # Return the stage timings in the Server-Timing header
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token required by /metrics when set
+
+# OTP state, one record per phone holding the code, wrong attempts and block
+OTP_STORE = 'account.otp_store.CacheOtpStore'  # Use account.otp_store.RedisOtpStore with several workers
+OTP_STORE_OPTIONS = {}  # e.g. {'step': 60, 'valid_steps': 5} for account.otp_store.TotpOtpStore
+OTP_MAX_ATTEMPTS = 3  # Wrong codes before the phone is blocked
+OTP_BLOCK_TTL = 3600  # Seconds a phone stays blocked
+OTP_VERIFIED_TTL = 600  # Seconds the verified flag is kept
+OTP_RESEND_COOLDOWN = 60  # Seconds a sent code is reused by check-phone instead of sending a new one
+PROFILE_CACHE_TTL = 3600  # Seconds a rendered profile body stays cached
+
+# Outstanding JWT tokens
+TOKEN_OUTSTANDING_BUFFER = False  # Write outstanding-token rows in batches from a background thread
+TOKEN_OUTSTANDING_BUFFER_SIZE = 500  # Rows per batch INSERT
+TOKEN_OUTSTANDING_FLUSH_INTERVAL = 1.0  # Seconds a row may wait before its batch is written
+TOKEN_PRUNE_INTERVAL = 3600  # Seconds between scheduled prunes of expired tokens, 0 disables them; needs a shared cache
+TOKEN_PRUNE_BATCH_SIZE = 1000  # Tokens deleted per transaction
+TOKEN_PRUNE_PAUSE = 0.05  # Seconds to sleep between prune transactions
+TOKEN_PRUNE_MAX_ROWS = 100000  # Tokens deleted per scheduled prune
+
+# Admission control: per-endpoint concurrency limits and bounded wait queues
+ADMISSION_CONTROL_ENABLED = True  # Shed excess requests with 503 and Retry-After instead of queuing them in the server
+ADMISSION_CAPACITY = 32  # Requests of all groups handled at once per worker process
+ADMISSION_READ_RESERVE = 8  # Slots of the capacity only RESERVED groups (cheap reads) may use
+ADMISSION_QUEUE_TIMEOUT = 2.0  # Seconds a request may wait for a slot
+# Under WSGI a queued request holds a server thread: keep CONCURRENCY + QUEUE of each group below the thread count
+ADMISSION_LIMITS = {
+    'otp': {
+        'ROUTES': ('auth/check-phone/', 'auth/verify/', 'auth/async/check-phone/', 'auth/async/verify/'),
+        'CONCURRENCY': 8,
+        'QUEUE': 8,
+    },
+    'login': {
+        'ROUTES': ('auth/login/', 'auth/register/', 'auth/async/login/', 'auth/async/register/'),
+        'CONCURRENCY': 8,
+        'QUEUE': 8,
+    },
+    'refresh': {
+        'ROUTES': ('auth/refresh/', 'auth/async/refresh/'),
+        'CONCURRENCY': 8,
+        'QUEUE': 8,
+    },
+    'lookup': {
+        'ROUTES': ('auth/lookup-phones/',),
+        'CONCURRENCY': 4,
+        'QUEUE': 4,
+    },
+    'profile': {
+        'ROUTES': ('auth/profile/',),
+        'CONCURRENCY': 16,
+        'QUEUE': 16,
+        'RESERVED': True,  # May use ADMISSION_READ_RESERVE
+        'METHODS': ('GET', 'HEAD'),
+    },
+}
@@ -17,7 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from account.views import export_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('account.urls')),
+    path('auth/async/', include('account.async_urls')),
+    path('metrics', export_metrics),  # Prometheus scrape endpoint
 ]
\ No newline at end of file